@@ -1,15 +1,17 @@
 import streamlit as st
-import io
+import threading
 from pathlib import Path
 #import base64
 
-from PyPDF2 import PdfReader, PdfWriter
-
-from scripts.extract_pages      import extract_pages
-from scripts.insert_pages       import insert_pages
-from scripts.merge_files        import merge_files
-from scripts.rearrange_pages    import rearrange_pages
-from scripts.remove_pages       import remove_pages
+# the modules reading PDF files (and PyPDF2) are imported where they are first
+# used, once a file is uploaded, so a new server process starts without them
+from scripts.actions            import ACTIONS, PREWARM, action_help, load_action, prewarm
+from scripts.governor           import estimate_memory
+from scripts.instrumentation    import INSTRUMENTATION, measure
+from scripts.jobs               import get_job_queue
+from scripts.output_profiles    import OUTPUT_PROFILE, OUTPUT_PROFILES
+from scripts.page_order         import PageOrderSession
+from scripts.page_spec          import PAGE_SPEC_HELP, parse_page_spec, parse_ranges
 
 # ## SET BACKGROUND IMAGE
 
@@ -40,41 +42,26 @@ st.title('PDF Editor - v.1.0')
 st.sidebar.markdown('# Choose an action')
 #st.sidebar.subheader('Select an action from the list below to perform on a pdf file')
 
-PDF_ACTIONS = {
-    "extract": {
-        "label": "Extract",
-        "caption": "extract pages from a pdf file",
-        "icon": "✂️"  # Scissors
-    },
-    "insert": {
-        "label": "Insert",
-        "caption": "insert pages from a pdf file into another one",
-        "icon": "➕"  # Plus sign
-    },
-    "merge": {
-        "label": "Merge",
-        "caption": "concatenate several pdf files into a final, merged pdf file",
-        "icon": "🔗"  # Chain link
-    },
-    "rearrange": {
-        "label": "Rearrange",
-        "caption": "rearrange the pages of a pdf file",
-        "icon": "🔄"  # Arrows/Revolving
-    },
-    "remove": {
-        "label": "Remove",
-        "caption": "remove pages from a pdf file",
-        "icon": "🗑️"  # Trash can
-    }
-}
-
-functions = {
-    'extract' : extract_pages,
-    'insert' : insert_pages,
-    'merge' : merge_files,
-    'rearrange' : rearrange_pages,
-    'remove' : remove_pages
-}
+# The modules of the actions are only imported when an action is run (see
+# scripts.actions); the menu entries and the help of the actions are built
+# once per server process
+@st.cache_resource
+def action_menu():
+    return ([f'{action.label} {action.icon}' for action in ACTIONS.values()],
+            [action.caption for action in ACTIONS.values()])
+
+@st.cache_resource
+def action_help_text(action):
+    return action_help(action)
+
+# Import the PDF stack in the background once per server process, when turned on,
+# so the first operation does not wait for it
+@st.cache_resource
+def start_prewarm():
+    threading.Thread(target = prewarm, name = 'prewarm', daemon = True).start()
+
+if PREWARM == 'on':
+    start_prewarm()
 
 # Initialize session state keys
 for key in ['start_widget_counter',
@@ -85,6 +72,15 @@ for key in ['start_widget_counter',
     if key not in st.session_state.keys():
         st.session_state[key] = 0
 
+# Ids of the jobs started by this session, oldest first
+if 'jobs' not in st.session_state.keys():
+    st.session_state['jobs'] = []
+
+# Timings of the operations of this session, and the uploads whose page count was measured
+if 'reports' not in st.session_state.keys():
+    st.session_state['reports'] = []
+    st.session_state['measured_files'] = set()
+
 # Function to reset widget states
 def reset(rerun:bool = False ):
     st.session_state['uploader_key_counter'] += 1
@@ -116,14 +112,261 @@ def interval_pages_widgets(pdf_file_length):
     return start, end
 
 
+# Function for a page spec, selecting several pages and ranges at once instead of
+# the start and end pages. The selected pages are summarized as they are typed.
+def page_spec_widget(pdf_file_length):
+    page_spec = st.text_input('Or type several pages and ranges', placeholder = '1-3, 7, 10-20, -5',
+                              help = PAGE_SPEC_HELP,
+                              key = f"page_spec_{st.session_state['start_widget_counter']}")
+    if page_spec.strip():
+        try:
+            selected = parse_page_spec(page_spec).ranges(pdf_file_length)
+            st.caption(f'{len(selected)} pages selected: {selected}')
+        except ValueError as e:
+            st.warning(str(e))
+    return page_spec.strip()
+
+
+# Function for the option to write resources shared by several files only once
+def deduplicate_widget():
+    return st.checkbox('Write shared fonts and images only once',
+                       help = 'Makes the output smaller when the files come from the same source '
+                              '(e.g. invoices embedding the same fonts and logos).',
+                       key = 'deduplicate')
+
+
+# Function for the option to save removals and rearrangements as an update of the original file
+def incremental_widget():
+    return st.checkbox('Quick save (append the changes to the original file)',
+                       help = 'Much faster on large files, as the pages are not rewritten. The output '
+                              'file is slightly larger than the original and the *Output file* profile '
+                              'does not apply. Removed pages are only hidden, their content stays in '
+                              'the file: do not use it to strip confidential pages.',
+                       key = 'incremental')
+
+
+# Function for the page order edited by the rearrange moves of an upload, kept
+# until another file is uploaded
+def page_order_session(pdf_file, pdf_file_length):
+    saved = st.session_state.get('page_order')
+    if saved is None or saved[0] != pdf_file.file_id:
+        saved = st.session_state['page_order'] = (pdf_file.file_id, PageOrderSession(pdf_file_length))
+    return saved[1]
+
+
+# Function to turn a function returning a page plan and the output filename
+# into job work, writing the plan with page progress and the output profile
+# chosen in the sidebar
+def plan_job(build_plan, deduplicate = False, incremental = False):
+    profile = st.session_state['output_profile']
+
+    def work(progress):
+        plan, output_filename = build_plan()
+        return plan.write(deduplicate = deduplicate, progress = progress, profile = profile,
+                          incremental = incremental), output_filename
+    return work
+
+# Reports of this session's operations go to this list while timings are shown
+def timings_sink():
+    return st.session_state['reports'] if st.session_state.get('instrumentation') else None
+
+# Function for the page count of an upload, measured the first time it is read
+# while timings are shown
+def count_pages(pdf_file):
+    from scripts.pdf_probe import probe_pdf
+
+    sink = timings_sink()
+    if sink is None or pdf_file.file_id in st.session_state['measured_files']:
+        return probe_pdf(pdf_file).page_count
+
+    st.session_state['measured_files'].add(pdf_file.file_id)
+    with measure('page_count', label = f'Page count - {pdf_file.name}', sink = sink):
+        return probe_pdf(pdf_file).page_count
+
+# Function checking that uploads can be processed within the memory budget of
+# the server, showing an error otherwise
+def upload_fits(*files):
+    governor = get_job_queue().governor
+    cost = estimate_memory(sum(file.size for file in files))
+    if governor.fits(cost):
+        return True
+    st.error(f'The files are too large to be processed on this server: they need about '
+             f'{cost / 2**20:.0f} MB of memory and the limit is {governor.memory_budget / 2**20:.0f} MB. '
+             'Please upload smaller files.')
+    return False
+
+# Panel with the checks of uploaded files, which run in the background. While
+# some files are being checked, it is a fragment rerun every half second; once
+# they are all checked, the app is rerun to show the widgets of the action.
+def preflight_panel(files):
+    from scripts.preflight import get_preflight
+
+    checks = get_preflight().check(files)
+    checking = any(check.status == 'checking' for check in checks)
+
+    @st.fragment(run_every = 0.5 if checking else None)
+    def panel():
+        current = get_preflight().check(files)
+        for check in current:
+            if check.status == 'checking':
+                st.caption(f'⏳ {check.name}: checking the file ...')
+            elif check.status == 'ready':
+                st.caption(f'✅ {check.name}: {check.page_count} pages')
+            elif check.status == 'repaired':
+                st.warning(f'🛠️ {check.name}: {check.page_count} pages. {check.message}')
+            else:
+                st.error(f'❌ {check.name}: {check.message}')
+
+        if checking and not any(check.status == 'checking' for check in current):
+            st.rerun()
+
+    panel()
+    return checks
+
+# Panel with the jobs of this session. While some of them are active, it is a
+# fragment rerun every half second to update their progress.
+def jobs_panel():
+    queue = get_job_queue()
+    jobs = [queue.get(job_id) for job_id in st.session_state['jobs']]
+    jobs = [job for job in jobs if job is not None]
+    active = any(job.active for job in jobs)
+
+    @st.fragment(run_every = 0.5 if active else None)
+    def panel():
+        for job in jobs:
+            st.markdown(f'**{job.label}**')
+
+            if job.active:
+                if job.status == 'queued':
+                    position = job.position
+                    text = (f'Waiting in line: {position - 1} operation(s) ahead of this one ...'
+                            if position > 1 else 'Waiting for memory or a free worker ...')
+                elif job.pages_total is None:
+                    text = 'Reading the files ...'
+                elif job.pages_done < job.pages_total:
+                    text = f'Copying pages: {job.pages_done} of {job.pages_total}'
+                else:
+                    text = 'Writing the file ...'
+                st.progress(job.fraction, text = text)
+                if st.button('Cancel', key = f'cancel_{job.id}'):
+                    job.cancel()
+                continue
+
+            if job.status == 'done':
+                from scripts.output_writer import download_data
+                output_buffer, output_filename = job.result
+                mime = 'application/zip' if output_filename.endswith('.zip') else 'application/pdf'
+                data = download_data(output_buffer, timings_sink(), label = f'Download - {output_filename}')
+                st.download_button("Download processed file", data, output_filename,
+                                   mime, key = f'download_{job.id}')
+                st.success('File processed successfully! It is now ready for download.')
+            elif job.status == 'failed':
+                st.error(f'An unexpected error occurred: {job.error}')
+            else:
+                st.info('Operation canceled.')
+
+            if st.button('Dismiss', key = f'dismiss_{job.id}'):
+                queue.remove(job.id)
+                st.session_state['jobs'].remove(job.id)
+                st.rerun()
+
+        # once every job is finished, rerun the app to stop polling
+        if active and not any(job.active for job in jobs):
+            st.rerun()
+
+    panel()
+
+
+# Panel with the timings of the operations of this session, latest first, and
+# their export as JSON lines
+def timings_panel():
+    reports = st.session_state['reports']
+    if timings_sink() is None or not reports:
+        return
+
+    with st.expander('⏱️ Timings'):
+        rows = []
+        for report in reversed(reports):
+            rows.append({'Operation': report.label or report.operation,
+                         'Status': report.status,
+                         'Total (s)': round(report.seconds, 3),
+                         'Phases (s)': ', '.join(f'{name} {seconds:.3f}' for name, seconds in report.phases.items()),
+                         'Bytes in': report.counts['bytes_in'],
+                         'Bytes out': report.counts['bytes_out'],
+                         'Pages in': report.counts['pages_in'],
+                         'Pages out': report.counts['pages_out'],
+                         'Peak memory (MB)': None if report.peak_memory is None
+                                             else round(report.peak_memory / 2**20, 1)})
+        st.dataframe(rows, hide_index = True)
+        st.download_button('Export as JSON lines', '\n'.join(report.to_json() for report in reports) + '\n',
+                           'pdf_editor_timings.jsonl', 'application/jsonl')
+
+
+# Number of page thumbnails shown at once, and per row
+PREVIEW_PAGES = 12
+PREVIEW_COLUMNS = 4
+
+# Grid of page thumbnails. While some of them are still being rendered in the
+# background, the grid is a fragment rerun every half second to pick them up.
+def thumbnail_grid(pdf_file, first, last):
+    from scripts.thumbnails import get_renderer
+
+    rendering = None in get_renderer().request(pdf_file, range(first, last)).values()
+
+    @st.fragment(run_every = 0.5 if rendering else None)
+    def grid():
+        thumbnails = get_renderer().request(pdf_file, range(first, last))
+
+        columns = st.columns(PREVIEW_COLUMNS)
+        for position, page_index in enumerate(range(first, last)):
+            with columns[position % PREVIEW_COLUMNS]:
+                thumbnail = thumbnails.get(page_index, False)
+                if thumbnail:
+                    st.image(str(thumbnail), caption = f'Page {page_index + 1}')
+                elif thumbnail is None:
+                    st.caption(f'Page {page_index + 1}: rendering...')
+                else:
+                    st.caption(f'Page {page_index + 1}: no preview available')
+
+        # once every thumbnail is there, rerun the app to stop polling
+        if rendering and None not in thumbnails.values():
+            st.rerun()
+
+    grid()
+
+# Function to preview the pages of a file, only rendering the ones on screen
+def page_previews(pdf_file, pdf_file_length, key):
+    from scripts.thumbnails import thumbnails_available
+
+    if not thumbnails_available() or not st.toggle('Show page previews', key = f'previews_{key}'):
+        return
+
+    first = st.selectbox('Pages', options = range(0, pdf_file_length, PREVIEW_PAGES),
+                         format_func = lambda i: f'{i + 1} - {min(i + PREVIEW_PAGES, pdf_file_length)}',
+                         key = f'preview_first_{key}')
+    thumbnail_grid(pdf_file, first, min(first + PREVIEW_PAGES, pdf_file_length))
+
+
 # SIDEBAR MENU
 pdf_action = st.sidebar.radio(label = "",
-        options = [f"{action['label']} {action['icon']}" for action in PDF_ACTIONS.values()],
-        captions = [action['caption'] for action in PDF_ACTIONS.values()],
+        options = action_menu()[0],
+        captions = action_menu()[1],
         key = 'action_active',
         on_change = reset
 )
 
+# Output profile: how much effort goes into making the output file small
+st.sidebar.selectbox('Output file', options = list(OUTPUT_PROFILES),
+                     index = list(OUTPUT_PROFILES).index(OUTPUT_PROFILE),
+                     format_func = str.capitalize, key = 'output_profile',
+                     help = '\n\n'.join(f'**{profile.capitalize()}:** {description}'
+                                         for profile, description in OUTPUT_PROFILES.items()))
+
+# Timings: opt-in measurements of the operations of this session
+st.sidebar.toggle('Show timings', value = INSTRUMENTATION != 'off', key = 'instrumentation',
+                  help = 'Time the phases (parse, page copy, write, download) of the operations, '
+                         'with the bytes and pages read and written, and export them as JSON lines.')
+
 # Function for single file upload widget
 def upload_single_file():
     return st.file_uploader("Select PDF file...", type=['pdf'],
@@ -132,44 +375,22 @@ def upload_single_file():
 ## Generate and Display Action Description
 if pdf_action:
     action = pdf_action[:-2].split(' ')[0].lower()
-    # get the function corresponding to the selected action
-    function = functions[action]
-    action_description = PDF_ACTIONS[action]['caption'].capitalize()
+    action_description = ACTIONS[action].caption.capitalize()
     st.header(action_description)
 
     # Show the action description toggle
     if st.toggle('Show help about this action'):
-        if action == 'insert':
-            insert_action_docstring = """
-            This action inserts pages from one or more PDF files into a main PDF file.
-
-            This action allows you to take pages from other PDF documents and add them
-            to a primary document. First, upload your main PDF. Then, upload one or
-            more additional PDFs that contain the pages you want to insert.
-
-            For each additional file, you can specify the exact position in the main
-            file where the new pages should be placed (e.g., 'before' page 5). You can
-            also select a specific page range from the additional file to insert. 
-            By default, all pages from the additional file will be inserted.
-            """
-            st.write(insert_action_docstring)
-        else:
-            function_docstring_lines = function.__doc__.split('\n')
-            function_docstring = ''
-            for line in function_docstring_lines:
-                line = line.strip()
-                if not line.startswith('Args:'):
-                    function_docstring += f'{line}\n'
-                else:
-                    function_docstring = function_docstring.strip()
-                    break
-            st.write(function_docstring)
+        st.write(action_help_text(action))
 
     action_button_clicked = False
 
 ## Display Widgets Based on Selected Action
 if pdf_action:
 
+    # whether the uploaded files can be processed within the memory budget
+    # (and, for several files, passed their checks)
+    files_ready = False
+
     # --- UI Rendering Block ---
 
     ## EXTRACT, REMOVE AND REARRANGE UI
@@ -179,8 +400,12 @@ if pdf_action:
         uploaded_file = upload_single_file()
 
         # Get the number of pages in the uploaded PDF
-        if uploaded_file:
-            pdf_file_length = len(PdfReader(uploaded_file).pages)
+        if uploaded_file and upload_fits(uploaded_file):
+            files_ready = True
+            pdf_file_length = count_pages(uploaded_file)
+
+            # Thumbnails of the pages, to pick the page numbers below
+            page_previews(uploaded_file, pdf_file_length, key = 'single')
         
             # Header for page interval selection
             if action != 'extract':
@@ -190,6 +415,9 @@ if pdf_action:
 
             start, end = interval_pages_widgets(pdf_file_length)
 
+            # Extract and remove also take several pages and ranges at once
+            page_spec = action != 'rearrange' and page_spec_widget(pdf_file_length)
+
             # show warning if lower limit of interval is greater than upper limit
             if start > end:
                 st.warning("The 'End page' must be greater than or equal to the 'Start page'.")
@@ -229,6 +457,26 @@ if pdf_action:
                         st.warning("These parameters do not alter the page order.\
                                    The PDF file will not be processed.")
 
+                ## Several moves in a row, with undo and redo
+                # Moves only change the page order kept in the session; the file
+                # is written once, in the final order, by the action button.
+                session = page_order_session(uploaded_file, pdf_file_length)
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.button('Apply move', on_click = session.move, args = (start, end, relative_pos, new_pos),
+                              disabled = no_pages_order_change or start > end,
+                              help = 'Apply this move and choose another one before processing the file.')
+                with col2:
+                    st.button('Undo', on_click = session.undo, disabled = not session.can_undo)
+                with col3:
+                    st.button('Redo', on_click = session.redo, disabled = not session.can_redo)
+                if session.moves:
+                    st.caption(f'New page order after {session.moves} move(s): {session}. '
+                               'The pages of the next move are numbered in this order.')
+
+            # Remove and rearrange only change the page tree, which can be appended to the original file
+            incremental = action != 'extract' and incremental_widget()
+
     ## INSERT UI
     elif action == 'insert':
 
@@ -242,12 +490,21 @@ if pdf_action:
                             key = f"multi_uploader_key_{st.session_state['multi_uploader_key_counter']}",
                             accept_multiple_files = True)
 
-        # Once the main file and at least one additional file are uploaded,
+        # The files are checked and parsed in the background as soon as they are uploaded
+        checks = []
+        if main_file and additional_files and upload_fits(main_file, *additional_files):
+            checks = preflight_panel([main_file, *additional_files])
+
+        # Once the main file and at least one additional file are uploaded and checked,
         # proceed to set the parameters for insertion.
-        if main_file and additional_files:
+        if checks and all(check.usable for check in checks):
+            files_ready = True
 
             # Get the length of the source file
-            source_length = len(PdfReader(main_file).pages)
+            source_length = checks[0].page_count
+
+            # Thumbnails of the main file, to pick the insert positions below
+            page_previews(main_file, source_length, key = 'main')
 
             # For each insertion file, check if start_page <= end_page.
             # Store the result of each check in a list.
@@ -266,7 +523,7 @@ if pdf_action:
                 st.markdown(f"**File to be inserted:** {add_file.name[:-4]}")
 
                 # Get length of the file to be inserted
-                add_file_length = len(PdfReader(add_file).pages)
+                add_file_length = checks[index + 1].page_count
 
                 # Show relative position and insertion page widgets
                 col1, col2 = st.columns(2)
@@ -303,6 +560,8 @@ if pdf_action:
                 else:
                     interval_check_list.append(True)
 
+            deduplicate = deduplicate_widget()
+
     ## MERGE UI
     elif action == 'merge':
         st.subheader("Upload files to merge ...")
@@ -311,6 +570,38 @@ if pdf_action:
                                           accept_multiple_files=True)
         if files_to_merge and len(files_to_merge) < 2:
             st.warning("Please upload at least two files to merge.")
+        elif files_to_merge and upload_fits(*files_to_merge):
+            # The files are checked and parsed in the background as soon as they are uploaded
+            if all(check.usable for check in preflight_panel(files_to_merge)):
+                files_ready = True
+                deduplicate = deduplicate_widget()
+
+    ## SPLIT UI
+    elif action == 'split':
+        # Upload a single file
+        uploaded_file = upload_single_file()
+
+        if uploaded_file and upload_fits(uploaded_file):
+            files_ready = True
+            pdf_file_length = count_pages(uploaded_file)
+
+            # Thumbnails of the pages, to find where to cut the file
+            page_previews(uploaded_file, pdf_file_length, key = 'single')
+
+            st.subheader('Choose where to split the file.')
+            split_rule = st.radio('Split', ('Every N pages', 'Page ranges', 'Bookmarks'), horizontal = True,
+                                  key = 'split_rule')
+
+            if split_rule == 'Every N pages':
+                pages_per_part = st.number_input(label = 'Pages per file', min_value = 1,
+                                                 max_value = pdf_file_length, step = 1, value = 1)
+                st.caption(f'{-(-pdf_file_length // pages_per_part)} files will be created.')
+            elif split_rule == 'Page ranges':
+                ranges_text = st.text_input('Page ranges', placeholder = '1-3, 4-10, 11',
+                                            help = 'One file is created for each page or range of pages, '
+                                                   'separated by commas. Ranges may overlap.')
+            else:
+                st.caption('A new file starts at each top-level bookmark of the file.')
 
     ## BUTTONS FOR RESET OR PROCESS ACTION
     col1, col2, col3 = st.columns([1, 1, 2])
@@ -322,79 +613,149 @@ if pdf_action:
             if st.button('Reset interval pages'):
                 reset_start_end()
     with col3:
-        # Show the action button only if the necessary files have been uploaded.
-        if (action != 'insert' and 'uploaded_file' in locals() and uploaded_file) or \
+        # Show the action button only if the necessary files have been uploaded
+        # and fit in the memory budget of the server.
+        if files_ready and ((action != 'insert' and 'uploaded_file' in locals() and uploaded_file) or \
            (action == 'insert' and 'main_file' in locals() and main_file and additional_files) or \
-           (action == 'merge' and 'files_to_merge' in locals() and files_to_merge and len(files_to_merge) >= 2):
+           (action == 'merge' and 'files_to_merge' in locals() and files_to_merge and len(files_to_merge) >= 2)):
             button_label = f"{action.capitalize()} pages"
             action_button_clicked = st.button(button_label)
 
     ## Process the action when the button is clicked
+    # The work runs in the job queue, off the script thread: the widgets stay
+    # usable and the jobs panel below shows its progress.
     if action_button_clicked:
         try:
-            
-            # initialize buffer and filename output variables
-            output_buffer, output_filename = None, None
 
-            # check interval pages
+            # the function of the action, imported the first time it is run
+            function = load_action(action)
+            from scripts.document_cache import upload_view
+            from scripts.result_cache   import cached_work
+
+            # the job reads its own copies of the uploads: the uploaded files are also
+            # read by this script and by the jobs of other sessions, and reading them
+            # from several threads would mix up their stream positions
+            if action == 'insert':
+                main_file = upload_view(main_file)
+                additional_files = [upload_view(ins_file) for ins_file in additional_files]
+            elif action == 'merge':
+                files_to_merge = [upload_view(merge_file) for merge_file in files_to_merge]
+            else:
+                uploaded_file = upload_view(uploaded_file)
+
+            # the job building and writing the output plan, if the parameters are valid,
+            # and everything else its output depends on, to find it in the result cache
+            work = None
+            cache_params = {}
+
             # Check page intervals
             if action in ['extract', 'remove']:
-                if end >= start:
-                    output_buffer, output_filename = function(uploaded_file, start, end)
+                if page_spec:
+                    work = plan_job(lambda: function(uploaded_file, spec=page_spec, as_plan=True),
+                                    incremental = incremental)
+                    cache_params = {'spec': page_spec, 'incremental': incremental}
+                elif end >= start:
+                    work = plan_job(lambda: function(uploaded_file, start, end, as_plan=True),
+                                    incremental = incremental)
+                    cache_params = {'start': start, 'end': end, 'incremental': incremental}
                 else:
                     st.error('Error: End page must be greater than or equal to start page.')
             
             # Check page intervals
             elif action == 'rearrange':
-                if end >= start:
+                # the order left by the moves applied, copied as it is now
+                if session.moves:
+                    order = session.order[:]
+                    work = plan_job(lambda: function(uploaded_file, order = order, as_plan = True),
+                                    incremental = incremental)
+                    cache_params = {'order': str(session), 'incremental': incremental}
+
+                elif end >= start:
 
                     # Proceed only if the operation actually changes the PDF page order.
                     if not no_pages_order_change:
-                        output_buffer, output_filename = function(uploaded_file, start, end, relative_pos, new_pos)
+                        work = plan_job(lambda: function(uploaded_file, start, end, relative_pos, new_pos,
+                                                         as_plan=True),
+                                        incremental = incremental)
+                        cache_params = {'start': start, 'end': end, 'relative_pos': relative_pos,
+                                        'new_pos': new_pos, 'incremental': incremental}
 
                     # Do not process if the parameters result in no change.
                     elif no_pages_order_change:
                         st.warning('Action canceled. The current parameters do not alter the page order.')
                 else:
                     st.error('Error: End page must be greater than or equal to start page.')
-            
+
             elif action == 'insert':
                 if all(interval_check_list):
-                    # Start with a list of all pages from the source file
-                    final_pages = list(PdfReader(main_file).pages)
-
+                    # Read the parameters of each insertion now: the job cannot access the session state
+                    insertions = []
                     for index, ins_file in enumerate(additional_files):
-                        current_relative_pos = st.session_state[f'relative_pos_{index}']
-                        current_insert_pos = st.session_state[f'insert_pos_{index}']
                         counter = st.session_state.insert_widget_counters[index]
-                        current_start = st.session_state[f'start_key_{index}_{counter}']
-                        current_end = st.session_state[f'end_key_{index}_{counter}']
-                        
-                        # Get the list of pages to insert
-                        pages_to_insert = function(ins_file, current_start, current_end)
-                        
-                        # Calculate insertion position and insert the block
-                        insertion_point = current_insert_pos - 1 if current_relative_pos == 'before' else current_insert_pos
-                        final_pages[insertion_point : insertion_point] = pages_to_insert
-
-                    # Now, create the writer and add the final ordered pages
-                    writer = PdfWriter()
-                    for page in final_pages:
-                        writer.add_page(page)
-                    output_buffer = io.BytesIO()
-                    writer.write(output_buffer)
-                    output_filename = f"{Path(main_file.name).stem}_expanded.pdf"
+                        insertions.append((ins_file,
+                                           st.session_state[f'start_key_{index}_{counter}'],
+                                           st.session_state[f'end_key_{index}_{counter}'],
+                                           st.session_state[f'relative_pos_{index}'],
+                                           st.session_state[f'insert_pos_{index}']))
+
+                    # Place all the insertions in one pass, then write the final ordered pages once
+                    work = plan_job(lambda: function(main_file, insertions, as_plan=True), deduplicate)
+                    cache_params = {'insertions': [insertion[1:] for insertion in insertions],
+                                    'deduplicate': deduplicate}
                 else:
                     st.error("Action canceled. Please ensure the 'End page' is greater than or equal to the 'Start page' for all additional files.")
 
             elif action == 'merge':
                 if files_to_merge and len(files_to_merge) >= 2:
-                    output_buffer, output_filename = function(files_to_merge)
+                    work = plan_job(lambda: function(files_to_merge, as_plan=True), deduplicate)
+                    cache_params = {'deduplicate': deduplicate}
+
+            elif action == 'split':
+                if split_rule == 'Every N pages':
+                    split_options = {'every': pages_per_part}
+                elif split_rule == 'Page ranges':
+                    split_options = {'ranges': parse_ranges(ranges_text)}
+                else:
+                    split_options = {'bookmarks': True}
 
-            # --- Unified Download Button ---
-            if output_buffer and output_filename:
-                st.download_button("Download processed file", output_buffer.getvalue(), output_filename, "application/pdf")
-                st.success('File processed successfully! It is now ready for download.')
+                if split_options.get('ranges') == []:
+                    st.error('Error: enter at least one page range.')
+                else:
+                    profile = st.session_state['output_profile']
+
+                    # The parts are written into a ZIP archive, with the progress of the pages written
+                    def work(progress):
+                        # loaded with the split action, the first time it is run
+                        from scripts.split_pages import write_parts
+                        parts, output_filename = function(uploaded_file, **split_options, as_plan=True)
+                        return write_parts(parts, progress = progress, profile = profile), output_filename
+                    # the files in the archive are named after the upload
+                    cache_params = {**split_options, 'name': uploaded_file.name}
+
+            if work:
+                if action == 'merge':
+                    input_name = f'{len(files_to_merge)} files'
+                    input_files = files_to_merge
+                elif action == 'insert':
+                    input_name = main_file.name
+                    input_files = [main_file, *additional_files]
+                else:
+                    input_name = uploaded_file.name
+                    input_files = [uploaded_file]
+
+                # the same operation on the same files reuses the output of any session
+                work = cached_work(work, action, input_files, profile = st.session_state['output_profile'],
+                                   **cache_params)
+                job = get_job_queue().submit(work, label = f'{ACTIONS[action].label} - {input_name}',
+                                             operation = action, sink = timings_sink(),
+                                             input_bytes = sum(file.size for file in input_files))
+                st.session_state['jobs'].append(job.id)
 
         except Exception as e:
             st.error(f'An unexpected error occurred: {e}')
+
+    ## Jobs of this session, with their progress and download buttons
+    jobs_panel()
+
+    ## Timings of the operations, when turned on in the sidebar
+    timings_panel()
@@ -0,0 +1,63 @@
+"""
+Size and time of each output profile on the synthetic corpus.
+
+Removes the first page of the first file of every corpus case (merges the
+files of multi-file cases) and writes the result with each output profile.
+Reports the write time, the output size and the time to write and download
+the output over a few link speeds, to pick the profile that suits them.
+Single-file cases are also written as an incremental update of the source.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_output_profiles --links 2 10 50
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import CORPUS, named_buffer, synthetic_pdf
+from scripts.output_profiles import OUTPUT_PROFILES
+from scripts.page_plan import PagePlan
+
+
+def case_plan(case: str) -> PagePlan:
+    files = [named_buffer(synthetic_pdf(**arguments), f'{case}_{number:03d}.pdf')
+             for number, arguments in enumerate(CORPUS[case])]
+    if len(files) > 1:
+        return PagePlan.from_files(files)
+    return PagePlan.from_file(files[0]).remove(1, 1)
+
+
+def run(cases, links, repeat):
+    print(f"{'case':>17} {'profile':>11} {'write':>9} {'size':>13}"
+          + ''.join(f'{f"@{speed} Mbit/s":>14}' for speed in links))
+
+    for case in cases:
+        plan = case_plan(case)
+        # parse the sources before timing, as the app does when the file is uploaded
+        plan.write()
+
+        modes = [(profile, {'profile': profile}) for profile in OUTPUT_PROFILES]
+        if len(plan.sources) == 1:
+            modes.append(('incremental', {'incremental': True}))
+
+        for profile, options in modes:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                size = plan.write(**options).seek(0, 2)
+                timings.append(time.perf_counter() - started)
+            write_seconds = min(timings)
+
+            totals = ''.join(f'{write_seconds + size * 8 / (speed * 1e6):>13.2f}s' for speed in links)
+            print(f'{case:>17} {profile:>11} {write_seconds:>8.3f}s {size:>13,}{totals}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--cases', nargs='+', choices=list(CORPUS), default=list(CORPUS))
+    parser.add_argument('--links', type=float, nargs='+', default=[2, 10, 50],
+                        help='link speeds in Mbit/s for the write + download time')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs per measurement, the best one is reported')
+    arguments = parser.parse_args()
+    run(arguments.cases, arguments.links, arguments.repeat)
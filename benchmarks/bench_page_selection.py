@@ -0,0 +1,124 @@
+"""
+Scaling of page selection and page copy in `remove_pages` and `rearrange_pages`.
+
+Compares the former per-page selection (`i not in range(...)` filters and one
+`writer.add_page` per page written to a `BytesIO`) with the slice-based page
+plans and the bulk `add_pages` path, on synthetic documents of growing size.
+The 'spec' case removes ten ranges, one after another the former way and in a
+single pass with a page spec. The 'insert' case inserts ten blocks of pages,
+one slice assignment each the former way and in a single pass with `insert_many`.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_page_selection --pages 1000 2500 5000 10000
+"""
+import argparse
+import io
+import time
+
+from PyPDF2 import PdfWriter
+
+from benchmarks.synthetic import named_buffer, synthetic_pdf
+from scripts.document_cache import get_document
+from scripts.page_plan import PagePlan
+
+
+## Former implementations, kept here as the reference
+
+def legacy_remove_selection(pages, start, end):
+    start, end = start - 1, end - 1
+    return [pages[i] for i in range(len(pages)) if i not in range(start, end + 1)]
+
+
+def legacy_rearrange_selection(pages, start, end, relative_pos, new_pos):
+    moving_block = pages[start - 1 : end]
+    stationary_pages = [p for i, p in enumerate(pages) if i not in range(start - 1, end)]
+    pages_to_discount = len([p for p in range(start - 1, end) if p < new_pos - 1])
+    final_pos = (new_pos - 1) - pages_to_discount
+    if relative_pos == 'after':
+        final_pos += 1
+    stationary_pages[final_pos:final_pos] = moving_block
+    return stationary_pages
+
+
+def legacy_remove_ranges(pages, ranges):
+    # from the last range to the first, so the page numbers of the others do not move
+    for start, end in reversed(ranges):
+        pages = legacy_remove_selection(pages, start, end)
+    return pages
+
+
+def legacy_insert_blocks(pages, block, positions):
+    pages = list(pages)
+    # from the last position to the first, so the positions of the others do not move
+    for position in sorted(positions, reverse=True):
+        pages[position:position] = block
+    return pages
+
+
+def legacy_write(pages):
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(page)
+    output_buffer = io.BytesIO()
+    writer.write(output_buffer)
+    return output_buffer
+
+
+## Benchmark
+
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run(page_counts, repeat):
+    print(f"{'pages':>7} {'operation':>10} {'select old':>11} {'select new':>11} "
+          f"{'write old':>10} {'write new':>10}")
+
+    for page_count in page_counts:
+        file = named_buffer(synthetic_pdf(page_count), f'synthetic_{page_count}.pdf')
+        document = get_document(file)
+        pages = list(document.reader.pages)
+        plan = PagePlan.from_file(file)
+
+        # remove a block from the first third, move a block from the end near the start
+        start, end = page_count // 3, page_count // 3 + page_count // 10
+        cases = {
+            'remove': (legacy_remove_selection, (start, end), plan.remove(start, end)),
+            'rearrange': (legacy_rearrange_selection, (page_count - 50, page_count, 'before', 2),
+                          plan.rearrange(page_count - 50, page_count, 'before', 2)),
+        }
+
+        # ten ranges of 5 pages spread over the document
+        ranges = [(first, first + 4) for first in range(1, page_count - 4, page_count // 10)][:10]
+        spec = ','.join(f'{first}-{last}' for first, last in ranges)
+        cases['spec'] = (legacy_remove_ranges, (ranges,), plan.drop(spec))
+
+        # the first 5 pages inserted after ten pages spread over the document
+        positions = [first + 4 for first, _ in ranges]
+        cases['insert'] = (legacy_insert_blocks, (pages[:5], positions),
+                           plan.insert_many([(plan.extract(1, 5), 'after', position) for position in positions]))
+
+        for name, (legacy_selection, args, new_plan) in cases.items():
+            select_old = best_time(lambda: legacy_selection(document.reader.pages, *args), repeat)
+            select_new = best_time(new_plan.resolve, repeat)
+            selected = legacy_selection(pages, *args)
+            write_old = best_time(lambda: legacy_write(selected), repeat)
+            write_new = best_time(new_plan.write, repeat)
+            print(f'{page_count:>7} {name:>10} {select_old:>10.4f}s {select_new:>10.4f}s '
+                  f'{write_old:>9.3f}s {write_new:>9.3f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[1000, 2500, 5000, 10000],
+                        help='page counts of the synthetic documents')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs per measurement, the best one is reported')
+    arguments = parser.parse_args()
+    run(arguments.pages, arguments.repeat)
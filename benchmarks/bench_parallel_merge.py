@@ -0,0 +1,60 @@
+"""
+Sequential and parallel parsing of the files of a merge.
+
+Merges many synthetic files parsing them one by one, in a thread pool and in
+a process pool, checks that the three outputs are byte-identical and reports
+the best wall time of each mode. The document cache is emptied before every
+run, so each one parses the files from scratch.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_parallel_merge --files 200 --pages 10 --workers 4
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import named_buffer, synthetic_pdf
+from scripts import document_cache
+from scripts.merge_files import merge_files
+
+
+def cold_merge(files, max_workers, use_processes):
+    document_cache.get_cache().clear()
+    document_cache._hash_memo.clear()
+
+    started = time.perf_counter()
+    output_buffer, _ = merge_files(files, max_workers=max_workers, use_processes=use_processes)
+    return time.perf_counter() - started, output_buffer.read()
+
+
+def run(file_count, page_count, workers, repeat):
+    # files exported by the same application: same font, different text
+    files = [named_buffer(synthetic_pdf(page_count, content_size=2000, font_size=50 * 1024, serial=number),
+                          f'synthetic_{number:03d}.pdf')
+             for number in range(file_count)]
+
+    modes = {'sequential': (1, False), 'threads': (workers, False), 'processes': (workers, True)}
+    outputs = {}
+
+    print(f'{file_count} files of {page_count} pages, {workers} workers')
+    for mode, (max_workers, use_processes) in modes.items():
+        timings = []
+        for _ in range(repeat):
+            seconds, outputs[mode] = cold_merge(files, max_workers, use_processes)
+            timings.append(seconds)
+        print(f'{mode:>11} {min(timings):>8.3f}s')
+
+    identical = len(set(outputs.values())) == 1
+    print(f"outputs {'identical' if identical else 'DIFFERENT'} ({len(outputs['sequential']):,} bytes)")
+    return identical
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--files', type=int, default=200, help='number of files merged')
+    parser.add_argument('--pages', type=int, default=10, help='pages of each file')
+    parser.add_argument('--workers', type=int, default=4, help='threads or processes of the parallel modes')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs per measurement, the best one is reported')
+    arguments = parser.parse_args()
+    raise SystemExit(0 if run(arguments.files, arguments.pages, arguments.workers, arguments.repeat) else 1)
@@ -0,0 +1,112 @@
+"""
+Import time of the app and time of its first operation.
+
+Each measurement runs in a fresh Python process with Streamlit already
+imported, as in a new server process:
+
+- the modules the app imports at start, and the same plus the modules of
+  every action, as the app used to import them;
+- the slowest of those modules, from `python -X importtime`;
+- the first operation of the process (extracting pages of a synthetic file),
+  cold and after `scripts.actions.prewarm`.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_startup --repeat 5
+"""
+import argparse
+import ast
+import subprocess
+import sys
+from pathlib import Path
+
+from scripts.actions import ACTIONS
+
+REPOSITORY_ROOT = Path(__file__).resolve().parent.parent
+
+# Code timing the import of the modules given as arguments
+_IMPORT = """
+import importlib, sys, time
+import streamlit
+started = time.perf_counter()
+for module in sys.argv[1:]:
+    importlib.import_module(module)
+print(time.perf_counter() - started)
+"""
+
+# Code timing the first extraction of a process, after the prewarm if asked
+_FIRST_OPERATION = """
+import sys, time
+from benchmarks.synthetic import named_buffer, synthetic_pdf
+from scripts.actions import load_action, prewarm
+if sys.argv[1] == 'prewarm':
+    prewarm()
+document = named_buffer(synthetic_pdf(50, content_size=2000), 'synthetic.pdf')
+started = time.perf_counter()
+output_buffer, _ = load_action('extract')(document, 1, 25)
+print(time.perf_counter() - started)
+"""
+
+
+def app_modules() -> list:
+    """Return the modules of the repository imported at the top of app.py."""
+    tree = ast.parse((REPOSITORY_ROOT / 'app.py').read_text(encoding='utf-8'))
+    return [node.module for node in tree.body
+            if isinstance(node, ast.ImportFrom) and node.module.startswith('scripts.')]
+
+
+def best_time(code: str, arguments: list, repeat: int) -> float:
+    """Run `code` in `repeat` fresh processes and return the shortest time it printed."""
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', code, *arguments], cwd=REPOSITORY_ROOT,
+                                capture_output=True, text=True, check=True)
+        timings.append(float(result.stdout.split()[-1]))
+    return min(timings)
+
+
+def slowest_imports(modules: list, count: int) -> list:
+    """
+    Return the `count` modules with the longest cumulative import time, in
+    seconds, among the ones `modules` import on top of Streamlit.
+    """
+    code = 'import importlib, sys, streamlit; [importlib.import_module(module) for module in sys.argv[1:]]'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code, *modules],
+                            cwd=REPOSITORY_ROOT, capture_output=True, text=True, check=True)
+    timings = []
+    # modules imported by Streamlit come first
+    lines = result.stderr.splitlines()
+    last_streamlit = max(index for index, line in enumerate(lines) if line.endswith('| streamlit'))
+    for line in lines[last_streamlit + 1:]:
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        timings.append((int(cumulative) / 1e6, module.rstrip()))
+    return sorted(timings, reverse=True)[:count]
+
+
+def run(repeat, top):
+    lazy = app_modules()
+    eager = lazy + [action.module for action in ACTIONS.values()]
+
+    print('import time of the app modules')
+    print(f'{"lazy (at start)":>24} {best_time(_IMPORT, lazy, repeat) * 1000:>8.1f} ms')
+    print(f'{"eager (every action)":>24} {best_time(_IMPORT, eager, repeat) * 1000:>8.1f} ms')
+
+    print('\nslowest imports at start, besides Streamlit (cumulative)')
+    for seconds, module in slowest_imports(lazy, top):
+        print(f'{seconds * 1000:>8.1f} ms  {module}')
+
+    print('\nfirst operation of the process (extract 25 of 50 pages)')
+    for mode in ('cold', 'prewarm'):
+        print(f'{mode:>24} {best_time(_FIRST_OPERATION, [mode], repeat) * 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of processes per measurement, the best one is reported')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports listed')
+    arguments = parser.parse_args()
+    run(arguments.repeat, arguments.top)
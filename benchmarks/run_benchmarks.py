@@ -0,0 +1,207 @@
+"""
+Benchmark suite for the page actions on a synthetic PDF corpus.
+
+Every operation of every corpus case runs in a fresh Python process, so the
+document cache starts cold (as on the first click on an upload) and the peak
+resident memory belongs to that operation alone. Wall time, peak RSS and output
+size are printed and saved as JSON, so the results of two commits can be compared.
+
+Run from the root of the repository:
+
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --output new.json --compare results.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+import PyPDF2
+
+from benchmarks.synthetic import CORPUS, build_corpus
+from scripts.extract_pages import extract_pages
+from scripts.insert_pages import insert_pages
+from scripts.merge_files import merge_files
+from scripts.pdf_probe import probe_pdf
+from scripts.rearrange_pages import rearrange_pages
+from scripts.remove_pages import remove_pages
+from scripts.split_pages import split_pages
+
+# Operations measured for each case; 'page_count' is the app's page-count probe
+OPERATIONS = ['page_count', 'extract', 'remove', 'rearrange', 'insert', 'merge', 'merge_dedup', 'split']
+
+REPOSITORY_ROOT = Path(__file__).resolve().parent.parent
+
+
+## Operations, run in the worker process
+
+def run_operation(operation: str, files: list, page_count: int):
+    """Run one operation on the corpus files of a case and return the output size in bytes."""
+    first = Path(files[0])
+    last_tenth = max(1, page_count - page_count // 10)
+
+    if operation == 'page_count':
+        for file in files:
+            probe_pdf(Path(file))
+        return 0
+
+    if operation == 'extract':
+        output_buffer, _ = extract_pages(first, 1, max(1, page_count // 2))
+    elif operation == 'remove':
+        output_buffer, _ = remove_pages(first, 1, max(1, page_count // 10))
+    elif operation == 'rearrange':
+        output_buffer, _ = rearrange_pages(first, last_tenth, page_count, 'before', 1)
+    elif operation == 'insert':
+        # insert the other file of the case (or the file itself) in the middle
+        other = Path(files[-1])
+        output_buffer, _ = insert_pages(first, [(other, None, None, 'after', max(1, page_count // 2))])
+    elif operation in ('merge', 'merge_dedup'):
+        output_buffer, _ = merge_files([Path(file) for file in (files if len(files) > 1 else files * 2)],
+                                       deduplicate=(operation == 'merge_dedup'))
+    elif operation == 'split':
+        output_buffer, _ = split_pages(first, every=max(1, page_count // 10))
+    else:
+        raise ValueError(f"Unknown operation '{operation}'")
+
+    return output_buffer.seek(0, 2)
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def worker(case: str, operation: str, corpus_dir: str) -> dict:
+    files = build_corpus(corpus_dir, [case])[case]
+    page_count = CORPUS[case][0]['page_count']
+
+    rss_before = _peak_rss_mb()
+    started = time.perf_counter()
+    output_bytes = run_operation(operation, files, page_count)
+    wall_seconds = time.perf_counter() - started
+
+    return {'case': case, 'operation': operation, 'wall_seconds': round(wall_seconds, 4),
+            'peak_rss_mb': _peak_rss_mb(), 'rss_before_mb': rss_before, 'output_bytes': output_bytes}
+
+
+## Driver
+
+def measure(case: str, operation: str, corpus_dir: str, repeat: int) -> dict:
+    """Run an operation `repeat` times in fresh processes and keep the best time and the worst memory."""
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.run_benchmarks', '--worker', case, operation, corpus_dir],
+            cwd=REPOSITORY_ROOT, capture_output=True, text=True, check=True)
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    result = min(runs, key=lambda run: run['wall_seconds'])
+    peaks = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb'] is not None]
+    result['peak_rss_mb'] = max(peaks) if peaks else None
+    result['repeat'] = repeat
+    return result
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPOSITORY_ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {'commit': commit, 'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'pypdf2': PyPDF2.__version__,
+            'platform': platform.platform()}
+
+
+def compare(results: list, baseline: dict, threshold: float, min_delta: float) -> int:
+    """Print the change of each result against a baseline file and return the number of regressions."""
+    previous = {(r['case'], r['operation']): r for r in baseline['results']}
+    regressions = 0
+
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for result in results:
+        old = previous.get((result['case'], result['operation']))
+        if not old or not old['wall_seconds']:
+            continue
+        ratio = result['wall_seconds'] / old['wall_seconds']
+        flag = ''
+        if ratio > 1 + threshold and result['wall_seconds'] - old['wall_seconds'] > min_delta:
+            flag = '  <-- slower'
+            regressions += 1
+        print(f"{result['case']:>17} {result['operation']:>10} {old['wall_seconds']:>9.3f}s "
+              f"-> {result['wall_seconds']:>9.3f}s ({ratio - 1:+.0%}){flag}")
+
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the page actions on a synthetic PDF corpus.')
+    parser.add_argument('--cases', nargs='+', choices=list(CORPUS), default=list(CORPUS))
+    parser.add_argument('--operations', nargs='+', choices=OPERATIONS, default=OPERATIONS)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per measurement, the best time is reported (default: 3)')
+    parser.add_argument('--corpus-dir', default=str(Path(tempfile.gettempdir()) / 'pdf_editor_corpus'),
+                        help='folder where the synthetic corpus is generated and reused')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown reported as a regression (default: 0.10)')
+    parser.add_argument('--min-delta', type=float, default=0.01,
+                        help='slowdowns of fewer seconds are never reported (default: 0.01)')
+    parser.add_argument('--build-corpus', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--worker', nargs=3, metavar=('CASE', 'OPERATION', 'CORPUS_DIR'),
+                        help=argparse.SUPPRESS)
+    arguments = parser.parse_args(argv)
+
+    if arguments.worker:
+        print(json.dumps(worker(*arguments.worker)))
+        return 0
+
+    if arguments.build_corpus:
+        build_corpus(arguments.corpus_dir, arguments.cases)
+        return 0
+
+    # the corpus is built in another process: on Linux, child processes inherit
+    # the peak memory of their parent, which would then show in every measurement
+    subprocess.run([sys.executable, '-m', 'benchmarks.run_benchmarks', '--build-corpus',
+                    '--corpus-dir', arguments.corpus_dir, '--cases', *arguments.cases],
+                   cwd=REPOSITORY_ROOT, check=True)
+
+    print(f"{'case':>17} {'operation':>10} {'wall':>10} {'peak RSS':>10} {'output':>12}")
+    results = []
+    for case in arguments.cases:
+        for operation in arguments.operations:
+            result = measure(case, operation, arguments.corpus_dir, arguments.repeat)
+            results.append(result)
+            rss = f"{result['peak_rss_mb']:.1f} MB" if result['peak_rss_mb'] is not None else 'n/a'
+            print(f"{case:>17} {operation:>10} {result['wall_seconds']:>9.3f}s {rss:>10} "
+                  f"{result['output_bytes']:>12,}")
+
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, arguments.threshold, arguments.min_delta) else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
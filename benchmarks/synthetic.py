@@ -0,0 +1,153 @@
+import io
+import random
+from pathlib import Path
+
+
+## Synthetic PDF files for benchmarks
+
+def synthetic_pdf(page_count: int, content_size: int = 64, font_size: int = 0,
+                  image_size: int = 0, seed: int = 0, serial: int = 0) -> bytes:
+    """
+    Build a PDF file with `page_count` pages directly as bytes.
+
+    Writing the objects by hand is much faster than going through `PdfWriter`,
+    so documents with tens of thousands of pages can be generated in a moment.
+    Documents built with the same `seed` embed byte-identical fonts and images,
+    like files exported by the same application.
+
+    Args:
+        page_count (int): The number of pages of the document.
+        content_size (int, optional): Approximate size in bytes of the content
+                                      stream of each page.
+        font_size (int, optional): Size in bytes of a font program embedded once
+                                   and used by every page. Defaults to no embedded font.
+        image_size (int, optional): Size in bytes of a grayscale image drawn on
+                                    every page. Defaults to no image.
+        seed (int, optional): Seed of the pseudo-random font and image data.
+        serial (int, optional): Number printed on every page, to tell apart
+                                documents that are otherwise identical.
+    """
+    objects = []
+    rng = random.Random(seed)
+
+    def add_object(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    def add_stream(dictionary: bytes, data: bytes) -> int:
+        return add_object(b'<< %s /Length %d >>\nstream\n%s\nendstream' % (dictionary, len(data), data))
+
+    # catalog and page tree are filled in once the pages are known
+    catalog = add_object(b'')
+    page_tree = add_object(b'')
+
+    # a font shared by every page, embedded or one of the standard 14 fonts
+    if font_size:
+        font_file = add_stream(b'/Length1 %d' % font_size, rng.randbytes(font_size))
+        descriptor = add_object(
+            b'<< /Type /FontDescriptor /FontName /SyntheticSans /Flags 32 '
+            b'/FontBBox [0 -200 1000 900] /ItalicAngle 0 /Ascent 900 /Descent -200 '
+            b'/CapHeight 700 /StemV 80 /FontFile2 %d 0 R >>' % font_file)
+        font = add_object(b'<< /Type /Font /Subtype /TrueType /BaseFont /SyntheticSans '
+                          b'/FirstChar 32 /LastChar 32 /Widths [250] /FontDescriptor %d 0 R >>' % descriptor)
+    else:
+        font = add_object(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    # an image shared by every page
+    resources = b'/Font << /F1 %d 0 R >>' % font
+    if image_size:
+        side = max(1, int(image_size ** 0.5))
+        image = add_stream(b'/Type /XObject /Subtype /Image /Width %d /Height %d '
+                           b'/ColorSpace /DeviceGray /BitsPerComponent 8' % (side, side),
+                           rng.randbytes(side * side))
+        resources += b' /XObject << /Im1 %d 0 R >>' % image
+
+    kids = []
+    for i in range(page_count):
+        text = b'BT /F1 24 Tf 72 720 Td (Document %d, page %d) Tj ET\n' % (serial, i + 1)
+        if image_size:
+            text += b'q 200 0 0 200 72 400 cm /Im1 Do Q\n'
+        # pad the content stream with comments up to the requested size
+        padding = max(0, content_size - len(text))
+        contents = add_stream(b'', text + b'%' * padding)
+        kids.append(add_object(
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] '
+            b'/Resources << %s >> /Contents %d 0 R >>' % (page_tree, resources, contents)
+        ))
+
+    objects[catalog - 1] = b'<< /Type /Catalog /Pages %d 0 R >>' % page_tree
+    objects[page_tree - 1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % kid for kid in kids), page_count)
+
+    return _serialize(objects, catalog)
+
+
+def _serialize(objects: list, root: int) -> bytes:
+    """Write numbered object bodies, a cross-reference table and a trailer."""
+    output = io.BytesIO()
+    output.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    xref = output.tell()
+    output.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        output.write(b'%010d 00000 n \n' % offset)
+    output.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                 % (len(objects) + 1, root, xref))
+
+    return output.getvalue()
+
+
+def named_buffer(data: bytes, name: str) -> io.BytesIO:
+    """Wrap PDF bytes in a buffer with a `name`, like an uploaded file."""
+    buffer = io.BytesIO(data)
+    buffer.name = name
+    return buffer
+
+
+## Benchmark corpus
+
+# Each case is a list of files, each file given as the arguments of `synthetic_pdf`
+CORPUS = {
+    # a short document, the common case
+    'small': [dict(page_count=20)],
+    # many pages with tiny content, stresses the page tree and per-page overhead
+    'many_pages': [dict(page_count=5000)],
+    # few pages with large content streams, stresses raw byte copying
+    'large_content': [dict(page_count=200, content_size=256 * 1024)],
+    # every page uses the same embedded font and image
+    'shared_resources': [dict(page_count=500, font_size=400 * 1024, image_size=256 * 1024)],
+    # many small files embedding the same font, like invoices from one application
+    'many_files': [dict(page_count=3, font_size=400 * 1024, serial=number) for number in range(100)],
+}
+
+
+def build_corpus(directory, cases: list = None) -> dict:
+    """
+    Write the files of the benchmark corpus to `directory`.
+
+    Args:
+        directory (str): The folder where the files are written.
+        cases (list[str], optional): The names of the cases to build. Defaults
+                                     to every case of `CORPUS`.
+
+    Returns:
+        dict: The list of file paths of each case.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    corpus = {}
+    for case in cases or CORPUS:
+        corpus[case] = []
+        for number, arguments in enumerate(CORPUS[case]):
+            path = directory / f'{case}_{number:03d}.pdf'
+            if not path.exists():
+                path.write_bytes(synthetic_pdf(**arguments))
+            corpus[case].append(str(path))
+
+    return corpus
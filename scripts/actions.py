@@ -0,0 +1,103 @@
+import ast
+import importlib
+import importlib.util
+import io
+import os
+from typing import NamedTuple
+
+
+## Registry of the actions, imported the first time they are run
+
+class Action(NamedTuple):
+    """
+    An action of the app: its menu entry and the function running it, given by
+    its module and name so the module (and the PDF stack behind it) is only
+    imported when the action is first run.
+    """
+    label: str
+    caption: str
+    icon: str
+    module: str
+    function: str
+
+
+ACTIONS = {
+    'extract': Action('Extract', 'extract pages from a pdf file', '✂️',  # Scissors
+                      'scripts.extract_pages', 'extract_pages'),
+    'insert': Action('Insert', 'insert pages from a pdf file into another one', '➕',  # Plus sign
+                     'scripts.insert_pages', 'insert_pages'),
+    'merge': Action('Merge', 'concatenate several pdf files into a final, merged pdf file', '🔗',  # Chain link
+                    'scripts.merge_files', 'merge_files'),
+    'rearrange': Action('Rearrange', 'rearrange the pages of a pdf file', '🔄',  # Arrows/Revolving
+                        'scripts.rearrange_pages', 'rearrange_pages'),
+    'remove': Action('Remove', 'remove pages from a pdf file', '🗑️',  # Trash can
+                     'scripts.remove_pages', 'remove_pages'),
+    'split': Action('Split', 'split a pdf file into several files', '📚',  # Books
+                    'scripts.split_pages', 'split_pages'),
+}
+
+# Whether the app imports the PDF stack in the background as soon as the server
+# process runs its first session ('on' or 'off')
+PREWARM = os.environ.get('PDF_EDITOR_PREWARM', 'off').lower()
+
+
+def load_action(name: str):
+    """Return the function running the action `name`, importing its module on first use."""
+    action = ACTIONS[name]
+    return getattr(importlib.import_module(action.module), action.function)
+
+
+def action_help(name: str) -> str:
+    """
+    Return the description of the action `name`: the docstring of its function
+    up to its `Args:` block. The docstring is read from the source of the module,
+    which is not imported.
+    """
+    action = ACTIONS[name]
+    spec = importlib.util.find_spec(action.module)
+    with open(spec.origin, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=spec.origin)
+
+    docstring = next(ast.get_docstring(node, clean=False) for node in tree.body
+                     if isinstance(node, ast.FunctionDef) and node.name == action.function)
+    description = []
+    for line in docstring.split('\n'):
+        line = line.strip()
+        if line.startswith('Args:'):
+            break
+        description.append(line)
+    return '\n'.join(description).strip()
+
+
+def prewarm() -> None:
+    """
+    Import the modules of every action and the optional page renderer, and run
+    a small operation end to end, so the first operation of a new server process
+    does not also pay for loading the PDF stack and the code it only loads when
+    it first needs it (filters, object streams, ZIP archives, ...).
+    """
+    for name in ACTIONS:
+        load_action(name)
+    if importlib.util.find_spec('pypdfium2') is not None:
+        importlib.import_module('pypdfium2')
+
+    from PyPDF2 import PdfWriter
+
+    from scripts.output_profiles import OUTPUT_PROFILES
+    from scripts.page_plan import PagePlan
+    from scripts.split_pages import write_parts
+
+    # a blank two-page document, written with every output profile, deduplicated and split
+    writer = PdfWriter()
+    for _ in range(2):
+        writer.add_blank_page(width=72, height=72)
+    document = io.BytesIO()
+    writer.write(document)
+    document.name = 'prewarm.pdf'
+
+    plan = PagePlan.from_file(document)
+    for profile in OUTPUT_PROFILES:
+        plan.write(profile=profile)
+    plan.write(deduplicate=True)
+    parts, _ = load_action('split')(document, every=1, as_plan=True)
+    write_parts(parts)
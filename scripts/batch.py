@@ -0,0 +1,288 @@
+"""
+Run page operations on many PDF files without the Streamlit UI.
+
+The jobs are read from a manifest, a JSON list of objects or a CSV file with
+one job per row, and run in a pool of worker processes. Every job runs on its
+own: a failing job is reported and does not stop the others.
+
+Example of a JSON manifest:
+
+    [
+        {"action": "extract", "input": "scan.pdf", "start": 1, "end": 2},
+        {"action": "extract", "input": "scan.pdf", "spec": "1-3, 7, -2"},
+        {"action": "remove", "input": "scan.pdf", "start": 1, "end": 1, "output": "no_cover.pdf"},
+        {"action": "rearrange", "input": "scan.pdf", "start": 8, "end": 10,
+         "relative_pos": "before", "new_pos": 2},
+        {"action": "insert", "input": "main.pdf",
+         "insertions": [{"file": "annex.pdf", "relative_pos": "after", "insert_pos": 3}]},
+        {"action": "merge", "inputs": ["january.pdf", "february.pdf"], "deduplicate": true},
+        {"action": "split", "input": "scan.pdf", "every": 2}
+    ]
+
+Extract and remove jobs take a `"spec"` of several pages and ranges instead of
+`start` and `end` (see `scripts.page_spec`). Split jobs take `"every"` (pages per file), `"ranges"` (a list of `[start, end]`
+pairs) or `"bookmarks": true`, and save their files in a ZIP archive.
+The `insert_pos` of every insertion refers to the pages of the input file,
+before any insertion.
+
+Insert and merge jobs accept `"deduplicate": true` to write the resources
+shared by their files (fonts, logos, ...) only once. Any job accepts a
+`"profile"` (`default`, `compressed` or `compact`) to choose how much effort
+goes into making the output small, or `linearized` for outputs viewed over the
+network; `--profile` sets it for the other jobs.
+Remove and rearrange jobs accept `"incremental": true` to append the new page
+order to the input file instead of rewriting it, which is much faster on large
+files (the removed pages stay in the file, hidden, and the profile does not apply).
+
+CSV manifests have the columns `action`, `input`, `output`, `start`, `end`,
+`spec`, `relative_pos`, `new_pos`, `insert_file`, `insert_pos`, `every`,
+`ranges`, `bookmarks`, `deduplicate`, `incremental` and `profile`; the files of a
+merge are separated by `;` in the `input` column, the `ranges` of a split are
+written like `1-3; 4; 7-10`, and `bookmarks`, `deduplicate` and `incremental`
+take `true`, `false`, `1` or `0`.
+
+Usage:
+
+    python -m scripts.batch manifest.json --output-dir out --workers 4 --profile compact
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from pathlib import Path
+
+from scripts.extract_pages      import extract_pages
+from scripts.insert_pages       import insert_pages
+from scripts.instrumentation    import INSTRUMENTATION, measure, phase
+from scripts.merge_files        import merge_files
+from scripts.output_profiles    import OUTPUT_PROFILE, OUTPUT_PROFILES
+from scripts.output_writer      import save_output
+from scripts.page_spec          import parse_ranges
+from scripts.rearrange_pages    import rearrange_pages
+from scripts.remove_pages       import remove_pages
+from scripts.split_pages        import split_pages, write_parts
+
+# Default number of worker processes
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+# Columns of a CSV manifest holding integers
+_INTEGER_COLUMNS = ('start', 'end', 'new_pos', 'insert_pos', 'every')
+
+# Columns of a CSV manifest holding booleans, and the values they accept
+_BOOLEAN_COLUMNS = ('bookmarks', 'deduplicate', 'incremental')
+_BOOLEANS = {'true': True, 'false': False, '1': True, '0': False}
+
+
+## Manifests
+
+def load_manifest(path) -> list:
+    """
+    Read the jobs of a JSON or CSV manifest.
+
+    Args:
+        path (str): The path to the manifest. Files ending in `.csv` are read as
+                    CSV, anything else as JSON.
+    """
+    path = Path(path)
+
+    if path.suffix.lower() != '.csv':
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    jobs = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            job = {key: value.strip() for key, value in row.items() if value and value.strip()}
+            for key in _INTEGER_COLUMNS:
+                if key in job:
+                    job[key] = int(job[key])
+            for key in _BOOLEAN_COLUMNS:
+                if key in job:
+                    if job[key].lower() not in _BOOLEANS:
+                        raise ValueError(f"Invalid value '{job[key]}' in the '{key}' column, "
+                                         "expected true, false, 1 or 0.")
+                    job[key] = _BOOLEANS[job[key].lower()]
+            if 'ranges' in job:
+                job['ranges'] = parse_ranges(job['ranges'])
+
+            if job.get('action') == 'merge':
+                job['inputs'] = [file.strip() for file in job.pop('input').split(';')]
+            elif job.get('action') == 'insert' and 'insert_file' in job:
+                job['insertions'] = [{'file': job.pop('insert_file'),
+                                      'relative_pos': job.pop('relative_pos', 'before'),
+                                      'insert_pos': job.pop('insert_pos'),
+                                      'start': job.pop('start', None),
+                                      'end': job.pop('end', None)}]
+            jobs.append(job)
+
+    return jobs
+
+
+## Jobs
+
+def _plan_action(job: dict):
+    """Return the page plan of a job and its default output filename."""
+    action = job['action']
+
+    if action == 'extract':
+        return extract_pages(Path(job['input']), job.get('start'), job.get('end'), as_plan=True,
+                             spec=job.get('spec'))
+
+    if action == 'remove':
+        return remove_pages(Path(job['input']), job.get('start'), job.get('end'), as_plan=True,
+                            spec=job.get('spec'))
+
+    if action == 'rearrange':
+        return rearrange_pages(Path(job['input']), job['start'], job['end'],
+                               job['relative_pos'], job['new_pos'], as_plan=True)
+
+    if action == 'insert':
+        insertions = [(Path(insertion['file']), insertion.get('start'), insertion.get('end'),
+                       insertion.get('relative_pos', 'before'), insertion['insert_pos'])
+                      for insertion in job['insertions']]
+        return insert_pages(Path(job['input']), insertions, as_plan=True)
+
+    if action == 'merge':
+        return merge_files([Path(file) for file in job['inputs']], as_plan=True)
+
+    raise ValueError(f"Unknown action '{action}'")
+
+
+def run_job(index: int, job: dict, output_dir, profile: str = None) -> dict:
+    """
+    Run a single job and return its report.
+
+    Errors are caught and reported, never raised, so one broken input does not
+    stop the rest of the batch.
+
+    Args:
+        index (int): The position of the job in the manifest.
+        job (dict): The job, as read from the manifest.
+        output_dir (str): The folder where the output file is saved.
+        profile (str, optional): The output profile of jobs that do not set one.
+    """
+    report = {'index': index, 'action': job.get('action'), 'status': 'ok',
+              'output': None, 'output_bytes': None, 'seconds': None, 'error': None}
+    started = time.perf_counter()
+
+    # with the instrumentation on, the phases of the job are added to its report
+    measured = measure(job.get('action'), f'job {index}') if INSTRUMENTATION != 'off' else nullcontext()
+    instrumentation = None
+
+    try:
+        with measured as instrumentation:
+            if job['action'] == 'split':
+                parts, output_filename = split_pages(Path(job['input']), job.get('every'), job.get('ranges'),
+                                                     job.get('bookmarks', False), as_plan=True)
+                output_buffer = write_parts(parts, profile=job.get('profile', profile))
+            else:
+                plan, output_filename = _plan_action(job)
+                output_buffer = plan.write(deduplicate=job.get('deduplicate', False),
+                                           profile=job.get('profile', profile),
+                                           incremental=job.get('incremental', False))
+
+            # outputs without an explicit name are prefixed with the job index, so
+            # several jobs on the same file (or several merges) do not overwrite each other
+            output_path = Path(output_dir) / job.get('output', f'{index:04d}_{output_filename}')
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            with phase('save'):
+                save_output(output_buffer, output_path)
+
+            report['output'] = str(output_path)
+            report['output_bytes'] = output_path.stat().st_size
+
+    except Exception as e:
+        report['status'] = 'failed'
+        report['error'] = f'{type(e).__name__}: {e}'
+
+    report['seconds'] = round(time.perf_counter() - started, 4)
+    if instrumentation is not None:
+        report['phases'] = {name: round(seconds, 4) for name, seconds in instrumentation.phases.items()}
+    return report
+
+
+def run_batch(jobs: list, output_dir, max_workers: int = DEFAULT_WORKERS, on_report=None,
+              profile: str = None) -> list:
+    """
+    Run jobs in a pool of worker processes and return their reports in manifest order.
+
+    Args:
+        jobs (list[dict]): The jobs to run.
+        output_dir (str): The folder where the output files are saved.
+        max_workers (int, optional): The maximum number of worker processes.
+                                     Use 1 to run the jobs in this process.
+        on_report (callable, optional): Called with each report as soon as its
+                                        job finishes.
+        profile (str, optional): The output profile of jobs that do not set one.
+    """
+    reports = [None] * len(jobs)
+
+    if max_workers <= 1:
+        for index, job in enumerate(jobs):
+            reports[index] = run_job(index, job, output_dir, profile)
+            if on_report:
+                on_report(reports[index])
+        return reports
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_job, index, job, output_dir, profile): index
+                   for index, job in enumerate(jobs)}
+
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                reports[index] = future.result()
+            except Exception as e:
+                # the worker process itself died (e.g. killed for using too much memory)
+                reports[index] = {'index': index, 'action': jobs[index].get('action'),
+                                  'status': 'failed', 'output': None, 'output_bytes': None,
+                                  'seconds': None, 'error': f'{type(e).__name__}: {e}'}
+            if on_report:
+                on_report(reports[index])
+
+    return reports
+
+
+## Command line
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m scripts.batch',
+                                     description='Run page operations on PDF files listed in a manifest.')
+    parser.add_argument('manifest', help='JSON or CSV file listing the jobs')
+    parser.add_argument('-o', '--output-dir', default='output',
+                        help="folder for the output files (default: './output')")
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'number of worker processes (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--profile', choices=list(OUTPUT_PROFILES), default=OUTPUT_PROFILE,
+                        help=f'output profile of the jobs that do not set one (default: {OUTPUT_PROFILE})')
+    parser.add_argument('--report', help='write the job reports to this JSON file')
+    arguments = parser.parse_args(argv)
+
+    jobs = load_manifest(arguments.manifest)
+
+    def print_report(report):
+        if report['status'] == 'ok':
+            print(f"[{report['index']}] {report['action']}: {report['output']} "
+                  f"({report['output_bytes']} bytes, {report['seconds']}s)")
+        else:
+            print(f"[{report['index']}] {report['action']}: FAILED {report['error']}", file=sys.stderr)
+
+    started = time.perf_counter()
+    reports = run_batch(jobs, arguments.output_dir, arguments.workers, on_report=print_report,
+                        profile=arguments.profile)
+    failed = sum(report['status'] != 'ok' for report in reports)
+    print(f'{len(reports) - failed}/{len(reports)} jobs succeeded in {time.perf_counter() - started:.2f}s')
+
+    if arguments.report:
+        with open(arguments.report, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
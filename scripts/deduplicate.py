@@ -0,0 +1,142 @@
+import hashlib
+import io
+
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NullObject, StreamObject
+
+
+## Deduplication of identical objects copied from several files
+
+# Objects that must stay unique, even when two of them look the same
+_UNIQUE_TYPES = ('/Page', '/Pages', '/Catalog', '/Annot')
+
+# Maximum number of passes; each pass can make the parents of merged objects identical
+_MAX_PASSES = 8
+
+
+def _object_key(obj) -> bytes:
+    """Return a digest of the serialized object, streams included."""
+    buffer = io.BytesIO()
+    if isinstance(obj, StreamObject):
+        # only serialize the dictionary here, the raw data is hashed directly
+        DictionaryObject.write_to_stream(obj, buffer, None)
+    else:
+        obj.write_to_stream(buffer, None)
+
+    digest = hashlib.sha256(type(obj).__name__.encode())
+    digest.update(buffer.getbuffer())
+    if isinstance(obj, StreamObject):
+        digest.update(b'\0stream\0')
+        digest.update(obj._data)
+    return digest.digest()
+
+
+def _annotations(writer: PdfWriter) -> set:
+    """
+    Return the object numbers of the annotations of the pages, and of their
+    `/Annots` arrays. The `/Type` of an annotation is optional, so it cannot be
+    told apart by its type alone.
+    """
+    annotations = set()
+    for obj in writer._objects:
+        if not isinstance(obj, DictionaryObject) or '/Annots' not in obj:
+            continue
+        array = obj.raw_get('/Annots')
+        if isinstance(array, IndirectObject):
+            annotations.add(array.idnum)
+            array = array.get_object()
+        if isinstance(array, ArrayObject):
+            annotations.update(value.idnum for value in array if isinstance(value, IndirectObject))
+    return annotations
+
+
+def _find_duplicates(writer: PdfWriter) -> dict:
+    """Map the object number of each duplicate to the number of the first identical object."""
+    protected = {writer._root.idnum, writer._info.idnum, writer._pages.idnum}
+    # each annotation belongs to one page, two identical links must stay two links
+    protected |= _annotations(writer)
+    first_seen = {}
+    duplicates = {}
+
+    for index, obj in enumerate(writer._objects):
+        idnum = index + 1
+        if obj is None or isinstance(obj, NullObject) or idnum in protected:
+            continue
+        if not isinstance(obj, (DictionaryObject, ArrayObject)):
+            continue
+        if isinstance(obj, DictionaryObject) and obj.get('/Type') in _UNIQUE_TYPES:
+            continue
+
+        key = _object_key(obj)
+        if key in first_seen:
+            duplicates[idnum] = first_seen[key]
+        else:
+            first_seen[key] = idnum
+
+    return duplicates
+
+
+def _replace_references(writer: PdfWriter, duplicates: dict) -> None:
+    """Point every reference to a duplicate at the object it duplicates."""
+    references = {}
+
+    def canonical(reference):
+        idnum = duplicates[reference.idnum]
+        if idnum not in references:
+            references[idnum] = IndirectObject(idnum, 0, writer)
+        return references[idnum]
+
+    def is_duplicate(value):
+        return isinstance(value, IndirectObject) and value.pdf is writer and value.idnum in duplicates
+
+    for obj in writer._objects:
+        stack = [obj]
+        while stack:
+            data = stack.pop()
+            if isinstance(data, DictionaryObject):
+                for key, value in list(data.items()):
+                    if is_duplicate(value):
+                        data[key] = canonical(value)
+                    elif isinstance(value, (DictionaryObject, ArrayObject)):
+                        stack.append(value)
+            elif isinstance(data, ArrayObject):
+                for position, value in enumerate(data):
+                    if is_duplicate(value):
+                        data[position] = canonical(value)
+                    elif isinstance(value, (DictionaryObject, ArrayObject)):
+                        stack.append(value)
+
+
+def deduplicate_objects(writer: PdfWriter) -> int:
+    """
+    Write identical fonts, images, color profiles and other resources only once.
+
+    Files exported by the same application often embed the very same resources.
+    Once their pages are copied into `writer`, the indirect objects are hashed
+    and identical ones are merged. Merging identical streams makes the
+    dictionaries that referenced them (font descriptors, fonts, resource
+    dictionaries) identical too, so they are merged in the following pass.
+    References to a duplicate are redirected to the kept object and the
+    duplicate is replaced by `null`.
+
+    Args:
+        writer (PdfWriter): The writer holding the pages of the output file.
+
+    Returns:
+        int: The number of duplicate objects removed.
+    """
+    removed = 0
+
+    for _ in range(_MAX_PASSES):
+        duplicates = _find_duplicates(writer)
+        if not duplicates:
+            break
+
+        _replace_references(writer, duplicates)
+
+        # the object numbers stay in the cross-reference table, their content is dropped
+        for idnum in duplicates:
+            writer._objects[idnum - 1] = NullObject()
+        removed += len(duplicates)
+
+    return removed
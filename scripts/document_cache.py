@@ -0,0 +1,487 @@
+import hashlib
+import io
+import mmap
+import os
+import pickle
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from PyPDF2 import PdfReader
+from PyPDF2.errors import PdfReadError
+from PyPDF2.generic import IndirectObject
+
+from scripts.instrumentation import phase
+
+
+## Parse-once cache of PDF documents
+
+# Upper bound for the total size (in bytes of PDF source) of the documents kept
+# parsed in memory. Least recently used documents are evicted first.
+CACHE_MAX_BYTES = int(os.environ.get('PDF_EDITOR_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Documents larger than this (in bytes) are memory-mapped instead of being read
+# into memory, so the parser only pulls in the parts of the file it uses
+MMAP_THRESHOLD = int(os.environ.get('PDF_EDITOR_MMAP_THRESHOLD', 64 * 1024 * 1024))
+
+# Size of the chunks read when hashing a file
+CHUNK_SIZE = 1024 * 1024
+
+# Objects of a file, found by scanning it when its cross-reference data is lost
+_OBJECT = re.compile(rb'(?<![\d.])(\d+)\s+(\d+)\s+obj\b')
+_CATALOG = re.compile(rb'/Type\s*/Catalog\b')
+
+# Damaged files remembered, for the most recent ones
+_REPAIRED_MEMO_SIZE = 4096
+
+
+class CachedDocument:
+    """
+    A parsed PDF document stored in the document cache.
+
+    The reader reads lazily from its stream, so it must not be used from two
+    threads at the same time: hold `lock` (or use `locked`) while reading pages
+    or writing them out with a `PdfWriter`. The stream is an in-memory buffer
+    or, for large files, a memory map. The map is not closed when the document
+    is evicted, as operations started before may still read from it: it is
+    released (with its anonymous temporary file) when the reader is freed by
+    the garbage collector, the reader and its objects referencing each other.
+
+    `repair` is the error of a damaged file whose cross-reference data was
+    rebuilt by scanning it (see `rebuild_xref`), or None.
+    """
+
+    def __init__(self, key: str, reader: PdfReader, size: int, repair: str = None):
+        self.key = key
+        self.reader = reader
+        self.size = size
+        self.repair = repair
+        self.lock = threading.RLock()
+
+
+class DocumentCache:
+    """
+    Content-hash keyed, byte-bounded LRU cache of parsed PDF documents.
+
+    Files that cannot be opened because their cross-reference data is lost
+    (e.g. an interrupted download) are parsed with a rebuilt one instead. The
+    files repaired are remembered, so a file evicted, too large to be kept or
+    marked as damaged by `repair` is repaired again whenever it is parsed,
+    and never parsed from its damaged bytes.
+
+    Args:
+        max_bytes (int): The maximum total size of the cached documents.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+        # locks of the documents being parsed, by key
+        self._parsing = {}
+        # errors of the files repaired, by key
+        self._repaired = OrderedDict()
+
+    def _lookup(self, key: str):
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+                self.hits += 1
+            return document
+
+    def get(self, file) -> CachedDocument:
+        """
+        Return the parsed document for `file`, parsing it only on a cache miss.
+
+        Each document is parsed by one thread at a time: other threads asking
+        for it wait for the parse and get the same document.
+        """
+        key = content_hash(file)
+        document = self._lookup(key)
+        if document is not None:
+            return document
+
+        with self._lock:
+            parse_lock = self._parsing.setdefault(key, threading.Lock())
+
+        # parse outside the cache lock so other documents stay available
+        with parse_lock:
+            document = self._lookup(key)
+            if document is not None:
+                return document
+
+            try:
+                with self._lock:
+                    self.misses += 1
+                with phase('parse'):
+                    document = self._parse(key, file)
+                self.put(document)
+            finally:
+                with self._lock:
+                    self._parsing.pop(key, None)
+        return document
+
+    def _parse(self, key: str, file) -> CachedDocument:
+        with self._lock:
+            error = self._repaired.get(key)
+
+        if error is None:
+            stream, size = open_source(file)
+            try:
+                return CachedDocument(key, PdfReader(stream), size)
+            except PdfReadError as e:
+                error = str(e)
+                try:
+                    data = rebuild_xref(read_bytes(file))
+                except ValueError:
+                    raise e from None
+        else:
+            data = rebuild_xref(read_bytes(file))
+
+        reader = PdfReader(io.BytesIO(data))
+        with self._lock:
+            self._repaired[key] = error
+            self._repaired.move_to_end(key)
+            if len(self._repaired) > _REPAIRED_MEMO_SIZE:
+                self._repaired.popitem(last=False)
+        return CachedDocument(key, reader, len(data), repair=error)
+
+    def repair(self, file, error: str) -> CachedDocument:
+        """
+        Mark `file` as damaged, for a file that opens but whose pages cannot be
+        read, and return its document parsed with rebuilt cross-reference data.
+
+        Raises:
+            ValueError: If the file cannot be repaired (no catalog is found).
+        """
+        key = content_hash(file)
+        with self._lock:
+            self._repaired[key] = error
+            document = self._documents.pop(key, None)
+            if document is not None:
+                self.current_bytes -= document.size
+        return self.get(file)
+
+    def put(self, document: CachedDocument) -> None:
+        """Store a parsed document, evicting least recently used ones if needed."""
+        # documents larger than the whole cache are used once and not kept
+        if document.size > self.max_bytes:
+            return
+
+        with self._lock:
+            if document.key in self._documents:
+                return
+            self._documents[document.key] = document
+            self.current_bytes += document.size
+
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._documents.popitem(last=False)
+                self.current_bytes -= evicted.size
+
+    def clear(self) -> None:
+        """Drop the cached documents; the files known to be damaged stay known."""
+        with self._lock:
+            self._documents.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._documents
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+
+## Repair of files whose cross-reference data is lost
+
+def rebuild_xref(data: bytes) -> bytes:
+    """
+    Return `data` followed by a new cross-reference table and trailer listing
+    the objects found by scanning the file, for files whose end (and so their
+    cross-reference table) was lost, e.g. by an interrupted download.
+
+    Raises:
+        ValueError: If no catalog object is found.
+    """
+    offsets = {}
+    catalog = None
+    for match in _OBJECT.finditer(data):
+        number, generation = int(match[1]), int(match[2])
+        # later definitions of an object replace the earlier ones, as in an incremental update
+        offsets[number] = (match.start(), generation)
+        end = data.find(b'endobj', match.end())
+        if _CATALOG.search(data, match.end(), end if end >= 0 else len(data)):
+            catalog = (number, generation)
+    if catalog is None:
+        raise ValueError('no catalog found')
+
+    size = max(offsets) + 1
+    table = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+    for number in range(1, size):
+        if number in offsets:
+            table.append(b'%010d %05d n \n' % offsets[number])
+        else:
+            table.append(b'0000000000 00000 f \n')
+
+    xref_location = len(data) + 1
+    trailer = b'trailer\n<< /Size %d /Root %d %d R >>\nstartxref\n%d\n%%%%EOF\n' % (size, *catalog, xref_location)
+    return data + b'\n' + b''.join(table) + trailer
+
+
+## Helpers to read uploaded files, file objects and paths alike
+
+# Content hashes already computed, keyed by the identity of the file
+_hash_memo = OrderedDict()
+_HASH_MEMO_SIZE = 256
+_hash_memo_lock = threading.Lock()
+
+
+def file_identity(file):
+    """
+    Return a cheap identity for `file` that changes whenever its content does,
+    or None if there is no such identity.
+    """
+    # Streamlit uploads get a new file_id for every upload
+    file_id = getattr(file, 'file_id', None)
+    if file_id is not None:
+        return ('upload', file_id)
+
+    if isinstance(file, (str, Path)):
+        stat = os.stat(file)
+        return ('path', str(Path(file).resolve()), stat.st_size, stat.st_mtime_ns)
+
+    return None
+
+
+class UploadView(io.BytesIO):
+    """
+    A separate stream over the content of an upload, so a background thread
+    does not move the position of the file read by the app or by other
+    threads. It keeps the `name`, `size` and `file_id` of the upload, which
+    shares the content hash already computed.
+    """
+
+    def __init__(self, upload):
+        super().__init__(upload.getvalue())
+        self.name = upload.name
+        self.size = upload.size
+        self.file_id = upload.file_id
+
+
+def upload_view(file):
+    """Return a separate stream over `file` if it is an upload, or `file` itself otherwise."""
+    return UploadView(file) if hasattr(file, 'file_id') else file
+
+
+def _iter_chunks(file):
+    """Yield the content of `file` in chunks, restoring the stream position afterwards."""
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        yield file
+        return
+
+    if isinstance(file, (str, Path)):
+        with open(file, 'rb') as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+        return
+
+    position = file.tell()
+    file.seek(0)
+    try:
+        while chunk := file.read(CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.seek(position)
+
+
+def content_hash(file) -> str:
+    """Return the SHA-256 hex digest of the content of `file`."""
+    identity = file_identity(file)
+    if identity is not None:
+        with _hash_memo_lock:
+            if identity in _hash_memo:
+                _hash_memo.move_to_end(identity)
+                return _hash_memo[identity]
+
+    digest = hashlib.sha256()
+    for chunk in _iter_chunks(file):
+        digest.update(chunk)
+    key = digest.hexdigest()
+
+    if identity is not None:
+        with _hash_memo_lock:
+            _hash_memo[identity] = key
+            if len(_hash_memo) > _HASH_MEMO_SIZE:
+                _hash_memo.popitem(last=False)
+
+    return key
+
+
+def read_bytes(file) -> bytes:
+    """Return the whole content of `file` as bytes."""
+    return b''.join(_iter_chunks(file))
+
+
+def file_size(file) -> int:
+    """Return the size in bytes of `file` without reading it."""
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        return len(file)
+
+    if isinstance(file, (str, Path)):
+        return os.path.getsize(file)
+
+    position = file.tell()
+    size = file.seek(0, 2)
+    file.seek(position)
+    return size
+
+
+def open_source(file, mmap_threshold: int = None):
+    """
+    Return a seekable stream over the content of `file` and its size.
+
+    Small files are copied into memory. Files larger than `mmap_threshold` are
+    memory-mapped: paths are mapped directly (so they must not be modified in
+    place while in use) and other files are first copied, in chunks, to an
+    anonymous temporary file. The mapped pages belong to the operating system's
+    file cache rather than to the process, and are dropped again under memory
+    pressure.
+
+    Args:
+        file: The uploaded file, file object, path or bytes of the PDF.
+        mmap_threshold (int, optional): Size in bytes above which the file is
+                                        memory-mapped. Defaults to `MMAP_THRESHOLD`.
+    """
+    if mmap_threshold is None:
+        mmap_threshold = MMAP_THRESHOLD
+
+    size = file_size(file)
+    if size <= mmap_threshold or size == 0:
+        return io.BytesIO(read_bytes(file)), size
+
+    if isinstance(file, (str, Path)):
+        with open(file, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), size
+
+    # the map keeps the data reachable after the temporary file is closed (and deleted)
+    with tempfile.TemporaryFile(prefix='pdf_editor_') as f:
+        for chunk in _iter_chunks(file):
+            f.write(chunk)
+        f.flush()
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), size
+
+
+## Process-wide cache shared by the app and the scripts
+
+_cache = DocumentCache()
+
+
+def get_cache() -> DocumentCache:
+    return _cache
+
+
+def get_document(file) -> CachedDocument:
+    """Return the cached, parsed document for `file`."""
+    return _cache.get(file)
+
+
+def get_reader(file) -> PdfReader:
+    """Return the cached `PdfReader` for `file`."""
+    return get_document(file).reader
+
+
+def page_count(file) -> int:
+    """Return the number of pages of `file`, parsing it at most once."""
+    document = get_document(file)
+    # the page tree is read on first use, which is part of parsing the file
+    with document.lock, phase('parse'):
+        return len(document.reader.pages)
+
+
+## Concurrent loading of many files
+
+def _parse_in_thread(file) -> CachedDocument:
+    document = get_document(file)
+    with document.lock:
+        # build the page list now, instead of during the (sequential) write
+        len(document.reader.pages)
+    return document
+
+
+def _parse_in_process(source) -> bytes:
+    """Parse a PDF completely and return the pickled reader, without its stream."""
+    reader = PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+    len(reader.pages)
+    for generation, numbers in reader.xref.items():
+        for number in numbers:
+            reader.get_object(IndirectObject(number, generation, reader))
+
+    # every object is resolved, the parent process attaches its own copy of the data
+    reader.stream = None
+    return pickle.dumps(reader, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_documents(files: list, max_workers: int, use_processes: bool = False) -> list:
+    """
+    Parse several files concurrently into the cache and return their documents
+    in the order of `files`.
+
+    Threads overlap reading and hashing the files, but parsing is pure Python
+    and holds the GIL. With `use_processes`, files that are not memory-mapped
+    are fully parsed in worker processes and the parsed readers are sent back,
+    so parsing uses several cores. An error raised by a worker is raised again
+    by parsing the file in this process, so the error is the same in every mode.
+
+    Args:
+        files (list): The uploaded files, file objects or paths of the PDFs.
+        max_workers (int): The maximum number of threads or processes.
+        use_processes (bool, optional): Parse in worker processes instead of threads.
+    """
+    if not use_processes:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_parse_in_thread, files))
+
+    documents = [None] * len(files)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for index, file in enumerate(files):
+            key = content_hash(file)
+            if key in _cache or file_size(file) > MMAP_THRESHOLD:
+                continue
+            source = str(file) if isinstance(file, (str, Path)) else read_bytes(file)
+            futures[index] = (key, source, executor.submit(_parse_in_process, source))
+
+        for index, (key, source, future) in futures.items():
+            try:
+                reader = pickle.loads(future.result())
+            except Exception:
+                continue
+            data = read_bytes(source) if isinstance(source, str) else source
+            reader.stream = io.BytesIO(data)
+            documents[index] = CachedDocument(key, reader, len(data))
+            _cache.put(documents[index])
+
+    # files already cached, too large to be sent between processes or that failed
+    return [document or get_document(file) for file, document in zip(files, documents)]
+
+
+@contextmanager
+def locked(documents):
+    """
+    Hold the locks of several documents at once.
+
+    Locks are always taken in key order so two operations sharing documents
+    cannot deadlock.
+    """
+    unique = {document.key: document for document in documents}
+    with ExitStack() as stack:
+        for key in sorted(unique):
+            stack.enter_context(unique[key].lock)
+        yield
@@ -1,13 +1,14 @@
 import os
 from pathlib import Path
-import io
 
-from PyPDF2 import PdfReader, PdfWriter
+from scripts.instrumentation import instrumented
+from scripts.page_plan import as_page_plan
 
 
 ## Extract pages from a PDF file
 
-def extract_pages(file, start: int, end: int):
+@instrumented('extract')
+def extract_pages(file, start: int = None, end: int = None, as_plan: bool = False, spec: str = None):
     """
     This action extracts a range of pages from a PDF and saves them as a new file.
 
@@ -17,34 +18,37 @@ def extract_pages(file, start: int, end: int):
     For example, if you choose start=3 and end=5, the new PDF will contain
     pages 3, 4, and 5 from the original file.
 
+    To extract several pages and ranges at once, type a page spec instead,
+    such as '1-3, 7, 10-20, -5' (the last 5 pages), 'odd' or 'even'. Add
+    'reverse' to write the pages in reverse order.
+
     Args:
         file (str): The path to the PDF file you want to extract pages from.
         start (int): The first page number of the range to extract.
         end (int): The last page number of the range to extract.
+        as_plan (bool, optional): Return a `PagePlan` to chain with other
+                                  actions instead of writing the output file.
+        spec (str, optional): A page spec of the pages to extract, used instead
+                              of `start` and `end`.
     """
         
-    reader = PdfReader(file)
-    pages = reader.pages
-
-    # modify start and end for 0-indexing
-    start, end = start - 1, end - 1
-
     # select pages to extract
-    pages_to_extract = pages[start : end + 1]
-
-    # write pages to output file
-    writer = PdfWriter()
-    for page in pages_to_extract:
-        writer.add_page(page)
+    if spec is not None:
+        plan = as_page_plan(file).select(spec)
+    elif start is None or end is None:
+        raise ValueError('Give the start and end pages, or a page spec.')
+    else:
+        plan = as_page_plan(file).extract(start, end)
 
     # create output filename
     file_path = Path(file.name)
     filename = file_path.stem
     output_filename = f'{filename}_extracted.pdf'
 
-    # create a memory buffer to store output pdf
-    output_buffer = io.BytesIO()
-    writer.write(output_buffer)
+    if as_plan:
+        return plan, output_filename
 
-    return output_buffer, output_filename
+    # write the output pdf, spilled to disk when it is large
+    output_buffer = plan.write()
 
+    return output_buffer, output_filename
@@ -0,0 +1,146 @@
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+## Resource governor: limits on the heavy operations running at the same time
+
+# Memory in bytes the running operations may use together, estimated from their input size
+MEMORY_BUDGET = int(os.environ.get('PDF_EDITOR_MEMORY_BUDGET', 2 * 1024 * 1024 * 1024))
+
+# Memory an operation is expected to use per byte of input: the parsed objects
+# of a PDF take several times the size of the file
+MEMORY_FACTOR = float(os.environ.get('PDF_EDITOR_MEMORY_FACTOR', 4))
+
+
+class OperationTooLarge(ValueError):
+    """Raised for an operation whose input could not fit in the memory budget, even alone."""
+
+
+def estimate_memory(input_bytes: int) -> int:
+    """Return the memory an operation on `input_bytes` bytes of input is expected to use."""
+    return int(input_bytes * MEMORY_FACTOR)
+
+
+class Ticket:
+    """The place of an operation in the line of the governor, then its reservation."""
+
+    def __init__(self, cost: int):
+        self.cost = cost
+        self.granted = False
+        self.withdrawn = False
+
+
+class ResourceGovernor:
+    """
+    Admits the heavy operations in their order of arrival, as long as the
+    number of operations running stays under `max_concurrent` and their
+    estimated memory under `memory_budget`.
+
+    The line is strictly first come, first served: an operation waiting for
+    memory to be released is not overtaken by smaller ones, so large files
+    are delayed but never starved. An operation that could not fit even
+    alone is rejected when it joins the line.
+
+    Args:
+        max_concurrent (int): The number of operations running at the same time.
+        memory_budget (int): The estimated memory, in bytes, of the operations
+                             running at the same time.
+    """
+
+    def __init__(self, max_concurrent: int, memory_budget: int = MEMORY_BUDGET):
+        self.max_concurrent = max_concurrent
+        self.memory_budget = memory_budget
+        self.running = 0
+        self.reserved = 0
+        self._waiting = deque()
+        self._condition = threading.Condition()
+
+    def fits(self, cost: int) -> bool:
+        """Return whether an operation of estimated memory `cost` can ever run."""
+        return cost <= self.memory_budget
+
+    def check(self, cost: int) -> None:
+        """
+        Raises:
+            OperationTooLarge: If an operation of estimated memory `cost` can never run.
+        """
+        if not self.fits(cost):
+            raise OperationTooLarge(
+                f'The files are too large to be processed: they need about {cost / 2**20:.0f} MB '
+                f'of memory and the server allows {self.memory_budget / 2**20:.0f} MB.')
+
+    def enqueue(self, cost: int) -> Ticket:
+        """Put an operation of estimated memory `cost` in line and return its ticket."""
+        self.check(cost)
+        ticket = Ticket(cost)
+        with self._condition:
+            self._waiting.append(ticket)
+            self._grant()
+        return ticket
+
+    def wait(self, ticket: Ticket) -> bool:
+        """
+        Block until the operation of `ticket` may run. Return False if the
+        ticket was withdrawn from the line instead.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: ticket.granted or ticket.withdrawn)
+            return ticket.granted
+
+    def withdraw(self, ticket: Ticket) -> None:
+        """Take a ticket out of the line if it is still waiting; `wait` then returns False."""
+        with self._condition:
+            if ticket.granted or ticket.withdrawn:
+                return
+            ticket.withdrawn = True
+            self._waiting.remove(ticket)
+            self._grant()
+            self._condition.notify_all()
+
+    def release(self, ticket: Ticket) -> None:
+        """Free the slot and the memory of a finished operation."""
+        with self._condition:
+            if not ticket.granted:
+                return
+            ticket.granted = False
+            self.running -= 1
+            self.reserved -= ticket.cost
+            self._grant()
+
+    def position(self, ticket: Ticket) -> int:
+        """Return the place of a waiting ticket in line, from 1, or 0 if it is not waiting."""
+        with self._condition:
+            try:
+                return self._waiting.index(ticket) + 1
+            except ValueError:
+                return 0
+
+    @property
+    def waiting(self) -> int:
+        with self._condition:
+            return len(self._waiting)
+
+    @contextmanager
+    def slot(self, cost: int):
+        """Run the body of the `with` statement once an operation of memory `cost` is admitted."""
+        ticket = self.enqueue(cost)
+        self.wait(ticket)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def _grant(self) -> None:
+        # admit the head of the line while it fits; call with the condition held
+        granted = False
+        while self._waiting and self.running < self.max_concurrent and \
+                self.reserved + self._waiting[0].cost <= self.memory_budget:
+            ticket = self._waiting.popleft()
+            ticket.granted = True
+            self.running += 1
+            self.reserved += ticket.cost
+            granted = True
+        if granted:
+            self._condition.notify_all()
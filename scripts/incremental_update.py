@@ -0,0 +1,147 @@
+import shutil
+
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+
+from scripts.document_cache import CHUNK_SIZE, get_document
+from scripts.output_writer import new_output_buffer
+
+
+## Incremental updates: append the new page order to the original file
+
+# Bytes read at the end of the file to find the last `startxref`
+_TAIL_SIZE = 1024
+
+# Catalog entries that number the pages by position, and are wrong once the pages move
+_POSITIONAL_CATALOG_ENTRIES = ('/PageLabels',)
+
+
+def _xref_location(stream):
+    """
+    Return the offset of the last cross-reference section of the PDF in
+    `stream`, or None if it is not a classic `xref` table.
+    """
+    # memory maps return None from seek
+    stream.seek(0, 2)
+    size = stream.tell()
+    stream.seek(max(0, size - _TAIL_SIZE))
+    tail = stream.read()
+
+    position = tail.rfind(b'startxref')
+    if position < 0:
+        return None
+    try:
+        location = int(tail[position + len(b'startxref'):].split()[0])
+    except (IndexError, ValueError):
+        return None
+
+    stream.seek(location)
+    return location if stream.read(4) == b'xref' else None
+
+
+def write_incremental(plan, spill_threshold: int = None, progress=None):
+    """
+    Write the output of a single-source plan as an incremental update of the source.
+
+    The source bytes are copied unchanged and followed by the new version of
+    the objects that change: the root of the page tree with the new page list,
+    the pages that hung from an intermediate node of the tree (the new tree is
+    flat) and the catalog if it has page labels. A new cross-reference section
+    chains to the original one, so the work done depends on the number of
+    pages, not on the size of their content.
+
+    Removed pages are only unlinked from the page tree: their content is still
+    in the file, so this is not the way to strip confidential pages. Outlines,
+    forms and metadata of the source are kept.
+
+    Args:
+        plan (PagePlan): The plan to write.
+        spill_threshold (int, optional): Size in bytes above which the output is
+                                         spilled to disk.
+        progress (callable, optional): Called with the number of pages written
+                                       and the total once the pages are written.
+
+    Returns:
+        The output buffer, rewound, or None if the plan cannot be written this
+        way: several sources, a page used twice, an encrypted source or one
+        with cross-reference streams.
+    """
+    pages = plan.resolve()
+    if len(plan.sources) != 1 or len(set(pages)) != len(pages):
+        return None
+
+    document = get_document(next(iter(plan.sources.values())))
+    reader = document.reader
+
+    with document.lock:
+        if reader.is_encrypted or '/XRefStm' in reader.trailer or reader.xref_objStm:
+            return None
+        original_xref = _xref_location(reader.stream)
+        catalog_reference = reader.trailer.raw_get('/Root')
+        catalog = catalog_reference.get_object()
+        tree_reference = catalog.raw_get('/Pages')
+        if original_xref is None or not isinstance(tree_reference, IndirectObject):
+            return None
+
+        len(reader.pages)
+        source_pages = reader.flattened_pages
+        page_references = [source_pages[page_index].indirect_reference for _, page_index in pages]
+
+        # objects to append, by (number, generation)
+        updated = {}
+
+        tree = DictionaryObject(tree_reference.get_object())
+        tree[NameObject('/Kids')] = ArrayObject(page_references)
+        tree[NameObject('/Count')] = NumberObject(len(page_references))
+        updated[tree_reference.idnum, tree_reference.generation] = tree
+
+        # the tree is flattened by the reader, which copies the attributes
+        # inherited from intermediate nodes into each page
+        for reference in page_references:
+            page = reference.get_object()
+            parent = page.raw_get('/Parent')
+            if not isinstance(parent, IndirectObject) or parent.idnum != tree_reference.idnum:
+                page = DictionaryObject(page)
+                page[NameObject('/Parent')] = tree_reference
+                updated[reference.idnum, reference.generation] = page
+
+        if any(entry in catalog for entry in _POSITIONAL_CATALOG_ENTRIES):
+            catalog = DictionaryObject({key: value for key, value in catalog.items()
+                                        if key not in _POSITIONAL_CATALOG_ENTRIES})
+            updated[catalog_reference.idnum, catalog_reference.generation] = catalog
+
+        output = new_output_buffer(spill_threshold)
+        reader.stream.seek(0)
+        shutil.copyfileobj(reader.stream, output, CHUNK_SIZE)
+        output.write(b'\n')
+
+        offsets = {}
+        for (number, generation), obj in sorted(updated.items()):
+            offsets[number] = (output.tell(), generation)
+            output.write(b'%d %d obj\n' % (number, generation))
+            obj.write_to_stream(output, None)
+            output.write(b'\nendobj\n')
+
+    if progress is not None:
+        progress(len(pages), len(pages))
+
+    # the head of the free list, then one subsection per run of consecutive object numbers
+    xref_location = output.tell()
+    output.write(b'xref\n0 1\n0000000000 65535 f \n')
+    numbers = sorted(offsets)
+    first = 0
+    for last in range(len(numbers)):
+        if last + 1 == len(numbers) or numbers[last + 1] != numbers[last] + 1:
+            output.write(b'%d %d\n' % (numbers[first], last - first + 1))
+            for number in numbers[first:last + 1]:
+                output.write(b'%010d %05d n \n' % offsets[number])
+            first = last + 1
+
+    trailer = DictionaryObject({NameObject(key): reader.trailer.raw_get(key)
+                                for key in ('/Size', '/Root', '/Info', '/ID') if key in reader.trailer})
+    trailer[NameObject('/Prev')] = NumberObject(original_xref)
+    output.write(b'trailer\n')
+    trailer.write_to_stream(output, None)
+    output.write(b'\nstartxref\n%d\n%%%%EOF\n' % xref_location)
+
+    output.seek(0)
+    return output
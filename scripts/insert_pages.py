@@ -1,31 +1,65 @@
 from pathlib import Path
-import io
 
-from PyPDF2 import PdfReader, PdfWriter
+from scripts.instrumentation import instrumented
+from scripts.page_plan import as_page_plan
 
 
-### Insert pages from pdf
+### Insert pages from pdf files
 
-def insert_pages(insertion_file,
-                 start_insertion = None, end_insertion = None):
+@instrumented('insert')
+def insert_pages(main_file, insertions: list, as_plan: bool = False, deduplicate: bool = False):
     """
-    Extracts a range of pages from a given PDF file.
+    This action inserts pages from one or more PDF files into a main PDF file.
+
+    This action allows you to take pages from other PDF documents and add them
+    to a primary document. First, upload your main PDF. Then, upload one or
+    more additional PDFs that contain the pages you want to insert.
+
+    For each additional file, you can specify the exact position in the main
+    file where the new pages should be placed (e.g., 'before' page 5). You can
+    also select a specific page range from the additional file to insert.
+    By default, all pages from the additional file will be inserted.
+
+    Positions always refer to the pages of the main file as uploaded, whatever
+    the other insertions: two files inserted before page 5 go, in the order
+    they were uploaded, right before what was page 5.
 
     Args:
-        insertion_file: The PDF file containing the pages you
-                           want to insert.
-        start_insertion (int, optional): The first page of the range to copy from
-                                      the `inserted_file`. Defaults to the first page.
-        end_insertion (int, optional): The last page of the range to copy from
-                                    the `inserted_file`. Defaults to the last page.
+        main_file (str): The path to the PDF file to insert pages into.
+        insertions (list[tuple]): A `(file, start, end, relative_pos, insert_pos)`
+                                  tuple for each file to insert: the first and
+                                  last page of the range to copy from `file`
+                                  (None for its first and last page), 'before'
+                                  or 'after', and the page of the main file.
+        as_plan (bool, optional): Return a `PagePlan` to chain with other
+                                  actions instead of writing the output file.
+        deduplicate (bool, optional): Write the fonts, images and other resources
+                                      shared by the files only once.
     """
+    # the pages to insert from each file; files are parsed once, through the cache
+    blocks = []
+    for insertion_file, start, end, relative_pos, insert_pos in insertions:
+        plan = as_page_plan(insertion_file)
+
+        # Use the full range if start/end are not specified
+        start = start if start else 1
+        end = end if end else len(plan)
+        if not 1 <= start <= end <= len(plan):
+            raise ValueError(f'Invalid range {start}-{end} of {Path(insertion_file.name).name}: pages must be '
+                             f'between 1 and {len(plan)} and the end page must not be before the start page.')
+
+        blocks.append((plan.extract(start, end), relative_pos, insert_pos))
+
+    # place all the blocks in a single pass over the pages of the main file
+    plan = as_page_plan(main_file).insert_many(blocks)
+
+    # create output filename
+    output_filename = f'{Path(main_file.name).stem}_expanded.pdf'
 
-    insert_reader = PdfReader(insertion_file)
-    insert_length = len(insert_reader.pages)
+    if as_plan:
+        return plan, output_filename
 
-    # Use the full range if start/end are not specified
-    start = start_insertion if start_insertion else 1
-    end = end_insertion if end_insertion else insert_length
+    # write the output pdf, spilled to disk when it is large
+    output_buffer = plan.write(deduplicate=deduplicate)
 
-    # Return a list of the page objects to be inserted
-    return insert_reader.pages[start - 1 : end]
+    return output_buffer, output_filename
@@ -0,0 +1,197 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+## Opt-in timings of the operations
+
+# 'off', 'on' to record the phase timings, bytes and pages of each operation,
+# or 'memory' to also trace their peak memory (which slows Python allocations down)
+INSTRUMENTATION = os.environ.get('PDF_EDITOR_INSTRUMENTATION', 'off').lower()
+
+# File the operation reports are appended to, one JSON object per line
+INSTRUMENTATION_LOG = os.environ.get('PDF_EDITOR_INSTRUMENTATION_LOG', '')
+
+# Report of the operation running in the current thread (or job), if it is measured
+_current_report = contextvars.ContextVar('current_report', default=None)
+
+_log_lock = threading.Lock()
+_tracing_lock = threading.Lock()
+# Reports of the operations whose memory is being traced
+_traced_reports = set()
+
+
+class OperationReport:
+    """
+    The measurements of one operation: the time spent in each phase (parse,
+    copy, write, ...), the bytes and pages read and written, and optionally
+    the peak memory allocated above the level at its start.
+
+    Phases can be nested (the parse of a file inside the 'extract' call) and
+    the ones run by several threads (e.g. the parts of a split) add up, so
+    their sum can exceed the duration of the operation. Memory is traced for the
+    whole process, whose peak cannot be told apart between operations: an
+    operation that ran at the same time as another traced one gets no peak
+    memory (`memory_overlap` is set instead).
+    """
+
+    def __init__(self, operation: str, label: str = None):
+        self.operation = operation
+        self.label = label
+        self.started = time.time()
+        self.seconds = None
+        self.phases = {}
+        self.counts = {'bytes_in': 0, 'bytes_out': 0, 'pages_in': 0, 'pages_out': 0}
+        self.peak_memory = None
+        self.memory_overlap = False
+        self.status = 'running'
+        self.error = None
+        self._lock = threading.Lock()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_counts(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                self.counts[name] = self.counts.get(name, 0) + value
+
+    def to_dict(self) -> dict:
+        return {'operation': self.operation, 'label': self.label,
+                'started': datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                'seconds': self.seconds, 'phases': dict(self.phases), **self.counts,
+                'peak_memory_bytes': self.peak_memory, 'memory_overlap': self.memory_overlap, 'status': self.status, 'error': self.error}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+
+def _start_tracing(report: OperationReport) -> int:
+    with _tracing_lock:
+        if not _traced_reports:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+        else:
+            # the peak is process-wide: it is only meaningful for an operation traced alone,
+            # so it is not reset under the operations already running
+            report.memory_overlap = True
+            for other in _traced_reports:
+                other.memory_overlap = True
+        _traced_reports.add(report)
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _stop_tracing(report: OperationReport) -> int:
+    with _tracing_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _traced_reports.discard(report)
+        if not _traced_reports:
+            tracemalloc.stop()
+        return peak
+
+
+@contextmanager
+def measure(operation: str, label: str = None, sink: list = None, trace_memory: bool = None):
+    """
+    Measure an operation: the phases and counts recorded while it runs (in
+    this thread, or in functions wrapped with `propagate`) go to its report.
+
+    The finished report is appended to `sink` and to `INSTRUMENTATION_LOG`.
+
+    Args:
+        operation (str): The name of the operation, such as 'extract'.
+        label (str, optional): A description, such as the name of the file.
+        sink (list, optional): A list the report is appended to once finished.
+        trace_memory (bool, optional): Trace the peak memory of the operation.
+                                       Defaults to `INSTRUMENTATION == 'memory'`.
+    """
+    if trace_memory is None:
+        trace_memory = INSTRUMENTATION == 'memory'
+
+    report = OperationReport(operation, label)
+    token = _current_report.set(report)
+    memory_at_start = _start_tracing(report) if trace_memory else None
+    started = time.perf_counter()
+
+    try:
+        yield report
+        report.status = 'done'
+    except BaseException as e:
+        report.status = 'failed'
+        report.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        report.seconds = time.perf_counter() - started
+        if trace_memory:
+            peak = _stop_tracing(report)
+            if not report.memory_overlap:
+                report.peak_memory = max(0, peak - memory_at_start)
+        _current_report.reset(token)
+
+        if sink is not None:
+            sink.append(report)
+        if INSTRUMENTATION_LOG:
+            with _log_lock, open(INSTRUMENTATION_LOG, 'a', encoding='utf-8') as f:
+                f.write(report.to_json() + '\n')
+
+
+@contextmanager
+def phase(name: str):
+    """Time a phase of the operation being measured; does nothing if none is."""
+    report = _current_report.get()
+    if report is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        report.add_phase(name, time.perf_counter() - started)
+
+
+def record(**counts) -> None:
+    """Add to the counts (bytes_in, bytes_out, pages_in, pages_out) of the operation being measured."""
+    report = _current_report.get()
+    if report is not None:
+        report.add_counts(**counts)
+
+
+def instrumented(operation: str):
+    """
+    Decorate a function so each call is a phase of the operation being
+    measured or, with `INSTRUMENTATION` on, an operation of its own.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current_report.get() is not None:
+                with phase(operation):
+                    return function(*args, **kwargs)
+            if INSTRUMENTATION != 'off':
+                with measure(operation):
+                    return function(*args, **kwargs)
+            return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(function):
+    """Return a version of `function` that records into the current operation from any thread."""
+    report = _current_report.get()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _current_report.set(report)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_report.reset(token)
+    return wrapper
@@ -0,0 +1,208 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from scripts.governor import MEMORY_BUDGET, ResourceGovernor, estimate_memory
+from scripts.instrumentation import measure
+
+
+## Background jobs, so long operations do not block the app
+
+# Number of jobs running at the same time, for all sessions together
+JOB_WORKERS = int(os.environ.get('PDF_EDITOR_JOB_WORKERS', 2))
+
+# Seconds a finished job (and its output) is kept before being dropped
+JOB_RESULT_TTL = 3600
+
+
+class JobCancelled(Exception):
+    """Raised inside a job to stop it once its cancellation is requested."""
+
+
+class Job:
+    """
+    An operation running in the job queue.
+
+    The work function receives the `progress` method of the job: calling it
+    with the number of pages done and the total updates the job, and raises
+    `JobCancelled` once `cancel` has been called, which stops the work at the
+    next page.
+
+    Status goes from 'queued' to 'running', then to 'done', 'failed' or 'cancelled'.
+    While queued, `position` is its place in the line of the resource governor.
+    """
+
+    def __init__(self, job_id: str, label: str, governor: ResourceGovernor = None, ticket=None):
+        self.id = job_id
+        self.label = label
+        self.status = 'queued'
+        self.pages_done = 0
+        self.pages_total = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.report = None
+        self._cancel_requested = threading.Event()
+        self._future = None
+        self._governor = governor
+        self._ticket = ticket
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    @property
+    def position(self) -> int:
+        """Return the place of the job in line, from 1, or 0 once it runs."""
+        if self.status != 'queued' or self._ticket is None:
+            return 0
+        return self._governor.position(self._ticket)
+
+    @property
+    def fraction(self) -> float:
+        """Return the fraction of the pages done, between 0 and 1."""
+        if not self.pages_total:
+            return 0.0
+        return min(1.0, self.pages_done / self.pages_total)
+
+    def progress(self, done: int, total: int) -> None:
+        self.pages_done = done
+        self.pages_total = total
+        if self._cancel_requested.is_set():
+            raise JobCancelled()
+
+    def cancel(self) -> None:
+        """Stop the job, right away if it has not started yet or at the next page otherwise."""
+        self._cancel_requested.set()
+        if self._ticket is not None:
+            self._governor.withdraw(self._ticket)
+        if self._future is not None and self._future.cancel():
+            # admitted but never started: give its reservation back
+            if self._ticket is not None:
+                self._governor.release(self._ticket)
+            self._finish('cancelled')
+
+    def _finish(self, status: str) -> None:
+        self.status = status
+        self.finished = time.time()
+
+    def _run(self, work, operation: str = None, sink: list = None) -> None:
+        # wait for the governor to admit the job, unless it is cancelled meanwhile
+        if self._ticket is not None and not self._governor.wait(self._ticket):
+            self._finish('cancelled')
+            return
+        try:
+            if self._cancel_requested.is_set():
+                self._finish('cancelled')
+                return
+            self.status = 'running'
+            self._work(work, operation, sink)
+        finally:
+            if self._ticket is not None:
+                self._governor.release(self._ticket)
+
+    def _work(self, work, operation: str = None, sink: list = None) -> None:
+        measured = measure(operation, self.label, sink) if operation else nullcontext()
+        try:
+            with measured as report:
+                self.report = report
+                if report is not None:
+                    report.add_phase('queued', time.time() - self.created)
+                self.result = work(self.progress)
+        except JobCancelled:
+            self._finish('cancelled')
+        except Exception as e:
+            self.error = e
+            self._finish('failed')
+        else:
+            self._finish('done')
+
+
+class JobQueue:
+    """
+    A pool of worker threads and the registry of the jobs submitted to it.
+
+    The registry lives in the process, so it is shared by every session; each
+    session only keeps the ids of its own jobs. Jobs are admitted by a
+    `ResourceGovernor`, in order, within both the number of workers and the
+    memory budget estimated from the size of their input.
+
+    Args:
+        max_workers (int): The number of jobs running at the same time.
+        result_ttl (float): Seconds a finished job is kept in the registry.
+        memory_budget (int): The estimated memory, in bytes, of the jobs running
+                             at the same time.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, result_ttl: float = JOB_RESULT_TTL,
+                 memory_budget: int = MEMORY_BUDGET):
+        self.result_ttl = result_ttl
+        self.governor = ResourceGovernor(max_workers, memory_budget)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, work, label: str, operation: str = None, sink: list = None,
+               input_bytes: int = 0) -> Job:
+        """
+        Queue `work`, a function taking the progress callback of the job and
+        returning its result, and return the job.
+
+        `input_bytes`, the size of the files the job reads, sets the memory
+        reserved for it while it runs.
+
+        With `operation`, the job is measured (see `scripts.instrumentation.measure`)
+        under that name, with the time it waited in the queue as its 'queued'
+        phase; its report is the `report` attribute of the job and is appended
+        to `sink` once the job ends.
+
+        Raises:
+            OperationTooLarge: If the input could not fit in the memory budget.
+        """
+        self._prune()
+        cost = estimate_memory(input_bytes)
+        self.governor.check(cost)
+        # the workers take the jobs in the order of the governor line
+        with self._lock:
+            job = Job(f'job-{next(self._ids)}', label, self.governor, self.governor.enqueue(cost))
+            self._jobs[job.id] = job
+            job._future = self._executor.submit(job._run, work, operation, sink)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """Return the job with this id, or None if it is unknown or was dropped."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def remove(self, job_id: str) -> None:
+        """Cancel a job if it is still active and drop it from the registry."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None and job.active:
+            job.cancel()
+
+    def _prune(self) -> None:
+        # finished jobs hold their output, drop the ones nobody came back for
+        expired = time.time() - self.result_ttl
+        with self._lock:
+            for job_id in [job.id for job in self._jobs.values() if job.finished and job.finished < expired]:
+                del self._jobs[job_id]
+
+
+## Process-wide queue shared by the app sessions
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
@@ -1,10 +1,18 @@
-import io
+import os
+
+from scripts.document_cache import load_documents
+from scripts.instrumentation import instrumented
+from scripts.page_plan import PagePlan
+
+# Number of threads parsing the files of a merge; 1 parses them one after another
+MERGE_WORKERS = int(os.environ.get('PDF_EDITOR_MERGE_WORKERS', 1))
 
-from PyPDF2 import PdfReader, PdfWriter
 
 ## Merge PDF files
 
-def merge_files(files: list):
+@instrumented('merge')
+def merge_files(files: list, as_plan: bool = False, deduplicate: bool = False,
+                max_workers: int = None, use_processes: bool = False):
     """
     Merges multiple PDF files into a single PDF file.
 
@@ -16,23 +24,33 @@ def merge_files(files: list):
         files (list[str]): A list of paths to the PDF files to merge.
         output_dir (str, optional): The folder where the new, merged PDF
                                     will be saved. Defaults to './output'.
+        as_plan (bool, optional): Return a `PagePlan` to chain with other
+                                  actions instead of writing the output file.
+        deduplicate (bool, optional): Write the fonts, images and other resources
+                                      shared by the files only once.
+        max_workers (int, optional): Parse the files with this many threads (or
+                                     processes). Defaults to `MERGE_WORKERS`.
+        use_processes (bool, optional): Parse the files in worker processes,
+                                        using several cores.
     """
+    if max_workers is None:
+        max_workers = MERGE_WORKERS
 
-    # create a writer object
-    writer = PdfWriter()
+    # parse the files concurrently; the pages are still assembled in the given
+    # order, so the output is the same as when parsing them one by one
+    if max_workers > 1 and len(files) > 1:
+        load_documents(files, max_workers, use_processes)
+
+    # add all pages from each file, in order
+    plan = PagePlan.from_files(files)
 
-    # read the pdf files and add them to writer object
-    for file in files:
-         reader = PdfReader(file)
-        
-         # add all pages from reader
-         writer.append_pages_from_reader(reader)
-    
     # create output filename
     output_filename = 'merged_file.pdf'
 
-    # create a memory buffer to store output pdf
-    output_buffer = io.BytesIO()
-    writer.write(output_buffer)
+    if as_plan:
+        return plan, output_filename
+
+    # write the output pdf, spilled to disk when it is large
+    output_buffer = plan.write(deduplicate=deduplicate)
 
-    return output_buffer, output_filename
\ No newline at end of file
+    return output_buffer, output_filename
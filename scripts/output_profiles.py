@@ -0,0 +1,526 @@
+import io
+import os
+import zlib
+from typing import TYPE_CHECKING
+
+# PyPDF2 is imported by the functions writing files: the app reads the profiles
+# as soon as it starts, before any file is uploaded
+if TYPE_CHECKING:
+    from PyPDF2 import PdfWriter
+    from PyPDF2.generic import StreamObject
+
+
+## Output profiles: trade writing time for a smaller file
+
+# Description of each profile, from the fastest to write to the smallest output,
+# then the one for files viewed over the network
+OUTPUT_PROFILES = {
+    'default': 'Written as is, fastest to process.',
+    'compressed': 'Uncompressed streams (page contents, raw images) are compressed '
+                  'and objects no page uses anymore are dropped.',
+    'compact': 'Like compressed, and the other objects are packed into compressed '
+               'object streams with a cross-reference stream (PDF 1.5). Smallest file.',
+    'linearized': 'Like compressed, and linearized for fast web view: the first page and '
+                  'hint tables locating the others come first, so viewers show the first '
+                  'pages before the whole file is downloaded.',
+}
+
+# Profile used when none is given
+OUTPUT_PROFILE = os.environ.get('PDF_EDITOR_OUTPUT_PROFILE', 'default')
+
+# Streams smaller than this are not worth compressing
+_MIN_COMPRESS_SIZE = 64
+
+# Large streams are only compressed if a sample of this size compresses well
+# (already compressed data such as embedded fonts or JPEG images does not)
+_SAMPLE_SIZE = 8192
+
+# Number of objects packed in each object stream
+_OBJECTS_PER_STREAM = 100
+
+_BINARY_COMMENT = b'%\xe2\xe3\xcf\xd3\n'
+
+_FILTER_ENTRY = b'/Filter /FlateDecode '
+
+
+def compress_streams(writer: 'PdfWriter') -> int:
+    """
+    Compress the streams of `writer` that have no filter with Flate, keeping
+    the original data when compression does not make the object smaller.
+
+    Returns:
+        int: The number of streams compressed.
+    """
+    from PyPDF2.generic import NameObject, StreamObject
+
+    compressed = 0
+    for obj in writer._objects:
+        if not isinstance(obj, StreamObject) or '/Filter' in obj or '/DecodeParms' in obj:
+            continue
+        data = obj._data
+        if len(data) < _MIN_COMPRESS_SIZE:
+            continue
+        if len(data) > 2 * _SAMPLE_SIZE and len(zlib.compress(data[:_SAMPLE_SIZE], 1)) > 0.9 * _SAMPLE_SIZE:
+            continue
+        packed = zlib.compress(data)
+        # the filter entry added to the dictionary has to be paid for too
+        if len(packed) + len(_FILTER_ENTRY) < len(data):
+            obj._data = packed
+            obj[NameObject('/Filter')] = NameObject('/FlateDecode')
+            compressed += 1
+    return compressed
+
+
+def _reachable(writer: 'PdfWriter') -> list:
+    """Return the sorted numbers of the objects reachable from the catalog and the document info."""
+    from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject
+
+    seen = set()
+    stack = [writer._root, writer._info]
+
+    while stack:
+        data = stack.pop()
+        if isinstance(data, IndirectObject):
+            if data.pdf is not writer or data.idnum in seen:
+                continue
+            seen.add(data.idnum)
+            stack.append(writer._objects[data.idnum - 1])
+        elif isinstance(data, DictionaryObject):
+            stack.extend(data.values())
+        elif isinstance(data, ArrayObject):
+            stack.extend(data)
+
+    return sorted(seen)
+
+
+def _serialize(obj) -> bytes:
+    buffer = io.BytesIO()
+    obj.write_to_stream(buffer, None)
+    return buffer.getvalue()
+
+
+def write_packed(writer: 'PdfWriter', output, object_streams: bool = True) -> None:
+    """
+    Write the PDF held by `writer`, leaving out the objects nothing refers to.
+
+    Object numbers are kept, the numbers of dropped objects become free
+    entries. With `object_streams`, every object except streams is packed into
+    Flate-compressed object streams and the cross-reference table is itself a
+    compressed stream.
+
+    Args:
+        writer (PdfWriter): The writer with the pages of the output file.
+        output: The binary stream written to, with `write` and `tell`.
+        object_streams (bool, optional): Pack the objects into object streams.
+    """
+    from PyPDF2.generic import ArrayObject, DictionaryObject, NameObject, NumberObject, StreamObject
+
+    # same preparation as PdfWriter.write
+    writer._sweep_indirect_references(writer._root)
+
+    header = writer.pdf_header
+    if object_streams and header < b'%PDF-1.5':
+        header = b'%PDF-1.5'
+    output.write(header + b'\n' + _BINARY_COMMENT)
+
+    numbers = _reachable(writer)
+    packed = [n for n in numbers if object_streams and not isinstance(writer._objects[n - 1], StreamObject)]
+    direct = [n for n in numbers if not object_streams or isinstance(writer._objects[n - 1], StreamObject)]
+
+    # cross-reference entries: (1, offset, 0) for objects in the file, (2, stream number, index) for packed ones
+    entries = {}
+    for number in direct:
+        entries[number] = (1, output.tell(), 0)
+        output.write(b'%d 0 obj\n' % number)
+        writer._objects[number - 1].write_to_stream(output, None)
+        output.write(b'\nendobj\n')
+
+    next_number = len(writer._objects) + 1
+    for first in range(0, len(packed), _OBJECTS_PER_STREAM):
+        offsets, body = [], io.BytesIO()
+        for index, number in enumerate(packed[first:first + _OBJECTS_PER_STREAM]):
+            offsets.append(b'%d %d' % (number, body.tell()))
+            entries[number] = (2, next_number, index)
+            writer._objects[number - 1].write_to_stream(body, None)
+            body.write(b'\n')
+
+        offset_table = b' '.join(offsets) + b'\n'
+        data = zlib.compress(offset_table + body.getvalue())
+        entries[next_number] = (1, output.tell(), 0)
+        output.write(b'%d 0 obj\n<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >>\nstream\n'
+                     % (next_number, len(offsets), len(offset_table), len(data)))
+        output.write(data)
+        output.write(b'\nendstream\nendobj\n')
+        next_number += 1
+
+    trailer = DictionaryObject({NameObject('/Root'): writer._root, NameObject('/Info'): writer._info})
+    if hasattr(writer, '_ID'):
+        trailer[NameObject('/ID')] = writer._ID
+
+    xref_location = output.tell()
+    if object_streams:
+        # the cross-reference stream is the last object and lists itself
+        entries[next_number] = (1, xref_location, 0)
+        size = next_number + 1
+        offset_width = max(1, (xref_location.bit_length() + 7) // 8)
+        rows = bytearray()
+        for number in range(size):
+            kind, field, index = entries.get(number, (0, 0, 65535 if number == 0 else 0))
+            rows += bytes([kind]) + field.to_bytes(offset_width, 'big') + index.to_bytes(2, 'big')
+        data = zlib.compress(bytes(rows))
+
+        trailer.update({NameObject('/Type'): NameObject('/XRef'), NameObject('/Size'): NumberObject(size),
+                        NameObject('/W'): ArrayObject([NumberObject(1), NumberObject(offset_width), NumberObject(2)]),
+                        NameObject('/Filter'): NameObject('/FlateDecode'),
+                        NameObject('/Length'): NumberObject(len(data))})
+        output.write(b'%d 0 obj\n' % next_number + _serialize(trailer) + b'\nstream\n')
+        output.write(data)
+        output.write(b'\nendstream\nendobj\n')
+    else:
+        size = len(writer._objects) + 1
+        output.write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+        for number in range(1, size):
+            if number in entries:
+                output.write(b'%010d 00000 n \n' % entries[number][1])
+            else:
+                output.write(b'0000000000 00000 f \n')
+        trailer[NameObject('/Size')] = NumberObject(size)
+        output.write(b'trailer\n' + _serialize(trailer))
+
+    output.write(b'\nstartxref\n%d\n%%%%EOF\n' % xref_location)
+
+
+## Linearized output: the first page first, for viewers reading over the network
+
+class _ByteCounter:
+    """Output stream that only counts the bytes written to it."""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data) -> None:
+        self.size += len(data)
+
+
+class _BitWriter:
+    """Packs unsigned integers, most significant bit first, into the data of a hint table."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self._value = 0
+        self._bits = 0
+
+    def write(self, value: int, bits: int) -> None:
+        self._value = (self._value << bits) | value
+        self._bits += bits
+        while self._bits >= 8:
+            self._bits -= 8
+            self.data.append((self._value >> self._bits) & 0xFF)
+        self._value &= (1 << self._bits) - 1
+
+    def write_item(self, values, bits: int) -> None:
+        """Write the value of an item for every page or group; each item starts on a byte boundary."""
+        for value in values:
+            self.write(value, bits)
+        if self._bits:
+            self.write(0, 8 - self._bits)
+
+
+def _pages_and_tree(writer: 'PdfWriter') -> tuple:
+    """Return the object numbers of the pages, in order, and the set of the page tree nodes."""
+    pages, nodes = [], set()
+    stack = [writer._pages]
+    while stack:
+        reference = stack.pop()
+        node = writer._objects[reference.idnum - 1]
+        if node.get('/Type') == '/Pages':
+            nodes.add(reference.idnum)
+            stack.extend(reversed(node['/Kids']))
+        else:
+            pages.append(reference.idnum)
+    return pages, nodes
+
+
+def _page_objects(writer: 'PdfWriter', page: int, stops: set) -> list:
+    """
+    Return the numbers of the objects a page uses, the page object first,
+    without following references to the page tree or to other pages.
+    """
+    from PyPDF2.generic import IndirectObject
+
+    # the PDF object classes are protocols, slow to check with isinstance: their
+    # builtin bases are checked instead
+    objects, seen = [page], {page}
+    stack = [writer._objects[page - 1]]
+    while stack:
+        data = stack.pop()
+        if type(data) is IndirectObject:
+            if data.pdf is not writer or data.idnum in stops or data.idnum in seen:
+                continue
+            seen.add(data.idnum)
+            objects.append(data.idnum)
+            stack.append(writer._objects[data.idnum - 1])
+        elif isinstance(data, dict):
+            stack.extend(reversed(list(data.values())))
+        elif isinstance(data, list):
+            stack.extend(reversed(data))
+    return objects
+
+
+def _renumber(writer: 'PdfWriter', numbers: dict) -> None:
+    """Make the references between the objects of `writer` use the new numbers of `numbers`."""
+    from PyPDF2.generic import IndirectObject
+
+    for number in numbers:
+        stack = [writer._objects[number - 1]]
+        while stack:
+            data = stack.pop()
+            if isinstance(data, dict):
+                entries = data.items()
+            elif isinstance(data, list):
+                entries = enumerate(data)
+            else:
+                continue
+            for key, value in list(entries):
+                if type(value) is not IndirectObject:
+                    if isinstance(value, (dict, list)):
+                        stack.append(value)
+                elif value.pdf is writer:
+                    # the new reference belongs to no document, so it is not renumbered twice
+                    data[key] = IndirectObject(numbers[value.idnum], 0, None)
+
+
+def _stream_size(stream: 'StreamObject') -> int:
+    """Return the size of a stream once written, without copying its data."""
+    counter = _ByteCounter()
+    stream.write_to_stream(counter, None)
+    return counter.size
+
+
+def _hint_tables(pages: list, first_page_objects: list, shared_objects: list, sizes: dict,
+                 first_page_offset: int, shared_start: tuple) -> tuple:
+    """
+    Return the data of the page offset and shared object hint tables, and the
+    position of the shared object table in it.
+
+    Args:
+        pages (list): For each page, the numbers of its objects, the page object
+                      first, and the indexes in the shared object table of the
+                      shared objects it uses.
+        first_page_objects (list): The numbers of the objects of the first page,
+                                   listed first in the shared object table.
+        shared_objects (list): The numbers of the objects used by several pages.
+        sizes (dict): The size in bytes of each object, by number.
+        first_page_offset (int): The offset of the first page object, as if
+                                 there was no hint stream.
+        shared_start (tuple): The number and the offset, as if there was no hint
+                              stream, of the first object of the shared objects
+                              section, or of the object after it if it is empty.
+    """
+    object_counts = [len(objects) for objects, _ in pages]
+    lengths = [sum(sizes[number] for number in objects) for objects, _ in pages]
+    references = [identifiers for _, identifiers in pages]
+    least_objects, least_length = min(object_counts), min(lengths)
+    object_bits = (max(object_counts) - least_objects).bit_length()
+    length_bits = (max(lengths) - least_length).bit_length()
+    count_bits = max(len(identifiers) for identifiers in references).bit_length()
+    identifier_bits = max((max(identifiers, default=0) for identifiers in references)).bit_length()
+
+    # page offset hint table; the content of each page is given as the whole
+    # page, which is what readers use
+    table = _BitWriter()
+    for value, bits in ((least_objects, 32), (first_page_offset, 32), (object_bits, 16), (least_length, 32),
+                        (length_bits, 16), (0, 32), (0, 16), (least_length, 32), (length_bits, 16),
+                        (count_bits, 16), (identifier_bits, 16), (0, 16), (1, 16)):
+        table.write(value, bits)
+    table.write_item((count - least_objects for count in object_counts), object_bits)
+    table.write_item((length - least_length for length in lengths), length_bits)
+    table.write_item((len(identifiers) for identifiers in references), count_bits)
+    table.write_item((identifier for identifiers in references for identifier in identifiers), identifier_bits)
+    table.write_item((), 0)
+    table.write_item((), 0)
+    table.write_item((length - least_length for length in lengths), length_bits)
+
+    # shared object hint table, with a group per object, the first page's objects first
+    shared_table = len(table.data)
+    groups = [sizes[number] for number in first_page_objects + shared_objects]
+    least_group = min(groups)
+    group_bits = (max(groups) - least_group).bit_length()
+    for value, bits in ((shared_start[0], 32), (shared_start[1], 32),
+                        (len(first_page_objects), 32), (len(groups), 32), (0, 16),
+                        (least_group, 32), (group_bits, 16)):
+        table.write(value, bits)
+    table.write_item((size - least_group for size in groups), group_bits)
+    table.write_item((0 for _ in groups), 1)
+
+    return bytes(table.data), shared_table
+
+
+def write_linearized(writer: 'PdfWriter', output) -> None:
+    """
+    Write the PDF held by `writer` linearized ("fast web view"), leaving out
+    the objects nothing refers to.
+
+    The file starts with the linearization dictionary, the cross-reference
+    table of the first page, the catalog, the hint tables and the objects of
+    the first page. Each other page follows with the objects only it uses,
+    then come the objects shared by several pages and the rest of the
+    document. A viewer reading the file with byte-range requests shows the
+    first page once the beginning of the file is in, and finds the others
+    from the hint tables. Objects are renumbered in file order, as the hint
+    tables require.
+
+    Args:
+        writer (PdfWriter): The writer with the pages of the output file.
+        output: The binary stream written to, with `write` and `tell`.
+    """
+    from PyPDF2.generic import StreamObject
+
+    # same preparation as PdfWriter.write
+    writer._sweep_indirect_references(writer._root)
+
+    page_numbers, tree_nodes = _pages_and_tree(writer)
+    if not page_numbers:
+        write_packed(writer, output, object_streams=False)
+        return
+
+    # the objects of each page, and the pages using each object
+    stops = set(page_numbers) | tree_nodes
+    page_objects = [_page_objects(writer, page, stops) for page in page_numbers]
+    users = {}
+    for index, objects in enumerate(page_objects):
+        for number in objects:
+            users[number] = users.get(number, 0) + 1
+
+    first_page = page_objects[0]
+    in_first_page = set(first_page)
+    private = [[number for number in objects if users[number] == 1] for objects in page_objects[1:]]
+    shared = [number for number in users if users[number] > 1 and number not in in_first_page]
+    catalog = writer._root.idnum
+    others = [number for number in _reachable(writer) if number not in users and number != catalog]
+
+    # number the objects in file order: the main section (the other pages, the
+    # shared objects and the rest) first, then the first page section, which
+    # comes first in the file after the linearization dictionary
+    main_section = [number for objects in private for number in objects] + shared + others
+    numbers = {old: new for new, old in enumerate(main_section, 1)}
+    linearization_number = len(main_section) + 1
+    catalog_number, hint_number = linearization_number + 1, linearization_number + 2
+    numbers[catalog] = catalog_number
+    numbers.update((old, new) for new, old in enumerate(first_page, hint_number + 1))
+    size = hint_number + 1 + len(first_page)
+
+    _renumber(writer, numbers)
+    # objects are serialized once to know their size, except streams, which are
+    # only measured and written straight to the output
+    streams, serialized = {}, {}
+    for old, new in numbers.items():
+        obj = writer._objects[old - 1]
+        if isinstance(obj, StreamObject):
+            streams[new] = obj
+        else:
+            serialized[new] = _serialize(obj)
+    sizes = {number: len(b'%d 0 obj\n' % number) + len(data) + len(b'\nendobj\n')
+             for number, data in serialized.items()}
+    sizes.update((number, len(b'%d 0 obj\n' % number) + _stream_size(stream) + len(b'\nendobj\n'))
+                 for number, stream in streams.items())
+    first_page_section = list(range(hint_number + 1, size))
+    main_section_numbers = list(range(1, linearization_number))
+
+    # the numbers of the linearization dictionary and the first trailer have a
+    # fixed width, so the offsets can be computed before they are known
+    def linearization_dictionary(length, hint_offset, hint_length, first_page_end, main_xref_entries):
+        return (b'%d 0 obj\n<< /Linearized 1 /L %10d /H [ %10d %10d ] /O %d /E %10d /N %d /T %10d >>\nendobj\n'
+                % (linearization_number, length, hint_offset, hint_length, hint_number + 1, first_page_end,
+                   len(page_numbers), main_xref_entries))
+
+    trailer = b'/Size %d /Root %d 0 R /Info %d 0 R' % (size, catalog_number, numbers[writer._info.idnum])
+    if hasattr(writer, '_ID'):
+        trailer += b' /ID ' + _serialize(writer._ID)
+
+    def first_page_xref(offsets, main_xref):
+        entries = (b'%010d 00000 n \n' % offsets.get(number, 0) for number in range(linearization_number, size))
+        return (b'xref\n%d %d\n' % (linearization_number, size - linearization_number) + b''.join(entries)
+                + b'trailer\n<< %s /Prev %10d >>\nstartxref\n0\n%%%%EOF\n' % (trailer, main_xref))
+
+    header = max(writer.pdf_header, b'%PDF-1.2') + b'\n' + _BINARY_COMMENT
+    first_xref_offset = len(header) + len(linearization_dictionary(0, 0, 0, 0, 0))
+    catalog_offset = first_xref_offset + len(first_page_xref({}, 0))
+    hint_offset = catalog_offset + sizes[catalog_number]
+
+    # offsets of the objects after the hint stream as if it was not there, as the hint tables give them
+    offsets = {}
+    position = hint_offset
+    for number in first_page_section + main_section_numbers:
+        offsets[number] = position
+        position += sizes[number]
+
+    # the shared object table lists the objects of the first page, then the shared objects
+    identifiers = {number: index for index, number in enumerate(first_page + shared)}
+    pages = [([numbers[number] for number in first_page], [])]
+    for objects, page_private in zip(page_objects[1:], private):
+        pages.append(([numbers[number] for number in page_private],
+                      sorted(identifiers[number] for number in objects if users[number] > 1)))
+    shared_numbers = [numbers[number] for number in shared]
+    shared_start = sum(len(page_private) for page_private in private) + 1
+    hint_data, shared_table = _hint_tables(pages, first_page_section, shared_numbers, sizes, hint_offset,
+                                           (shared_start, offsets.get(shared_start, position)))
+    hint_data = zlib.compress(hint_data)
+    hint_stream = (b'%d 0 obj\n<< /S %d /Filter /FlateDecode /Length %d >>\nstream\n'
+                   % (hint_number, shared_table, len(hint_data)) + hint_data + b'\nendstream\nendobj\n')
+
+    # actual offsets
+    for number in offsets:
+        offsets[number] += len(hint_stream)
+    offsets.update({linearization_number: len(header), catalog_number: catalog_offset, hint_number: hint_offset})
+    first_page_end = hint_offset + len(hint_stream) + sum(sizes[number] for number in first_page_section)
+    main_xref = position + len(hint_stream)
+    main_xref_head = b'xref\n0 %d' % linearization_number
+    main_xref_table = (main_xref_head + b'\n0000000000 65535 f \n'
+                       + b''.join(b'%010d 00000 n \n' % offsets[number] for number in main_section_numbers)
+                       + b'trailer\n<< /Size %d >>\n' % linearization_number
+                       # readers that do not know linearization start from the first page table
+                       + b'startxref\n%d\n%%%%EOF\n' % first_xref_offset)
+
+    def write_object(number):
+        if number in streams:
+            output.write(b'%d 0 obj\n' % number)
+            streams[number].write_to_stream(output, None)
+            output.write(b'\nendobj\n')
+        else:
+            output.write(b'%d 0 obj\n' % number + serialized[number] + b'\nendobj\n')
+
+    output.write(header)
+    output.write(linearization_dictionary(main_xref + len(main_xref_table), hint_offset, len(hint_stream),
+                                          first_page_end, main_xref + len(main_xref_head)))
+    output.write(first_page_xref(offsets, main_xref))
+    write_object(catalog_number)
+    output.write(hint_stream)
+    for number in first_page_section + main_section_numbers:
+        write_object(number)
+    output.write(main_xref_table)
+
+
+def write_with_profile(writer: 'PdfWriter', output, profile: str = None) -> None:
+    """
+    Write the PDF held by `writer` to `output` with an output profile.
+
+    Args:
+        writer (PdfWriter): The writer with the pages of the output file.
+        output: The binary stream written to, with `write` and `tell`.
+        profile (str, optional): One of `OUTPUT_PROFILES`. Defaults to `OUTPUT_PROFILE`.
+    """
+    profile = profile or OUTPUT_PROFILE
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile '{profile}', expected one of {', '.join(OUTPUT_PROFILES)}")
+
+    # encrypted outputs are written by PyPDF2, which encrypts each object
+    if profile == 'default' or hasattr(writer, '_encrypt'):
+        writer.write(output)
+        return
+
+    compress_streams(writer)
+    if profile == 'linearized':
+        write_linearized(writer, output)
+    else:
+        write_packed(writer, output, object_streams=(profile == 'compact'))
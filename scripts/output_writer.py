@@ -0,0 +1,203 @@
+import io
+import os
+import shutil
+import tempfile
+
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2._utils import _get_max_pdf_version_header
+from PyPDF2.generic import NameObject, NumberObject
+
+from scripts.instrumentation import measure, record
+from scripts.output_profiles import write_with_profile
+
+
+## Output buffers that spill to disk
+
+# Outputs larger than this many bytes are moved from memory to a temporary file.
+# Set the variable to 0 to always write the output to disk.
+SPILL_THRESHOLD = int(os.environ.get('PDF_EDITOR_SPILL_THRESHOLD', 32 * 1024 * 1024))
+
+# Size of the chunks yielded when streaming an output
+CHUNK_SIZE = 1024 * 1024
+
+
+def new_output_buffer(spill_threshold: int = None):
+    """
+    Create a binary buffer that is kept in memory until it grows past
+    `spill_threshold` bytes and is then transparently moved to a temporary file.
+
+    Args:
+        spill_threshold (int, optional): Size in bytes above which the buffer is
+                                         spilled to disk. Defaults to `SPILL_THRESHOLD`.
+    """
+    if spill_threshold is None:
+        spill_threshold = SPILL_THRESHOLD
+
+    # a spooled file with no maximum size never rolls over, so go to disk directly
+    if spill_threshold <= 0:
+        return tempfile.TemporaryFile(mode='w+b')
+    return tempfile.SpooledTemporaryFile(max_size=spill_threshold, mode='w+b')
+
+
+class _SpillingOutput:
+    """
+    Output stream for `PdfWriter.write` that starts in memory and moves to a
+    temporary file once it grows past the spill threshold.
+
+    `write` is bound straight to the method of the underlying file, so the many
+    small writes made for every object cost no Python call of their own. The
+    size is checked in `tell`, which the writer calls once before each object.
+    """
+
+    def __init__(self, spill_threshold: int):
+        self.spill_threshold = spill_threshold
+        self.file = io.BytesIO() if spill_threshold > 0 else tempfile.TemporaryFile(mode='w+b')
+        self.write = self.file.write
+
+    def tell(self) -> int:
+        position = self.file.tell()
+        if isinstance(self.file, io.BytesIO) and position > self.spill_threshold:
+            # move what has been written so far to disk, without copying it in memory
+            spilled_file = tempfile.TemporaryFile(mode='w+b')
+            spilled_file.write(self.file.getbuffer())
+            self.file = spilled_file
+            self.write = spilled_file.write
+        return position
+
+
+def write_output(writer: PdfWriter, spill_threshold: int = None, profile: str = None):
+    """
+    Write the PDF held by `writer` to a new output buffer, rewound and ready to be read.
+
+    Args:
+        writer (PdfWriter): The writer with the pages of the output file.
+        spill_threshold (int, optional): Size in bytes above which the output is
+                                         spilled to disk. Defaults to `SPILL_THRESHOLD`.
+        profile (str, optional): The output profile, one of `OUTPUT_PROFILES`.
+                                 Defaults to `OUTPUT_PROFILE`.
+    """
+    if spill_threshold is None:
+        spill_threshold = SPILL_THRESHOLD
+
+    output = _SpillingOutput(spill_threshold)
+    write_with_profile(writer, output, profile)
+    output_buffer = output.file
+    output_buffer.seek(0)
+    return output_buffer
+
+
+## Bulk page copy
+
+def add_pages(writer: PdfWriter, reader: PdfReader, indices, on_page=None) -> None:
+    """
+    Add the pages of `reader` at the given 0-indexed positions to `writer`, in order.
+
+    This gives the same document as calling `writer.add_page` for each page, but
+    the page list of the reader is resolved once and the page tree count and PDF
+    header of the writer are updated once for the whole batch.
+
+    Args:
+        writer (PdfWriter): The writer to add the pages to.
+        reader (PdfReader): The reader holding the pages.
+        indices (Iterable[int]): The 0-indexed numbers of the pages to add.
+        on_page (callable, optional): Called without arguments after each page
+                                      is added. An exception raised by it stops the copy.
+    """
+    # make sure the page tree of the reader is flattened, then index it directly;
+    # the page count of a decrypted file is read from its tree without flattening it
+    len(reader.pages)
+    if reader.flattened_pages is None:
+        reader._flatten()
+    source_pages = reader.flattened_pages
+
+    # same bookkeeping as PdfWriter._add_page, done once per batch
+    page_tree = writer.get_object(writer._pages)
+    kids = page_tree[NameObject('/Kids')]
+    translated = writer._id_translated.get(id(reader), {})
+    excluded_keys = ['/Parent', '/StructParents']
+
+    added = 0
+    for index in indices:
+        page = source_pages[index]
+
+        # a page added twice needs its own page dictionary
+        translated.pop(page.indirect_reference.idnum, None)
+
+        new_page = page.clone(writer, False, excluded_keys)
+        new_page[NameObject('/Parent')] = writer._pages
+        kids.append(new_page.indirect_reference)
+
+        # the translation table is created by the first clone from this reader
+        translated = writer._id_translated[id(reader)]
+        added += 1
+
+        if on_page is not None:
+            on_page()
+
+    if added:
+        page_tree[NameObject('/Count')] = NumberObject(page_tree['/Count'] + added)
+        header = reader.pdf_header
+        if isinstance(header, str):
+            header = header.encode()
+        writer.pdf_header = _get_max_pdf_version_header(writer.pdf_header, header)
+
+
+def iter_output(output_buffer, chunk_size: int = CHUNK_SIZE):
+    """Yield the content of an output buffer in chunks, from the beginning."""
+    output_buffer.seek(0)
+    while chunk := output_buffer.read(chunk_size):
+        yield chunk
+
+
+def save_output(output_buffer, path) -> None:
+    """Copy an output buffer to `path` without loading it whole into memory."""
+    output_buffer.seek(0)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(output_buffer, f, CHUNK_SIZE)
+
+
+def _download_stream(output_buffer):
+    """
+    Return an output buffer, rewound, as a file object `st.download_button`
+    reads directly: in-memory outputs as they are, outputs spilled to disk as
+    a raw file over the same temporary file.
+    """
+    output_buffer.seek(0)
+    if isinstance(output_buffer, tempfile.SpooledTemporaryFile):
+        # the in-memory or on-disk file behind the spooled file
+        output_buffer = output_buffer._file
+    if isinstance(output_buffer, io.BytesIO):
+        return output_buffer
+    stream = io.FileIO(output_buffer.fileno(), 'rb', closefd=False)
+    stream.seek(0)
+    return stream
+
+
+def download_data(output_buffer, sink: list = None, label: str = None):
+    """
+    Return the data to give to `st.download_button` for an output buffer.
+
+    The buffer is only read when the user clicks the button, so the output is
+    not copied into memory on every rerun of the script, and it is handed over
+    as a file object, rewound, rather than copied into bytes first.
+
+    Args:
+        output_buffer: The output buffer to download.
+        sink (list, optional): Measure each read as a 'download' operation and
+                               append its report to this list.
+        label (str, optional): The label of the download reports.
+    """
+    def read_output():
+        return _download_stream(output_buffer)
+
+    if sink is None:
+        return read_output
+
+    def measured_read_output():
+        with measure('download', label, sink):
+            stream = read_output()
+            record(bytes_out=stream.seek(0, 2))
+            stream.seek(0)
+        return stream
+
+    return measured_read_output
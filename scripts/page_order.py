@@ -0,0 +1,130 @@
+from array import array
+
+
+## Editing sessions: many page moves, one write
+
+class PageOrderSession:
+    """
+    The page order of a document being rearranged by many moves, with an
+    undo and redo history.
+
+    The order is a compact array of 1-indexed page numbers (4 bytes per page),
+    and each move is a rotation of the slice between the block and its new
+    place. The history keeps only the `(low, high, shift)` of each rotation,
+    so a move, an undo or a redo costs a slice copy of the array, whatever the
+    size of the pages, and nothing is written until the order is exported
+    with `rearrange_pages(file, order=session)`.
+
+    Page numbers given to `move` refer to the current order, as if each move
+    was run on the output of the previous one.
+
+    Args:
+        page_count (int): The number of pages of the document.
+    """
+
+    def __init__(self, page_count: int):
+        self.order = array('I', range(1, page_count + 1))
+        self._undo = []
+        self._redo = []
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __str__(self) -> str:
+        # runs of consecutive pages, as in a page spec
+        runs = []
+        for page in self.order:
+            if runs and page == runs[-1][1] + 1:
+                runs[-1][1] = page
+            else:
+                runs.append([page, page])
+        return ', '.join(str(first) if first == last else f'{first}-{last}' for first, last in runs)
+
+    @property
+    def moves(self) -> int:
+        """The number of moves applied (and not undone)."""
+        return len(self._undo)
+
+    @property
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    @property
+    def changed(self) -> bool:
+        """Whether the order differs from the original one."""
+        return self.order != array('I', range(1, len(self.order) + 1))
+
+    def _rotate(self, low: int, high: int, shift: int) -> None:
+        # order[low:high] starts `shift` items later
+        self.order[low:high] = self.order[low + shift:high] + self.order[low:low + shift]
+
+    def move(self, start: int, end: int, relative_pos: str, new_pos: int) -> bool:
+        """
+        Move the pages from `start` to `end` 'before' or 'after' page `new_pos`,
+        with the same meaning as in `rearrange_pages`. Return False, and record
+        nothing, if the move does not change the order.
+
+        Raises:
+            ValueError: If a page number is out of range or `relative_pos` is not valid.
+        """
+        page_count = len(self.order)
+        if not 1 <= start <= end <= page_count or not 1 <= new_pos <= page_count:
+            raise ValueError(f'Invalid move of pages {start}-{end} {relative_pos} page {new_pos}: pages '
+                             f'must be between 1 and {page_count} and the end page must not be before the start page.')
+        if relative_pos not in ('before', 'after'):
+            raise ValueError(f"Invalid relative position '{relative_pos}': use 'before' or 'after'.")
+
+        # a block moved inside itself or next to itself stays where it is
+        if (start <= new_pos <= end) or \
+           (relative_pos == 'after' and start == new_pos + 1) or \
+           (relative_pos == 'before' and end == new_pos - 1):
+            return False
+
+        # where the block starts once moved, counted without the block itself
+        final_pos = (new_pos - 1) - max(0, min(end, new_pos - 1) - (start - 1))
+        if relative_pos == 'after':
+            final_pos += 1
+
+        block_start, block_end = start - 1, end
+        if final_pos < block_start:
+            # the pages between the new place and the block shift right
+            rotation = (final_pos, block_end, block_start - final_pos)
+        else:
+            # the pages between the block and its new place shift left
+            rotation = (block_start, final_pos + block_end - block_start, block_end - block_start)
+
+        self._rotate(*rotation)
+        self._undo.append(rotation)
+        self._redo.clear()
+        return True
+
+    def undo(self) -> bool:
+        """Undo the last move. Return False if there is none."""
+        if not self._undo:
+            return False
+        low, high, shift = rotation = self._undo.pop()
+        self._rotate(low, high, high - low - shift)
+        self._redo.append(rotation)
+        return True
+
+    def redo(self) -> bool:
+        """Apply again the last move undone. Return False if there is none."""
+        if not self._redo:
+            return False
+        rotation = self._redo.pop()
+        self._rotate(*rotation)
+        self._undo.append(rotation)
+        return True
+
+    def reset(self) -> None:
+        """Go back to the original order and forget the history."""
+        self.order = array('I', range(1, len(self.order) + 1))
+        self._undo.clear()
+        self._redo.clear()
@@ -0,0 +1,305 @@
+from array import array
+from itertools import count, groupby
+from operator import itemgetter
+
+from PyPDF2 import PdfWriter
+
+from scripts.deduplicate import deduplicate_objects
+from scripts.document_cache import content_hash, file_size, get_document, locked, page_count
+from scripts.incremental_update import write_incremental
+from scripts.instrumentation import phase, record
+from scripts.output_writer import add_pages, write_output
+from scripts.page_spec import as_page_spec
+
+
+## Page plans: compose page operations and write the result once
+
+class PagePlan:
+    """
+    A lazy description of an output PDF as a list of page references.
+
+    Each page reference is a `(source_id, page_index)` tuple, where `source_id`
+    is the content hash of a source file and `page_index` is 0-indexed. The
+    page operations (extract, remove, select, drop, rearrange, reorder,
+    insert, insert_many, merge)
+    only record themselves in the plan; `resolve` folds them into the final
+    page order and `write` copies the pages into a single `PdfWriter`, so a
+    chain of operations costs one write instead of one per operation.
+
+    Page numbers given to the operations are 1-indexed and refer to the page
+    order left by the previous operation, exactly as if each operation was run
+    on the output of the previous one.
+    """
+
+    def __init__(self, sources: dict, pages: list, operations: list = None, name: str = None):
+        self.sources = sources
+        self.pages = pages
+        self.operations = operations or []
+        self.name = name
+
+    @classmethod
+    def from_file(cls, file) -> 'PagePlan':
+        """Create a plan holding all the pages of `file`."""
+        source_id = content_hash(file)
+        pages = [(source_id, i) for i in range(page_count(file))]
+        record(bytes_in=file_size(file), pages_in=len(pages))
+        return cls({source_id: file}, pages, name=getattr(file, 'name', None))
+
+    @classmethod
+    def from_files(cls, files: list) -> 'PagePlan':
+        """Create a plan holding all the pages of several files, one after another."""
+        plans = [as_page_plan(file) for file in files]
+        plan = plans[0]
+        for other in plans[1:]:
+            plan = plan.merge(other)
+        return plan
+
+    def _then(self, operation: tuple) -> 'PagePlan':
+        # plans are immutable, each operation returns a new plan
+        return PagePlan(self.sources, self.pages, self.operations + [operation], self.name)
+
+    ## Operations
+
+    def extract(self, start: int, end: int) -> 'PagePlan':
+        """Keep only the pages from `start` to `end` (inclusive)."""
+        return self._then(('extract', start, end))
+
+    def remove(self, start: int, end: int) -> 'PagePlan':
+        """Drop the pages from `start` to `end` (inclusive)."""
+        return self._then(('remove', start, end))
+
+    def select(self, spec) -> 'PagePlan':
+        """Keep only the pages matching a page spec (see `parse_page_spec`), in document order."""
+        return self._then(('select', as_page_spec(spec)))
+
+    def drop(self, spec) -> 'PagePlan':
+        """
+        Drop the pages matching a page spec (see `parse_page_spec`).
+
+        Raises:
+            ValueError: If the spec uses 'reverse', which has no meaning for
+                        removed pages (alone, it would select every page).
+        """
+        spec = as_page_spec(spec)
+        if spec.reverse:
+            raise ValueError(f"Invalid page spec '{spec.text}' for removing pages: 'reverse' "
+                             "only applies to the order of extracted pages.")
+        return self._then(('drop', spec))
+
+    def rearrange(self, start: int, end: int, relative_pos: str, new_pos: int) -> 'PagePlan':
+        """Move the pages from `start` to `end` 'before' or 'after' page `new_pos`."""
+        return self._then(('rearrange', start, end, relative_pos, new_pos))
+
+    def reorder(self, order) -> 'PagePlan':
+        """Put the pages in a new order, given as the page numbers in their new order."""
+        # a copy, so later changes to `order` do not change the plan
+        return self._then(('reorder', array('I', order)))
+
+    def insert(self, other: 'PagePlan', relative_pos: str, insert_pos: int) -> 'PagePlan':
+        """Insert the pages of another plan 'before' or 'after' page `insert_pos`."""
+        sources = {**self.sources, **other.sources}
+        return PagePlan(sources, self.pages,
+                        self.operations + [('insert', other.resolve(), relative_pos, insert_pos)],
+                        self.name)
+
+    def insert_many(self, insertions: list) -> 'PagePlan':
+        """
+        Insert the pages of several plans at once. Each insertion is a
+        `(plan, relative_pos, insert_pos)` tuple, and every `insert_pos` refers
+        to the pages before any of them is inserted. Plans inserted at the same
+        place keep their order in the list.
+        """
+        sources = dict(self.sources)
+        blocks = []
+        for other, relative_pos, insert_pos in insertions:
+            sources.update(other.sources)
+            blocks.append((other.resolve(), relative_pos, insert_pos))
+        return PagePlan(sources, self.pages, self.operations + [('insert_many', blocks)], self.name)
+
+    def merge(self, other: 'PagePlan') -> 'PagePlan':
+        """Append the pages of another plan at the end."""
+        sources = {**self.sources, **other.sources}
+        return PagePlan(sources, self.pages,
+                        self.operations + [('merge', other.resolve())],
+                        self.name)
+
+    ## Optimizer
+
+    def optimize(self) -> list:
+        """
+        Return the recorded operations with no-op operations dropped and
+        consecutive extractions fused into one.
+        """
+        optimized = []
+        for operation in self.operations:
+            kind = operation[0]
+
+            # moving a block next to itself does not change the page order
+            if kind == 'rearrange':
+                _, start, end, relative_pos, new_pos = operation
+                if (start <= new_pos <= end) or \
+                   (relative_pos == 'after' and start == new_pos + 1) or \
+                   (relative_pos == 'before' and end == new_pos - 1):
+                    continue
+
+            # inserting or merging nothing does not change the page order
+            if kind in ('insert', 'insert_many', 'merge') and not operation[1]:
+                continue
+
+            # an extraction of an extraction is a single, narrower extraction,
+            # which never goes past the end of the outer one
+            if kind == 'extract' and optimized and optimized[-1][0] == 'extract':
+                _, previous_start, previous_end = optimized[-1]
+                _, start, end = operation
+                optimized[-1] = ('extract', previous_start + start - 1,
+                                 min(previous_end, previous_start + end - 1))
+                continue
+
+            optimized.append(operation)
+
+        return optimized
+
+    def resolve(self) -> list:
+        """Apply the operations and return the final list of page references."""
+        pages = list(self.pages)
+
+        for operation in self.optimize():
+            kind = operation[0]
+
+            if kind == 'extract':
+                _, start, end = operation
+                pages = pages[start - 1 : end]
+
+            elif kind == 'remove':
+                _, start, end = operation
+                pages = pages[: start - 1] + pages[end :]
+                if not pages:
+                    raise ValueError(f'Removing pages {start}-{end} would leave no page.')
+
+            elif kind in ('select', 'drop'):
+                # a single pass over the pages, testing each against the compiled ranges
+                _, spec = operation
+                selected = spec.ranges(len(pages))
+                keep = kind == 'select'
+                pages = [page for number, page in enumerate(pages, 1) if (number in selected) == keep]
+                if spec.reverse:
+                    pages.reverse()
+                if not pages and kind == 'drop':
+                    raise ValueError(f"Removing the pages '{spec.text}' would leave no page.")
+
+            elif kind == 'rearrange':
+                _, start, end, relative_pos, new_pos = operation
+                moving_block = pages[start - 1 : end]
+                stationary_pages = pages[: start - 1] + pages[end :]
+
+                # pages of the block placed before the reference page shift it to the left
+                final_pos = (new_pos - 1) - max(0, min(end, new_pos - 1) - (start - 1))
+                if relative_pos == 'after':
+                    final_pos += 1
+                stationary_pages[final_pos:final_pos] = moving_block
+                pages = stationary_pages
+
+            elif kind == 'reorder':
+                order = operation[1]
+                if order and (min(order) < 1 or max(order) > len(pages)):
+                    raise ValueError(f'Invalid page order: pages must be between 1 and {len(pages)}.')
+                pages = [pages[number - 1] for number in order]
+
+            elif kind == 'insert':
+                _, inserted_pages, relative_pos, insert_pos = operation
+                insertion_point = insert_pos - 1 if relative_pos == 'before' else insert_pos
+                pages[insertion_point:insertion_point] = inserted_pages
+
+            elif kind == 'insert_many':
+                # the gap each block goes into (0 before the first page, len(pages)
+                # after the last one), sorted so the pages are copied in one pass;
+                # the sort is stable, so blocks in the same gap keep their order
+                gaps = []
+                for number, (_, relative_pos, insert_pos) in enumerate(operation[1]):
+                    if not 1 <= insert_pos <= len(pages):
+                        raise ValueError(f'Invalid insert position {insert_pos}: '
+                                         f'it must be between 1 and {len(pages)}.')
+                    gaps.append((insert_pos - 1 if relative_pos == 'before' else insert_pos, number))
+                gaps.sort()
+
+                expanded_pages = []
+                previous_gap = 0
+                for gap, number in gaps:
+                    expanded_pages += pages[previous_gap:gap]
+                    expanded_pages += operation[1][number][0]
+                    previous_gap = gap
+                expanded_pages += pages[previous_gap:]
+                pages = expanded_pages
+
+            elif kind == 'merge':
+                pages = pages + operation[1]
+
+        return pages
+
+    def __len__(self) -> int:
+        return len(self.resolve())
+
+    ## Output
+
+    def write(self, spill_threshold: int = None, deduplicate: bool = False, progress=None,
+              profile: str = None, incremental: bool = False):
+        """
+        Copy the pages of the plan into a single `PdfWriter` and write the output buffer.
+
+        Args:
+            spill_threshold (int, optional): Size in bytes above which the output is
+                                             spilled to disk.
+            deduplicate (bool, optional): Write identical resources (fonts, images,
+                                          ...) shared by the sources only once.
+            progress (callable, optional): Called with the number of pages copied
+                                           so far and the total after each page.
+                                           An exception raised by it stops the write.
+            profile (str, optional): The output profile, one of `OUTPUT_PROFILES`.
+            incremental (bool, optional): Append the new page order to the source
+                                          file instead of rewriting it, when the
+                                          plan allows it (see `write_incremental`).
+                                          The output profile does not apply then.
+        """
+        if incremental:
+            with phase('incremental write'):
+                output_buffer = write_incremental(self, spill_threshold, progress)
+            if output_buffer is not None:
+                record(bytes_out=output_buffer.seek(0, 2), pages_out=len(self))
+                output_buffer.seek(0)
+                return output_buffer
+
+        pages = self.resolve()
+        documents = {source_id: get_document(file) for source_id, file in self.sources.items()}
+        record(pages_out=len(pages))
+
+        on_page = None
+        if progress is not None:
+            copied = count(1)
+            on_page = lambda: progress(next(copied), len(pages))
+
+        with locked(documents.values()):
+            writer = PdfWriter()
+
+            # copy each run of consecutive pages from the same source in bulk
+            with phase('copy'):
+                for source_id, run in groupby(pages, key=itemgetter(0)):
+                    add_pages(writer, documents[source_id].reader, [page_index for _, page_index in run], on_page)
+
+            if deduplicate:
+                with phase('deduplicate'):
+                    deduplicate_objects(writer)
+
+        # the copied pages no longer refer to the sources, so other writes can
+        # copy from them while this one is serialized
+        with phase('write'):
+            output_buffer = write_output(writer, spill_threshold, profile)
+        record(bytes_out=output_buffer.seek(0, 2))
+        output_buffer.seek(0)
+        return output_buffer
+
+
+def as_page_plan(file) -> PagePlan:
+    """Return `file` if it is already a plan, or a plan with all of its pages."""
+    if isinstance(file, PagePlan):
+        return file
+    return PagePlan.from_file(file)
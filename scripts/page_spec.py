@@ -0,0 +1,200 @@
+import re
+from bisect import bisect_right
+
+
+## Page specs: several pages and ranges in one expression
+
+# Syntax reminder shown with parsing errors and in the app
+PAGE_SPEC_HELP = ("Pages and ranges separated by commas: '7' (a page), '1-3' (a range), "
+                  "'10-' (page 10 to the end), '-5' (the last 5 pages), 'odd', 'even', "
+                  "and 'reverse' to write the pages in reverse order.")
+
+_TERM = re.compile(r'(?P<start>\d+)?(?P<dash>-)?(?P<end>\d+)?')
+
+
+class PageRanges:
+    """
+    A normalized set of 1-indexed pages, stored as sorted, disjoint and
+    non-adjacent (start, end) intervals, plus strides such as the odd or even
+    pages, stored as (first, step, last) progressions.
+
+    Membership is a binary search over the interval starts and a modulo test
+    per stride, so testing every page of a document costs O(n log k) for k
+    intervals, whatever the number of pages the intervals and strides cover.
+
+    Args:
+        intervals (iterable[tuple[int, int]]): Inclusive intervals, in any order,
+                                               possibly overlapping.
+        strides (iterable[tuple[int, int, int]], optional): Inclusive
+                                                            progressions of pages.
+    """
+
+    def __init__(self, intervals, strides=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            # merge with the previous interval when they overlap or touch
+            if self.ends and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+        self.strides = sorted(set((first, step, last) for first, step, last in strides if first <= last))
+
+    def _in_intervals(self, page: int) -> bool:
+        index = bisect_right(self.starts, page) - 1
+        return index >= 0 and page <= self.ends[index]
+
+    def __contains__(self, page: int) -> bool:
+        if self._in_intervals(page):
+            return True
+        return any(first <= page <= last and (page - first) % step == 0
+                   for first, step, last in self.strides)
+
+    def __iter__(self):
+        if not self.strides:
+            for start, end in zip(self.starts, self.ends):
+                yield from range(start, end + 1)
+            return
+
+        last_page = max([*self.ends, *(last for _, _, last in self.strides)])
+        first_page = min([*self.starts, *(first for first, _, _ in self.strides)])
+        yield from (page for page in range(first_page, last_page + 1) if page in self)
+
+    def __len__(self) -> int:
+        count = sum(end - start + 1 for start, end in zip(self.starts, self.ends))
+        if not self.strides:
+            return count
+        # the pages of the strides that are not already in an interval or an earlier stride
+        counted = set()
+        for first, step, last in self.strides:
+            counted.update(page for page in range(first, last + 1, step) if not self._in_intervals(page))
+        return count + len(counted)
+
+    def __repr__(self) -> str:
+        return f"PageRanges('{self}')"
+
+    def __str__(self) -> str:
+        terms = [str(start) if start == end else f'{start}-{end}'
+                 for start, end in zip(self.starts, self.ends)]
+        for first, step, last in self.strides:
+            terms.append({(1, 2): 'odd', (2, 2): 'even'}.get((first, step), f'{first}-{last} every {step}'))
+        return ','.join(terms)
+
+
+class PageSpec:
+    """
+    A parsed page spec, such as '1-3,7,10-20,-5' or 'odd,reverse'.
+
+    Terms relative to the end of the document ('-5', '10-', 'odd', 'even') are
+    only turned into pages by `ranges`, given the number of pages, so the
+    same spec applies to documents of any length.
+    """
+
+    def __init__(self, text: str, terms: list, reverse: bool):
+        self.text = text
+        self.terms = terms
+        self.reverse = reverse
+
+    def ranges(self, page_count: int) -> PageRanges:
+        """Return the pages of the spec in a document of `page_count` pages."""
+        intervals = []
+        strides = []
+        for kind, *values in self.terms:
+            if kind == 'range':
+                start, end = values
+                if end > page_count:
+                    raise ValueError(f"Page {end} of '{self.text}' is out of range: "
+                                     f"the document has {page_count} pages.")
+                intervals.append((start, end))
+            elif kind == 'from':
+                if values[0] > page_count:
+                    raise ValueError(f"Page {values[0]} of '{self.text}' is out of range: "
+                                     f"the document has {page_count} pages.")
+                intervals.append((values[0], page_count))
+            elif kind == 'last':
+                intervals.append((max(1, page_count - values[0] + 1), page_count))
+            else:
+                strides.append((1 if kind == 'odd' else 2, 2, page_count))
+        return PageRanges(intervals, strides)
+
+    def __repr__(self) -> str:
+        return f"PageSpec('{self.text}')"
+
+
+def parse_page_spec(text: str) -> PageSpec:
+    """
+    Parse a page spec. See `PAGE_SPEC_HELP` for the syntax.
+
+    Raises:
+        ValueError: If the spec is empty or a term is not valid.
+    """
+    terms = []
+    reverse = False
+
+    for item in text.split(','):
+        item = re.sub(r'\s*-\s*', '-', item.strip()).lower()
+        if not item:
+            continue
+        if item == 'reverse':
+            reverse = True
+            continue
+        if item in ('odd', 'even'):
+            terms.append((item,))
+            continue
+
+        match = _TERM.fullmatch(item)
+        if match is None or not (match['start'] or match['end']):
+            raise ValueError(f"Invalid page spec term '{item}'. {PAGE_SPEC_HELP}")
+
+        start = int(match['start']) if match['start'] else None
+        end = int(match['end']) if match['end'] else None
+        if 0 in (start, end):
+            raise ValueError(f"Invalid page spec term '{item}': pages start at 1.")
+
+        if not match['dash']:
+            terms.append(('range', start, start))
+        elif start is None:
+            terms.append(('last', end))
+        elif end is None:
+            terms.append(('from', start))
+        elif start <= end:
+            terms.append(('range', start, end))
+        else:
+            raise ValueError(f"Invalid page range '{item}': the end page is before the start page. "
+                             "Add 'reverse' to write the pages in reverse order.")
+
+    # 'reverse' alone reverses the whole document
+    if not terms and reverse:
+        terms.append(('from', 1))
+    if not terms:
+        raise ValueError(f'The page spec selects no page. {PAGE_SPEC_HELP}')
+
+    return PageSpec(text, terms, reverse)
+
+
+def as_page_spec(spec) -> PageSpec:
+    """Return `spec` if it is already parsed, or parse it."""
+    if isinstance(spec, PageSpec):
+        return spec
+    return parse_page_spec(spec)
+
+
+## Page ranges of the parts of a split
+
+def parse_ranges(text: str) -> list:
+    """
+    Parse page ranges written as text, such as '1-3, 4, 7 - 10', into a list of
+    (start, end) tuples. Ranges are separated by commas or semicolons.
+    """
+    ranges = []
+    for item in re.split(r'[,;]', text):
+        item = item.strip()
+        if not item:
+            continue
+        match = re.fullmatch(r'(\d+)(?:\s*-\s*(\d+))?', item)
+        if match is None:
+            raise ValueError(f"Invalid page range '{item}', expected a page like '4' or a range like '1-3'.")
+        start = int(match.group(1))
+        ranges.append((start, int(match.group(2) or start)))
+    return ranges
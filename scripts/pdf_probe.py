@@ -0,0 +1,286 @@
+import io
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple
+
+from PyPDF2.errors import PyPdfError
+from PyPDF2.generic import DictionaryObject, IndirectObject, StreamObject, read_object
+
+from scripts.document_cache import file_identity, file_size, get_document
+from scripts.instrumentation import phase, record
+
+
+## Fast page-count probe
+
+class PdfInfo(NamedTuple):
+    """Basic facts about a PDF file."""
+    page_count: int
+    size: int
+    encrypted: bool
+
+
+# Number of bytes read at the end of the file to find `startxref`
+_TAIL_SIZE = 4096
+
+# Longest chain of incremental updates followed before giving up
+_MAX_SECTIONS = 64
+
+# Most lines (subsection headers and blank lines) read in a classic table before giving up
+_MAX_TABLE_LINES = 4096
+
+_OBJECT_HEADER = re.compile(rb'\s*(\d+)\s+(\d+)\s+obj')
+_XREF_ENTRY = re.compile(rb'(\d{10}) (\d{5}) ([nf])')
+
+
+class _ProbeError(Exception):
+    """The file cannot be probed cheaply and must be fully parsed."""
+
+
+class _Probe:
+    """
+    Reads the trailer, the cross-reference sections and the few objects needed
+    to get the page count, seeking directly to them instead of parsing the
+    whole file.
+    """
+
+    def __init__(self, stream, size: int):
+        self.stream = stream
+        self.size = size
+        self.sections = []
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        self.stream.seek(offset)
+        return self.stream.read(size)
+
+    ## Cross-reference sections
+
+    def load(self) -> DictionaryObject:
+        """Load every cross-reference section and return the newest trailer."""
+        tail = self.read_at(max(0, self.size - _TAIL_SIZE), _TAIL_SIZE)
+        position = tail.rfind(b'startxref')
+        if position < 0:
+            raise _ProbeError('startxref not found')
+        offset = int(tail[position + 9:].split()[0])
+
+        trailer = None
+        seen = set()
+        while offset is not None:
+            if offset in seen or len(seen) >= _MAX_SECTIONS:
+                raise _ProbeError('cross-reference sections loop')
+            seen.add(offset)
+
+            section_trailer = self._load_section(offset)
+            trailer = trailer or section_trailer
+
+            # hybrid files keep part of their objects in a cross-reference stream
+            if '/XRefStm' in section_trailer:
+                self._load_section(int(section_trailer.raw_get('/XRefStm')))
+
+            offset = int(section_trailer.raw_get('/Prev')) if '/Prev' in section_trailer else None
+
+        return trailer
+
+    def _load_section(self, offset: int) -> DictionaryObject:
+        head = self.read_at(offset, 4)
+        if head == b'xref':
+            return self._load_table(offset + 4)
+        return self._load_stream(offset)
+
+    def _load_table(self, offset: int) -> DictionaryObject:
+        """Record the subsections of a classic table; entries have a fixed size of 20 bytes."""
+        subsections = []
+        self.stream.seek(offset)
+        for _ in range(_MAX_TABLE_LINES):
+            line = self.stream.readline()
+            if not line:
+                raise _ProbeError('end of file in a cross-reference table')
+            if not line.strip():
+                continue
+            if line.lstrip().startswith(b'trailer'):
+                self.stream.seek(self.stream.tell() - len(line) + line.index(b'trailer') + 7)
+                break
+            first, count = (int(value) for value in line.split()[:2])
+            if self.stream.tell() + 20 * count > self.size:
+                # a damaged count, pointing past the end of the file
+                raise _ProbeError('cross-reference subsection past the end of the file')
+            subsections.append((first, count, self.stream.tell()))
+            self.stream.seek(self.stream.tell() + 20 * count)
+        else:
+            raise _ProbeError('trailer not found after the cross-reference table')
+
+        self.sections.append(('table', subsections))
+        self._skip_whitespace()
+        return read_object(self.stream, None)
+
+    def _load_stream(self, offset: int) -> DictionaryObject:
+        """Decode a cross-reference stream (PDF 1.5 and later)."""
+        xref_stream = self.object_at(offset)
+        if not isinstance(xref_stream, StreamObject) or xref_stream.get('/Type') != '/XRef':
+            raise _ProbeError('no cross-reference at startxref')
+
+        widths = [int(width) for width in xref_stream.raw_get('/W')]
+        if '/Index' in xref_stream:
+            index = [int(value) for value in xref_stream.raw_get('/Index')]
+        else:
+            index = [0, int(xref_stream.raw_get('/Size'))]
+        subsections = [(index[i], index[i + 1]) for i in range(0, len(index), 2)]
+
+        self.sections.append(('stream', (widths, subsections, xref_stream.get_data())))
+        return xref_stream
+
+    ## Objects
+
+    def _skip_whitespace(self) -> None:
+        while (char := self.stream.read(1)) and char.isspace():
+            pass
+        self.stream.seek(-1, 1)
+
+    def object_at(self, offset: int):
+        """Read the object whose `N G obj` header starts at `offset`."""
+        header = _OBJECT_HEADER.match(self.read_at(offset, 64))
+        if header is None:
+            raise _ProbeError(f'no object at offset {offset}')
+        self.stream.seek(offset + header.end())
+        self._skip_whitespace()
+        return read_object(self.stream, None)
+
+    def _locate(self, number: int):
+        """Return ('offset', offset) or ('compressed', object stream number, index) for an object."""
+        for kind, data in self.sections:
+            if kind == 'table':
+                for first, count, entries in data:
+                    if first <= number < first + count:
+                        entry = _XREF_ENTRY.match(self.read_at(entries + 20 * (number - first), 20))
+                        if entry is None:
+                            raise _ProbeError('malformed cross-reference table')
+                        if entry.group(3) == b'n':
+                            return ('offset', int(entry.group(1)))
+                        raise _ProbeError(f'object {number} is free')
+            else:
+                widths, subsections, rows = data
+                row_size = sum(widths)
+                row_number = 0
+                for first, count in subsections:
+                    if first <= number < first + count:
+                        row = rows[(row_number + number - first) * row_size:][:row_size]
+                        fields, position = [], 0
+                        for width in widths:
+                            fields.append(int.from_bytes(row[position:position + width], 'big'))
+                            position += width
+                        # a missing type field means type 1 (object at an offset)
+                        kind = fields[0] if widths[0] else 1
+                        if kind == 1:
+                            return ('offset', fields[1])
+                        if kind == 2:
+                            return ('compressed', fields[1], fields[2])
+                        raise _ProbeError(f'object {number} is free')
+                    row_number += count
+
+        raise _ProbeError(f'object {number} not found')
+
+    def get(self, reference):
+        """Resolve an indirect reference read from the file."""
+        if not isinstance(reference, IndirectObject):
+            return reference
+
+        location = self._locate(reference.idnum)
+        if location[0] == 'offset':
+            return self.object_at(location[1])
+
+        # objects inside an object stream: a header of 'number offset' pairs, then the objects
+        _, stream_number, _ = location
+        object_stream = self.get(IndirectObject(stream_number, 0, None))
+        data = object_stream.get_data()
+        first = int(object_stream.raw_get('/First'))
+        header = data[:first].split()
+        for i in range(0, len(header), 2):
+            if int(header[i]) == reference.idnum:
+                stream = io.BytesIO(data[first + int(header[i + 1]):])
+                return read_object(stream, None)
+
+        raise _ProbeError(f'object {reference.idnum} not found in its object stream')
+
+
+## Public interface
+
+# Results already computed, keyed by the identity of the file
+_probe_memo = OrderedDict()
+_PROBE_MEMO_SIZE = 1024
+_probe_memo_lock = threading.Lock()
+
+
+def _probe(file, size: int) -> PdfInfo:
+    if isinstance(file, (str, Path)):
+        with open(file, 'rb') as stream:
+            return _probe_stream(stream, size)
+
+    position = file.tell()
+    try:
+        return _probe_stream(file, size)
+    finally:
+        file.seek(position)
+
+
+def _probe_stream(stream, size: int) -> PdfInfo:
+    probe = _Probe(stream, size)
+    trailer = probe.load()
+    encrypted = '/Encrypt' in trailer
+
+    # references are resolved by the probe, PyPDF2 would need a reader;
+    # objects of encrypted files may also sit in encrypted object streams
+    try:
+        catalog = probe.get(trailer.raw_get('/Root'))
+        page_tree = probe.get(catalog.raw_get('/Pages'))
+        page_count = int(probe.get(page_tree.raw_get('/Count')))
+    except _ProbeError:
+        raise
+    except Exception as e:
+        raise _ProbeError(str(e))
+
+    return PdfInfo(page_count, size, encrypted)
+
+
+def probe_pdf(file) -> PdfInfo:
+    """
+    Return the page count, size and encryption status of a PDF file.
+
+    Only the trailer, the cross-reference sections, the catalog and the root of
+    the page tree are read, so the cost barely depends on the size of the file.
+    Files whose cross-reference data cannot be read that way (e.g. damaged
+    files) are fully parsed instead. Results are remembered per upload.
+
+    Args:
+        file: The uploaded file, file object or path of the PDF.
+    """
+    identity = file_identity(file)
+    if identity is not None:
+        with _probe_memo_lock:
+            if identity in _probe_memo:
+                _probe_memo.move_to_end(identity)
+                return _probe_memo[identity]
+
+    size = file_size(file)
+    try:
+        with phase('probe'):
+            info = _probe(file, size)
+    except (_ProbeError, PyPdfError, ValueError, KeyError, IndexError, TypeError, OSError):
+        # fall back to a full parse, shared with the actions through the document cache
+        document = get_document(file)
+        with document.lock:
+            reader = document.reader
+            encrypted = reader.is_encrypted
+            if encrypted:
+                # the page tree of an encrypted file can only be read once decrypted
+                reader.decrypt('')
+            info = PdfInfo(len(reader.pages), size, encrypted)
+    record(bytes_in=size, pages_in=info.page_count)
+
+    if identity is not None:
+        with _probe_memo_lock:
+            _probe_memo[identity] = info
+            if len(_probe_memo) > _PROBE_MEMO_SIZE:
+                _probe_memo.popitem(last=False)
+
+    return info
@@ -0,0 +1,159 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from PyPDF2 import PdfReader
+
+from scripts.document_cache import content_hash, file_identity, get_cache, get_document, upload_view
+
+# Number of background threads checking uploaded files
+PREFLIGHT_WORKERS = int(os.environ.get('PDF_EDITOR_PREFLIGHT_WORKERS', 2))
+
+
+## Background checks of uploaded files
+
+class FileCheck(NamedTuple):
+    """
+    The result of checking a file: its status ('checking', 'ready', 'repaired'
+    or 'failed'), its page count once known, whether it is encrypted and a
+    message explaining a repair or a failure.
+    """
+    name: str
+    status: str
+    page_count: int = None
+    encrypted: bool = False
+    message: str = ''
+
+    @property
+    def usable(self) -> bool:
+        return self.status in ('ready', 'repaired')
+
+
+# Most parser messages reported for a file
+_MAX_MESSAGES = 3
+
+class _ThreadMessages(logging.Handler):
+    """Collects the messages PyPDF2 logs from one thread while it repairs a file."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.thread = threading.get_ident()
+        self.messages = []
+
+    def emit(self, record) -> None:
+        if record.thread == self.thread and record.getMessage() not in self.messages:
+            self.messages.append(record.getMessage())
+
+
+def _open_pages(reader: PdfReader) -> tuple:
+    """Decrypt the reader if it can be without a password and return its page count and encryption."""
+    encrypted = reader.is_encrypted
+    if encrypted and not reader.decrypt(''):
+        raise PermissionError('The file is protected by a password.')
+    return len(reader.pages), encrypted
+
+
+def check_pdf(file) -> FileCheck:
+    """
+    Check that a PDF file can be processed and parse it into the document cache.
+
+    The file is parsed and its page tree read, so the actions using it later
+    find it ready in the cache. Damaged cross-reference data is repaired by the
+    parser; files whose end is missing get a new cross-reference table built by
+    scanning their objects (see `DocumentCache`), which the document cache
+    remembers, so the actions never parse the damaged original. Files encrypted
+    with an empty password are opened; other encrypted files fail.
+
+    Args:
+        file: The uploaded file, file object or path of the PDF.
+    """
+    name = Path(getattr(file, 'name', str(file))).name
+    messages = _ThreadMessages()
+    logger = logging.getLogger('PyPDF2')
+    logger.addHandler(messages)
+    try:
+        try:
+            document = get_document(file)
+            with document.lock:
+                page_count, encrypted = _open_pages(document.reader)
+        except PermissionError as e:
+            return FileCheck(name, 'failed', encrypted=True, message=str(e))
+        except Exception as e:
+            # the pages cannot be read: rebuild the cross-reference data instead
+            error = f'{e}'
+            try:
+                document = get_cache().repair(file, error)
+                with document.lock:
+                    page_count, encrypted = _open_pages(document.reader)
+            except Exception:
+                return FileCheck(name, 'failed', message=f'The file cannot be read: {error}')
+    finally:
+        logger.removeHandler(messages)
+
+    if document.repair is not None:
+        return FileCheck(name, 'repaired', page_count, encrypted,
+                         f'The file was damaged ({document.repair}); its objects were recovered by scanning it.')
+    if messages.messages:
+        return FileCheck(name, 'repaired', page_count, encrypted,
+                         'The file was damaged and repaired: ' + '; '.join(messages.messages[:_MAX_MESSAGES]))
+    return FileCheck(name, 'ready', page_count, encrypted)
+
+
+class Preflight:
+    """
+    Checks uploaded files in a thread pool as soon as they are uploaded (see
+    `check_pdf`), and remembers the result of each upload.
+
+    Args:
+        max_workers (int): The number of files checked at the same time.
+    """
+
+    # Results remembered, for the most recent files
+    MEMO_SIZE = 256
+
+    def __init__(self, max_workers: int = PREFLIGHT_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='preflight')
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, files: list) -> list:
+        """
+        Return the check of each file, starting the check of the new ones in
+        the background. Files still being checked have the status 'checking'.
+        """
+        checks = []
+        for file in files:
+            key = file_identity(file) or content_hash(file)
+            with self._lock:
+                future = self._futures.get(key)
+                if future is None:
+                    future = self._executor.submit(check_pdf, upload_view(file))
+                    self._futures[key] = future
+                    if len(self._futures) > self.MEMO_SIZE:
+                        self._futures.popitem(last=False)
+                else:
+                    self._futures.move_to_end(key)
+
+            if future.done():
+                checks.append(future.result())
+            else:
+                checks.append(FileCheck(Path(getattr(file, 'name', str(file))).name, 'checking'))
+        return checks
+
+
+## Process-wide checker shared by the app sessions
+
+_preflight = None
+_preflight_lock = threading.Lock()
+
+
+def get_preflight() -> Preflight:
+    global _preflight
+    with _preflight_lock:
+        if _preflight is None:
+            _preflight = Preflight()
+        return _preflight
@@ -1,10 +1,12 @@
-import io
 from pathlib import Path
 
-from PyPDF2 import PdfReader, PdfWriter
+from scripts.instrumentation import instrumented
+from scripts.page_plan import as_page_plan
 
 
-def rearrange_pages(file, start: int, end: int, relative_pos: str , new_pos: int):
+@instrumented('rearrange')
+def rearrange_pages(file, start: int = None, end: int = None, relative_pos: str = None, new_pos: int = None,
+                    as_plan: bool = False, incremental: bool = False, order=None):
     """
     Changes the order of pages in a PDF file.
 
@@ -14,6 +16,9 @@ def rearrange_pages(file, start: int, end: int, relative_pos: str , new_pos: int
     For example, you can take pages 8-10 and move them 'before' page 2,
     making them the new pages 2, 3, and 4.
 
+    Apply several moves in a row, and undo or redo them, before saving the
+    file: only the final order is written.
+
     Args:
         file (str): The path to the PDF file you want to reorganize.
         start (int): The first page number of the block you want to move.
@@ -23,38 +28,32 @@ def rearrange_pages(file, start: int, end: int, relative_pos: str , new_pos: int
                             or 'after' the `new_pos`.
         new_pos (int): The page number that will be the reference point for
                        the move.
+        as_plan (bool, optional): Return a `PagePlan` to chain with other
+                                  actions instead of writing the output file.
+        incremental (bool, optional): Append the new page order to the original
+                                      file instead of rewriting it, which is much
+                                      faster on large files.
+        order (optional): The whole new page order, such as a `PageOrderSession`
+                          or a list of page numbers, used instead of a single move.
     """
-    reader = PdfReader(file)
-    pdf_length = len(reader.pages)
-    source_pages = reader.pages
-
-    # Isolate the block of pages to be moved
-    moving_block = source_pages[start - 1 : end]
-
-    # Create a list of pages that are NOT being moved
-    stationary_pages = [p for i, p in enumerate(source_pages) if i not in range(start - 1, end)]
-
-    # Calculate the correct 0-indexed insertion point in the modified list
-    pages_to_discount = len([p for p in range(start - 1, end) if p < new_pos - 1])
-    final_pos = (new_pos - 1) - pages_to_discount
-    if relative_pos == 'after':
-        final_pos += 1
-
-    # Re-insert the block at the new position
-    stationary_pages[final_pos:final_pos] = moving_block
-
-    # Add the final ordered pages to a new writer
-    writer = PdfWriter()
-    for page in stationary_pages:
-        writer.add_page(page)
-    ## write the output file
+    if order is not None:
+        plan = as_page_plan(file).reorder(order)
+    elif None in (start, end, relative_pos, new_pos):
+        raise ValueError('Give the block of pages to move and its new position, or a page order.')
+    else:
+        # move the block of pages to its new position
+        plan = as_page_plan(file).rearrange(start, end, relative_pos, new_pos)
 
     # prepare output file name
     filename = Path(file.name)
     output_filename = f'{filename.stem}_rearranged.pdf'
 
-    # create a memory buffer to store output pdf
-    output_buffer = io.BytesIO()
-    writer.write(output_buffer)
+    if as_plan:
+        return plan, output_filename
+
+    ## write the output file
+
+    # write the output pdf, spilled to disk when it is large
+    output_buffer = plan.write(incremental=incremental)
 
     return output_buffer, output_filename
\ No newline at end of file
@@ -1,13 +1,15 @@
 import os
 from pathlib import Path
-import io
 
-from PyPDF2 import PdfReader, PdfWriter
+from scripts.instrumentation import instrumented
+from scripts.page_plan import as_page_plan
 
 
 ## Remove pages from a PDF file
 
-def remove_pages(file, start: int, end: int):
+@instrumented('remove')
+def remove_pages(file, start: int = None, end: int = None, as_plan: bool = False,
+                 incremental: bool = False, spec: str = None):
     """
     Removes a range of pages from a PDF file.
 
@@ -17,35 +19,40 @@ def remove_pages(file, start: int, end: int):
     For example, if you choose start=3 and end=5, the new PDF will contain
     all pages from the original except for pages 3, 4, and 5.
 
+    To remove several pages and ranges at once, type a page spec instead,
+    such as '1-3, 7, 10-20, -5' (the last 5 pages), 'odd' or 'even'.
+
     Args:
         file (str): The path to the PDF file you want to remove pages from.
         start (int): The first page number of the range to delete.
         end (int): The last page number of the range to delete.
+        as_plan (bool, optional): Return a `PagePlan` to chain with other
+                                  actions instead of writing the output file.
+        incremental (bool, optional): Append the new page order to the original
+                                      file instead of rewriting it. Much faster on
+                                      large files, but the removed pages are only
+                                      hidden: their content stays in the file.
+        spec (str, optional): A page spec of the pages to remove, used instead
+                              of `start` and `end`.
     """
 
-    reader = PdfReader(file)
-    pages = reader.pages
-    pdf_length = len(pages)
-
-    # modify start and end for 0-indexing
-    start, end = start - 1, end - 1
-
-    # select pages to extract
-    pages_to_be_kept = [pages[i] for i in range(pdf_length)
-                        if i not in range(start , end + 1) ]
-
-    # add pages to writer object
-    writer = PdfWriter()
-    for page in pages_to_be_kept:
-        writer.add_page(page)
+    # select pages to be kept
+    if spec is not None:
+        plan = as_page_plan(file).drop(spec)
+    elif start is None or end is None:
+        raise ValueError('Give the start and end pages, or a page spec.')
+    else:
+        plan = as_page_plan(file).remove(start, end)
 
     # create output filename
     file_path = Path(file.name)
     filename = file_path.stem
     output_filename = f'{filename}_trimmed.pdf'
 
-    # create a memory buffer to store output pdf
-    output_buffer = io.BytesIO()
-    writer.write(output_buffer)
+    if as_plan:
+        return plan, output_filename
+
+    # write the output pdf, spilled to disk when it is large
+    output_buffer = plan.write(incremental=incremental)
 
     return output_buffer, output_filename
\ No newline at end of file
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+from scripts.document_cache import content_hash
+from scripts.instrumentation import phase, record
+from scripts.output_writer import CHUNK_SIZE, new_output_buffer
+
+
+## Outputs of the operations cached on disk, shared by every session
+
+# Folder of the cached outputs, shared by every session and process
+RESULT_CACHE_DIR = Path(os.environ.get('PDF_EDITOR_RESULT_CACHE_DIR',
+                                       Path(tempfile.gettempdir()) / 'pdf_editor_results'))
+
+# Upper bound for the total size of the cached outputs. Least recently used
+# outputs are deleted first; 0 turns the cache off.
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('PDF_EDITOR_RESULT_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+# Version of the outputs, part of every key: the cache outlives the server
+# process, so it must be bumped by any change to the code that changes the
+# outputs of the operations (e.g. a writer fix), or old outputs are served again
+RESULT_CACHE_VERSION = 1
+
+# Stands for the name of the first input in the cached output filenames
+_STEM_MARKER = '\0input\0'
+
+
+class ResultCache:
+    """
+    Caches the output of the operations on disk, keyed by the content hash of
+    their input files, the operation and its parameters.
+
+    The same operation on the same files gives the same output whoever runs
+    it and whatever the files are called, so it is written once and then
+    copied from the cache. Output filenames are stored with the name of the
+    first input left out, and completed with the name of the current upload.
+
+    Args:
+        directory (Path): The folder where the outputs are stored.
+        max_bytes (int): The maximum total size of the stored outputs.
+    """
+
+    def __init__(self, directory: Path = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._current_bytes = 0
+        if self.enabled:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._current_bytes = sum(path.stat().st_size for path in self.directory.glob('*.out'))
+            except OSError:
+                # a folder that cannot be created or read turns the cache off
+                self.max_bytes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, operation: str, files: list, **params) -> str:
+        """
+        Return the key of an operation on `files`, in their order, with `params`.
+
+        Parameters must be JSON values, or objects whose string is the same for
+        the same parameter (such as a `PageSpec`).
+        """
+        description = {'version': RESULT_CACHE_VERSION,
+                       'operation': operation,
+                       'inputs': [content_hash(file) for file in files],
+                       'params': params}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _paths(self, key: str) -> tuple:
+        return self.directory / f'{key}.out', self.directory / f'{key}.name'
+
+    def get(self, key: str, stem: str = '', spill_threshold: int = None):
+        """
+        Return a copy of the cached output of `key` in a new output buffer,
+        rewound, and its filename, or None if it is not cached.
+
+        Args:
+            key (str): The key of the operation, from `key`.
+            stem (str, optional): The name of the first input, without its extension.
+            spill_threshold (int, optional): Size in bytes above which the copy is
+                                             spilled to disk.
+        """
+        if not self.enabled:
+            return None
+
+        data_path, name_path = self._paths(key)
+        try:
+            filename = name_path.read_text(encoding='utf-8').replace(_STEM_MARKER, stem)
+            output_buffer = new_output_buffer(spill_threshold)
+            with open(data_path, 'rb') as f:
+                shutil.copyfileobj(f, output_buffer, CHUNK_SIZE)
+            # mark the output as recently used for the eviction
+            os.utime(data_path)
+        except FileNotFoundError:
+            return None
+
+        output_buffer.seek(0)
+        return output_buffer, filename
+
+    def put(self, key: str, output_buffer, filename: str, stem: str = '') -> None:
+        """
+        Store a copy of an output buffer and its filename, and rewind the buffer.
+
+        Raises:
+            OSError: If the output cannot be stored (e.g. the disk is full). The
+                     temporary files are deleted and the buffer is rewound.
+        """
+        if not self.enabled:
+            return
+
+        data_path, name_path = self._paths(key)
+        if stem and filename.startswith(stem):
+            filename = _STEM_MARKER + filename[len(stem):]
+
+        # write to temporary names first, so no reader ever sees a half-written output
+        temporary_data = data_path.with_suffix(f'.{threading.get_ident()}.tmp')
+        temporary_name = name_path.with_suffix(f'.{threading.get_ident()}.tmpname')
+        try:
+            output_buffer.seek(0)
+            with open(temporary_data, 'wb') as f:
+                shutil.copyfileobj(output_buffer, f, CHUNK_SIZE)
+            temporary_name.write_text(filename, encoding='utf-8')
+            os.replace(temporary_name, name_path)
+            os.replace(temporary_data, data_path)
+        except OSError:
+            temporary_data.unlink(missing_ok=True)
+            temporary_name.unlink(missing_ok=True)
+            raise
+        finally:
+            output_buffer.seek(0)
+
+        with self._lock:
+            self._current_bytes += data_path.stat().st_size
+            over_budget = self._current_bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used outputs until the folder is back to 90% of its budget."""
+        outputs = []
+        for path in self.directory.glob('*.out'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            outputs.append((stat.st_mtime, stat.st_size, path))
+        outputs.sort()
+
+        total = sum(size for _, size, _ in outputs)
+        for _, size, path in outputs:
+            if total <= self.max_bytes * 0.9:
+                break
+            path.unlink(missing_ok=True)
+            path.with_suffix('.name').unlink(missing_ok=True)
+            total -= size
+
+        with self._lock:
+            self._current_bytes = total
+
+    def clear(self) -> None:
+        """Delete every cached output."""
+        for path in list(self.directory.glob('*.out')) + list(self.directory.glob('*.name')):
+            path.unlink(missing_ok=True)
+        with self._lock:
+            self._current_bytes = 0
+
+
+def cached_work(work, operation: str, files: list, **params):
+    """
+    Return job work (see `scripts.jobs.Job`) that returns the cached output of
+    the operation if there is one, and otherwise runs `work` and caches its output.
+
+    Args:
+        work (callable): Takes the progress callback of the job and returns the
+                         output buffer and the output filename.
+        operation (str): The name of the operation, such as 'extract'.
+        files (list): The input files, in the order they are used.
+        **params: Everything else the output depends on: pages, positions,
+                  output profile, ...
+    """
+    cache = get_result_cache()
+    if not cache.enabled:
+        return work
+
+    stem = Path(getattr(files[0], 'name', '')).stem
+
+    def cached(progress):
+        with phase('result cache'):
+            key = cache.key(operation, files, **params)
+            hit = cache.get(key, stem)
+        if hit is not None:
+            output_buffer, filename = hit
+            record(bytes_out=output_buffer.seek(0, 2))
+            output_buffer.seek(0)
+            return output_buffer, filename
+
+        output_buffer, filename = work(progress)
+        with phase('result cache'):
+            try:
+                cache.put(key, output_buffer, filename, stem)
+            except OSError:
+                # the output is ready: failing to cache it must not fail the job
+                pass
+        return output_buffer, filename
+
+    return cached
+
+
+## Process-wide cache shared by the app sessions
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
@@ -0,0 +1,180 @@
+import os
+import re
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from zipfile import ZIP64_LIMIT, ZIP_STORED, ZipFile, ZipInfo
+
+from scripts.document_cache import get_document, page_count
+from scripts.instrumentation import instrumented, phase, propagate
+from scripts.output_writer import CHUNK_SIZE, new_output_buffer
+from scripts.page_plan import as_page_plan
+
+# Number of threads writing the parts of a split; 1 writes them one after another
+SPLIT_WORKERS = int(os.environ.get('PDF_EDITOR_SPLIT_WORKERS', 1))
+
+
+## Split rules: the page ranges of the parts
+
+def every_n_pages(total_pages: int, n: int) -> list:
+    """Return the (start, end) ranges of consecutive parts of `n` pages, the last one possibly shorter."""
+    if n < 1:
+        raise ValueError('The number of pages per part must be at least 1.')
+    return [(start, min(start + n - 1, total_pages)) for start in range(1, total_pages + 1, n)]
+
+
+def bookmark_ranges(file) -> list:
+    """
+    Return the (start, end, title) ranges starting at each top-level bookmark
+    of `file`, and ending before the next one. Pages before the first
+    bookmark are a part of their own.
+    """
+    document = get_document(file)
+    total_pages = page_count(file)
+
+    starts = {}
+    with document.lock:
+        for item in document.reader.outline:
+            # nested lists hold the children of the previous bookmark
+            if isinstance(item, list):
+                continue
+            page_index = document.reader.get_destination_page_number(item)
+            if page_index is not None and 0 <= page_index < total_pages:
+                starts.setdefault(page_index + 1, str(item.title))
+
+    if not starts:
+        raise ValueError('The file has no bookmarks to split it at.')
+    if 1 not in starts:
+        starts[1] = 'front'
+
+    boundaries = sorted(starts)
+    return [(start, end - 1, starts[start]) for start, end in zip(boundaries, boundaries[1:] + [total_pages + 1])]
+
+
+def _safe_name(title: str) -> str:
+    return re.sub(r'[^\w\- ]+', '', title).strip()[:50] or 'part'
+
+
+## Split a PDF file into several files
+
+@instrumented('split')
+def split_pages(file, every: int = None, ranges: list = None, bookmarks: bool = False,
+                as_plan: bool = False, max_workers: int = None):
+    """
+    Splits a PDF file into several files, returned together in a ZIP archive.
+
+    Choose how to cut the file: into parts of the same number of pages, into
+    a list of page ranges, or at the bookmarks of the file (a new part starts
+    at each top-level bookmark). The file is read once for all the parts.
+
+    For example, splitting a 10-page file every 4 pages gives three files
+    with pages 1-4, 5-8 and 9-10.
+
+    Args:
+        file (str): The path to the PDF file you want to split.
+        every (int, optional): The number of pages of each part.
+        ranges (list[tuple[int, int]], optional): The first and last page of each part.
+                                                  Ranges may overlap.
+        bookmarks (bool, optional): Split the file at its top-level bookmarks.
+        as_plan (bool, optional): Return the page plan and the filename of each
+                                  part instead of writing the archive.
+        max_workers (int, optional): Write the parts with this many threads.
+                                     Defaults to `SPLIT_WORKERS`.
+    """
+    if sum([every is not None, ranges is not None, bookmarks]) != 1:
+        raise ValueError('Choose exactly one way to split the file: every, ranges or bookmarks.')
+
+    plan = as_page_plan(file)
+    total_pages = len(plan)
+    stem = Path(file.name).stem
+
+    if bookmarks:
+        named_ranges = [(start, end, _safe_name(title)) for start, end, title in bookmark_ranges(file)]
+    else:
+        if every is not None:
+            ranges = every_n_pages(total_pages, every)
+        named_ranges = [(start, end, f'pages_{start}-{end}') for start, end in ranges]
+
+    # build the plans of the parts, all sharing the parsed source
+    parts = []
+    for number, (start, end, name) in enumerate(named_ranges, 1):
+        if not 1 <= start <= end <= total_pages:
+            raise ValueError(f'Invalid range {start}-{end}: pages must be between 1 and {total_pages} '
+                             'and the end page must not be before the start page.')
+        parts.append((plan.extract(start, end), f'{stem}_{number:03d}_{name}.pdf'))
+
+    output_filename = f'{stem}_split.zip'
+
+    if as_plan:
+        return parts, output_filename
+
+    return write_parts(parts, max_workers), output_filename
+
+
+## Write the parts into a ZIP archive
+
+def _add_to_archive(archive: ZipFile, output_buffer, filename: str) -> None:
+    """Copy a written part into the archive in chunks and release it."""
+    size = output_buffer.seek(0, 2)
+    output_buffer.seek(0)
+    entry_info = ZipInfo(filename, time.localtime()[:6])
+    with archive.open(entry_info, 'w', force_zip64=size >= ZIP64_LIMIT) as entry:
+        shutil.copyfileobj(output_buffer, entry, CHUNK_SIZE)
+    output_buffer.close()
+
+
+def write_parts(parts: list, max_workers: int = None, spill_threshold: int = None, progress=None,
+                profile: str = None):
+    """
+    Write the parts of a split and return a ZIP archive holding them, rewound.
+
+    Parts are written by a pool of threads and added to the archive in order
+    as soon as they are done; only a few parts are written ahead of the
+    archive, so the output is never held whole in memory twice. PDF files
+    are mostly compressed already, so they are stored in the archive as is.
+
+    Args:
+        parts (list[tuple[PagePlan, str]]): The plan and the filename of each part.
+        max_workers (int, optional): The number of threads writing parts.
+                                     Defaults to `SPLIT_WORKERS`.
+        spill_threshold (int, optional): Size in bytes above which the parts and
+                                         the archive are spilled to disk.
+        progress (callable, optional): Called with the number of pages written so
+                                       far and the total after each part. An
+                                       exception raised by it stops the split.
+        profile (str, optional): The output profile of the parts, one of `OUTPUT_PROFILES`.
+    """
+    if max_workers is None:
+        max_workers = SPLIT_WORKERS
+
+    part_pages = [len(plan) for plan, _ in parts]
+    total_pages = sum(part_pages)
+    pages_done = 0
+    pending = deque()
+
+    def archive_oldest():
+        nonlocal pages_done
+        future, filename, pages = pending.popleft()
+        output_buffer = future.result()
+        with phase('archive'):
+            _add_to_archive(archive, output_buffer, filename)
+        pages_done += pages
+        if progress is not None:
+            progress(pages_done, total_pages)
+
+    archive_buffer = new_output_buffer(spill_threshold)
+    with ZipFile(archive_buffer, 'w', ZIP_STORED) as archive, \
+         ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='split') as executor:
+        for (plan, filename), pages in zip(parts, part_pages):
+            pending.append((executor.submit(propagate(plan.write), spill_threshold, profile=profile),
+                            filename, pages))
+            # keep the threads busy, without writing more parts ahead of the archive
+            if len(pending) > max_workers:
+                archive_oldest()
+        while pending:
+            archive_oldest()
+
+    archive_buffer.seek(0)
+    return archive_buffer
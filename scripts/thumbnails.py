@@ -0,0 +1,203 @@
+import functools
+import importlib.util
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from scripts.document_cache import content_hash, read_bytes
+
+
+## Page thumbnails rendered in the background and cached on disk
+
+# Folder of the rendered thumbnails, shared by every session and process
+THUMBNAIL_DIR = Path(os.environ.get('PDF_EDITOR_THUMBNAIL_DIR',
+                                    Path(tempfile.gettempdir()) / 'pdf_editor_thumbnails'))
+
+# Upper bound for the total size of the thumbnail folder. Least recently used
+# thumbnails are deleted first.
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('PDF_EDITOR_THUMBNAIL_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Number of background threads rendering thumbnails
+THUMBNAIL_WORKERS = int(os.environ.get('PDF_EDITOR_THUMBNAIL_WORKERS', 2))
+
+# Width in pixels of the thumbnails
+THUMBNAIL_WIDTH = 160
+
+# Number of documents kept open by the renderer
+_OPEN_DOCUMENTS = 4
+
+
+@functools.lru_cache(maxsize=None)
+def thumbnails_available() -> bool:
+    """Return whether the optional renderer (pypdfium2) is installed."""
+    # page previews are optional; the renderer is only imported by the first render,
+    # so it does not slow down the start of the app
+    return importlib.util.find_spec('pypdfium2') is not None
+
+
+def _render_source(file):
+    """
+    Return a path or bytes of `file` that can be handed to a rendering thread,
+    which must not move the position of a file object used by the app.
+    """
+    if isinstance(file, (str, Path)):
+        return str(file)
+    # uploads keep their content in memory, getvalue does not copy it
+    if hasattr(file, 'getvalue'):
+        return file.getvalue()
+    return read_bytes(file)
+
+
+class ThumbnailRenderer:
+    """
+    Renders page thumbnails in a thread pool and caches them as PNG files.
+
+    Thumbnails are keyed by the content hash of the file, the page index and
+    the width, so the same page of the same file is rendered once, whatever
+    the session or the name of the upload. PDFium is not thread-safe: the
+    rasterization itself is serialized, while PNG encoding and disk writes of
+    several thumbnails overlap.
+
+    Args:
+        directory (Path): The folder where the thumbnails are stored.
+        max_bytes (int): The maximum total size of the stored thumbnails.
+        max_workers (int): The number of rendering threads.
+    """
+
+    def __init__(self, directory: Path = THUMBNAIL_DIR, max_bytes: int = THUMBNAIL_CACHE_MAX_BYTES,
+                 max_workers: int = THUMBNAIL_WORKERS):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='thumbnail')
+        self._pending = {}
+        self._failed = set()
+        self._documents = OrderedDict()
+        # reentrant: a done callback runs in the submitting thread if the future is already done
+        self._lock = threading.RLock()
+        self._pdfium_lock = threading.Lock()
+        self._current_bytes = sum(path.stat().st_size for path in self.directory.glob('*.png'))
+
+    def path(self, key: str, page_index: int, width: int) -> Path:
+        return self.directory / f'{key}_{page_index}_{width}.png'
+
+    def request(self, file, page_indices, width: int = THUMBNAIL_WIDTH) -> dict:
+        """
+        Return the thumbnails of some pages of `file`, starting the rendering of
+        the missing ones in the background.
+
+        Args:
+            file: The uploaded file, file object or path of the PDF.
+            page_indices (iterable[int]): The 0-based indices of the pages.
+            width (int, optional): The width of the thumbnails in pixels.
+
+        Returns:
+            dict: The path of each thumbnail, or None while it is being rendered.
+                  Pages that cannot be rendered are left out.
+        """
+        key = content_hash(file)
+        thumbnails = {}
+        source = None
+
+        for page_index in page_indices:
+            path = self.path(key, page_index, width)
+            if path in self._failed:
+                continue
+            if path.exists():
+                # mark the thumbnail as recently used for the eviction
+                os.utime(path)
+                thumbnails[page_index] = path
+                continue
+
+            with self._lock:
+                if path not in self._pending:
+                    if source is None:
+                        source = _render_source(file)
+                    future = self._executor.submit(self._render, source, key, page_index, width, path)
+                    self._pending[path] = future
+                    future.add_done_callback(lambda future, path=path: self._done(future, path))
+            thumbnails[page_index] = None
+
+        return thumbnails
+
+    def _done(self, future, path: Path) -> None:
+        with self._lock:
+            self._pending.pop(path, None)
+            if future.exception() is not None:
+                self._failed.add(path)
+
+    def _open(self, source, key: str):
+        """Return the open PDFium document of `source`; called with the PDFium lock held."""
+        if key in self._documents:
+            self._documents.move_to_end(key)
+            return self._documents[key]
+
+        document = importlib.import_module('pypdfium2').PdfDocument(source)
+        self._documents[key] = document
+        if len(self._documents) > _OPEN_DOCUMENTS:
+            _, evicted = self._documents.popitem(last=False)
+            evicted.close()
+        return document
+
+    def _render(self, source, key: str, page_index: int, width: int, path: Path) -> Path:
+        with self._pdfium_lock:
+            page = self._open(source, key)[page_index]
+            image = page.render(scale=width / page.get_width()).to_pil()
+            page.close()
+
+        # write to a temporary name first, so no reader ever sees a half-written file
+        temporary = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        image.save(temporary, format='PNG', optimize=False)
+        os.replace(temporary, path)
+
+        with self._lock:
+            self._current_bytes += path.stat().st_size
+            over_budget = self._current_bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+        return path
+
+    def _evict(self) -> None:
+        """Delete the least recently used thumbnails until the folder is back to 90% of its budget."""
+        thumbnails = []
+        for path in self.directory.glob('*.png'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            thumbnails.append((stat.st_mtime, stat.st_size, path))
+        thumbnails.sort()
+
+        total = sum(size for _, size, _ in thumbnails)
+        for _, size, path in thumbnails:
+            if total <= self.max_bytes * 0.9:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+        with self._lock:
+            self._current_bytes = total
+
+    def wait(self, timeout: float = None) -> None:
+        """Wait until the thumbnails requested so far are rendered."""
+        with self._lock:
+            pending = list(self._pending.values())
+        for future in pending:
+            future.exception(timeout=timeout)
+
+
+## Process-wide renderer shared by the app sessions
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> ThumbnailRenderer:
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = ThumbnailRenderer()
+        return _renderer
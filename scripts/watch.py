@@ -0,0 +1,574 @@
+"""
+Watch folders and run a page operation on every PDF file dropped into them.
+
+Each watched folder has a job, written as in a batch manifest (see
+`scripts.batch`) but without its input: the incoming file becomes the
+`"input"` of the job, or one of the `"inputs"` of a merge. The watches are
+read from a JSON file:
+
+    [
+        {"folder": "scanner/incoming", "output_dir": "scanner/no_cover",
+         "job": {"action": "remove", "start": 1, "end": 1}},
+        {"folder": "invoices/incoming", "output_dir": "invoices/merged",
+         "job": {"action": "merge", "deduplicate": true}, "batch_size": 20, "batch_wait": 60}
+    ]
+
+Merge watches gather their files until `batch_size` of them are ready or no
+new file has arrived for `batch_wait` seconds, and merge them in name order.
+A merge needs at least two files: a lone file waits for the next ones,
+across restarts.
+
+New files are noticed through inotify on Linux, and by listing the folders
+every few seconds elsewhere (or with `--poll`). A file is only processed once
+its size and modification time have not changed for `--settle` seconds and it
+ends with a PDF end-of-file marker, so files still being written by a scanner
+or copied over the network are left alone.
+
+The jobs run in a pool of worker processes. At most `--queue` jobs are handed
+to the pool at a time: the other ready files stay on disk, in line, until a
+worker is free, so a burst of files does not pile up in memory.
+
+Every processed file, failed or not, is recorded in an SQLite index with its
+size and modification time, so a restarted daemon skips the files it already
+processed (a file replaced by a new version is processed again). The counters
+of the daemon (files and bytes processed, throughput, files waiting and
+running) are printed when it stops, and written to the `--stats` JSON file
+every few seconds while it runs.
+
+Usage:
+
+    python -m scripts.watch watches.json --workers 4 --index watch_index.sqlite --stats watch_stats.json
+"""
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import sqlite3
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from queue import Empty, SimpleQueue
+
+from scripts.batch import DEFAULT_WORKERS, run_job
+from scripts.output_profiles import OUTPUT_PROFILE, OUTPUT_PROFILES
+
+# Seconds a file must keep the same size and modification time to be processed
+DEFAULT_SETTLE = 2.0
+
+# Seconds between two listings of the folders, when they are polled
+DEFAULT_POLL_INTERVAL = 5.0
+
+# Seconds after which a stable file without an end-of-file marker is processed anyway
+# (it may be damaged, and the PDF reader may still repair it)
+_INCOMPLETE_TIMEOUT = 60.0
+
+# Bytes at the end of a file searched for the '%%EOF' marker
+_EOF_WINDOW = 1024
+
+# Seconds between two writes of the stats file
+_STATS_INTERVAL = 5.0
+
+
+## Folder events: inotify on Linux, a listing of the folders elsewhere
+
+# inotify flags, from <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class Inotify:
+    """
+    The files closed after writing, or moved into, a set of folders, read from
+    an inotify instance through the C library.
+
+    Raises:
+        OSError: If inotify is not available (not Linux, or the limit of
+                 watches or instances is reached).
+    """
+
+    def __init__(self, folders: list):
+        library = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(library, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self._folders = {}
+        for folder in folders:
+            descriptor = libc.inotify_add_watch(self._fd, os.fsencode(folder), _IN_CLOSE_WRITE | _IN_MOVED_TO)
+            if descriptor < 0:
+                errno = ctypes.get_errno()
+                os.close(self._fd)
+                raise OSError(errno, f'inotify_add_watch failed on {folder}')
+            self._folders[descriptor] = Path(folder)
+
+    def read(self, timeout: float):
+        """
+        Wait up to `timeout` seconds for events and return the paths of the
+        files written, or None if events were lost and the folders must be listed.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                return None
+            if descriptor in self._folders and name:
+                paths.append(self._folders[descriptor] / os.fsdecode(name))
+        return paths
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def list_pdf_files(folder) -> list:
+    """Return the paths of the PDF files directly in `folder`."""
+    with os.scandir(folder) as entries:
+        return [Path(entry.path) for entry in entries
+                if entry.name.lower().endswith('.pdf') and not entry.name.startswith('.') and entry.is_file()]
+
+
+def has_eof_marker(path) -> bool:
+    """Whether the file ends with a PDF end-of-file marker, i.e. was written to the end."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - _EOF_WINDOW))
+        return b'%%EOF' in f.read()
+
+
+## Processed files
+
+class ProcessedIndex:
+    """
+    The files processed by the daemon, in an SQLite database, keyed by their
+    path, size and modification time.
+
+    A file is recorded as 'running' when its job is handed to the workers,
+    which gives the job a number unique across restarts (used to name its
+    output), and as 'ok' or 'failed' once the job is done. Files left
+    'running' by a daemon that was stopped are processed again at the next start.
+
+    Args:
+        path (str): The path to the database, created if needed.
+    """
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(str(path))
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS processed (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                output TEXT,
+                error TEXT,
+                seconds REAL,
+                finished REAL,
+                UNIQUE (path, size, mtime_ns)
+            )""")
+        self._connection.execute("DELETE FROM processed WHERE status = 'running'")
+        self._connection.commit()
+
+    def contains(self, path, size: int, mtime_ns: int) -> bool:
+        row = self._connection.execute('SELECT 1 FROM processed WHERE path = ? AND size = ? AND mtime_ns = ?',
+                                       (str(path), size, mtime_ns)).fetchone()
+        return row is not None
+
+    def start(self, files: list) -> int:
+        """
+        Record the `(path, size, mtime_ns)` of the files of a job as running and
+        return the number of the job.
+        """
+        ids = []
+        for path, size, mtime_ns in files:
+            cursor = self._connection.execute(
+                "INSERT OR REPLACE INTO processed (path, size, mtime_ns, status) VALUES (?, ?, ?, 'running')",
+                (str(path), size, mtime_ns))
+            ids.append(cursor.lastrowid)
+        self._connection.commit()
+        return ids[0]
+
+    def finish(self, files: list, report: dict) -> None:
+        """Record the outcome of the job of `files`, from its report."""
+        self._connection.executemany(
+            'UPDATE processed SET status = ?, output = ?, error = ?, seconds = ?, finished = ? '
+            'WHERE path = ? AND size = ? AND mtime_ns = ?',
+            [(report['status'], report['output'], report['error'], report['seconds'], time.time(),
+              str(path), size, mtime_ns) for path, size, mtime_ns in files])
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+## Counters
+
+class WatchStats:
+    """The counters of the daemon: files and bytes processed, and its queue."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.jobs_ok = 0
+        self.jobs_failed = 0
+        self.files_processed = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.settling = 0
+        self.waiting = 0
+        self.running = 0
+
+    def record(self, report: dict, files: list) -> None:
+        if report['status'] == 'ok':
+            self.jobs_ok += 1
+            self.output_bytes += report['output_bytes'] or 0
+        else:
+            self.jobs_failed += 1
+        self.files_processed += len(files)
+        self.input_bytes += sum(size for _, size, _ in files)
+
+    def snapshot(self) -> dict:
+        """Return the counters, with the throughput since the start, as a dict."""
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {'uptime_seconds': round(elapsed, 1),
+                'jobs_ok': self.jobs_ok,
+                'jobs_failed': self.jobs_failed,
+                'files_processed': self.files_processed,
+                'input_bytes': self.input_bytes,
+                'output_bytes': self.output_bytes,
+                'files_per_minute': round(self.files_processed * 60 / elapsed, 2),
+                'input_mb_per_second': round(self.input_bytes / elapsed / 1e6, 3),
+                'files_settling': self.settling,
+                'queue_depth': self.waiting + self.running,
+                'jobs_waiting': self.waiting,
+                'jobs_running': self.running}
+
+    def write(self, path) -> None:
+        """Write the counters to the JSON file `path`, replacing it in one step."""
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(temporary, path)
+
+
+## The daemon
+
+class Watch:
+    """
+    A watched folder, its job and the files it has in progress.
+
+    Args:
+        config (dict): The watch, as read from the watches file.
+    """
+
+    def __init__(self, config: dict):
+        self.folder = Path(config['folder']).resolve()
+        self.output_dir = Path(config['output_dir']).resolve()
+        self.job = dict(config['job'])
+        self.batch_size = int(config.get('batch_size', 0)) or None
+        self.batch_wait = float(config.get('batch_wait', 30))
+
+        if 'input' in self.job or 'inputs' in self.job:
+            raise ValueError(f'The job of {self.folder} must not set its input: it is the incoming file')
+        if self.output_dir.resolve() == self.folder.resolve():
+            raise ValueError(f'The output folder of {self.folder} must not be the watched folder')
+        if self.batch_size is not None and self.batch_size < 2:
+            raise ValueError(f'The batch size of {self.folder} must be at least 2 files')
+
+        # path -> (size, mtime_ns, time of the last change), until the file is settled
+        self.settling = {}
+        # files ready to be processed, as (path, size, mtime_ns), in order of arrival
+        self.ready = deque()
+        self.last_ready = 0.0
+
+    @property
+    def merges(self) -> bool:
+        return self.job['action'] == 'merge'
+
+    def next_job(self, now: float, stopping: bool = False):
+        """
+        Take the files of the next job out of the ready ones and return them with
+        the job, or return None if no job is ready. Merges take the first files
+        in name order, and never a single file.
+        """
+        if not self.ready:
+            return None
+
+        if not self.merges:
+            file = self.ready.popleft()
+            return [file], {**self.job, 'input': str(file[0])}
+
+        if len(self.ready) < 2:
+            return None
+        full = self.batch_size is not None and len(self.ready) >= self.batch_size
+        if not (full or stopping or now - self.last_ready >= self.batch_wait):
+            return None
+
+        ready = sorted(self.ready)
+        count = self.batch_size if full else len(ready)
+        files = ready[:count]
+        self.ready = deque(ready[count:])
+        return files, {**self.job, 'inputs': [str(path) for path, _, _ in files]}
+
+
+def load_watches(path) -> list:
+    """Read the watches of a JSON watches file."""
+    with open(path, encoding='utf-8') as f:
+        return [Watch(config) for config in json.load(f)]
+
+
+def _settle(watch: Watch, index: ProcessedIndex, settle: float, now: float) -> None:
+    """Move the files of `watch` that stopped changing from `settling` to `ready`."""
+    for path, (size, mtime_ns, changed) in list(watch.settling.items()):
+        try:
+            stat = path.stat()
+        except OSError:
+            del watch.settling[path]
+            continue
+
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            watch.settling[path] = (stat.st_size, stat.st_mtime_ns, now)
+            continue
+        if now - changed < settle or size == 0:
+            continue
+        try:
+            if now - changed < _INCOMPLETE_TIMEOUT and not has_eof_marker(path):
+                continue
+        except OSError:
+            del watch.settling[path]
+            continue
+
+        del watch.settling[path]
+        if not index.contains(path, size, mtime_ns):
+            watch.ready.append((path, size, mtime_ns))
+            watch.last_ready = now
+
+
+def _notice(watch: Watch, paths, index: ProcessedIndex, now: float) -> None:
+    """Start watching the files `paths` of `watch` settle, unless they are known already."""
+    queued = {path for path, _, _ in watch.ready}
+    for path in paths:
+        if path in watch.settling or path in queued or not path.name.lower().endswith('.pdf'):
+            continue
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        if not index.contains(path, stat.st_size, stat.st_mtime_ns):
+            # the first check of a file found by listing happens after a full settle time
+            watch.settling[path] = (stat.st_size, stat.st_mtime_ns, now)
+
+
+def _ignore_interrupts() -> None:
+    # Ctrl+C reaches the workers too: only the daemon handles it, letting the running jobs finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_watch(watches: list, index: ProcessedIndex, max_workers: int = DEFAULT_WORKERS,
+              max_queued: int = None, settle: float = DEFAULT_SETTLE, poll: bool = False,
+              poll_interval: float = DEFAULT_POLL_INTERVAL, profile: str = None,
+              on_report=None, stats: WatchStats = None, stats_path=None, should_stop=None) -> WatchStats:
+    """
+    Watch the folders and run their jobs on the incoming files until `should_stop`
+    returns True, then wait for the running jobs and return the counters.
+
+    Args:
+        watches (list[Watch]): The watched folders and their jobs.
+        index (ProcessedIndex): The index of the files already processed.
+        max_workers (int, optional): The number of worker processes.
+        max_queued (int, optional): The number of jobs handed to the workers at a
+                                    time, twice the number of workers by default.
+        settle (float, optional): The seconds a file must stay unchanged to be processed.
+        poll (bool, optional): List the folders every `poll_interval` seconds
+                               instead of using inotify.
+        poll_interval (float, optional): The seconds between two listings of the folders.
+        profile (str, optional): The output profile of the jobs that do not set one.
+        on_report (callable, optional): Called with each report and its files as
+                                        soon as its job finishes.
+        stats (WatchStats, optional): The counters to update.
+        stats_path (str, optional): A JSON file the counters are written to
+                                    every few seconds.
+        should_stop (callable, optional): Returns True when the daemon must stop.
+    """
+    stats = stats or WatchStats()
+    max_queued = max_queued or 2 * max_workers
+    should_stop = should_stop or (lambda: False)
+    folders = {watch.folder: watch for watch in watches}
+    for watch in watches:
+        watch.output_dir.mkdir(parents=True, exist_ok=True)
+
+    events = None
+    if not poll:
+        try:
+            events = Inotify(list(folders))
+        except OSError as e:
+            print(f'inotify is not available ({e}), polling the folders every {poll_interval}s', file=sys.stderr)
+
+    done = SimpleQueue()
+    running = {}
+    next_listing = 0.0
+    next_stats = 0.0
+
+    def submit(executor, watch, files, job):
+        job_id = index.start(files)
+        future = executor.submit(run_job, job_id, job, watch.output_dir, profile)
+        running[future] = (watch, files, job)
+        future.add_done_callback(done.put)
+
+    def collect(future):
+        watch, files, job = running.pop(future)
+        try:
+            report = future.result()
+        except Exception as e:
+            # the worker process itself died (e.g. killed for using too much memory)
+            report = {'index': None, 'action': job['action'], 'status': 'failed', 'output': None,
+                      'output_bytes': None, 'seconds': None, 'error': f'{type(e).__name__}: {e}'}
+        index.finish(files, report)
+        stats.record(report, files)
+        if on_report:
+            on_report(report, files)
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_ignore_interrupts) as executor:
+            while not should_stop():
+                now = time.monotonic()
+
+                # files written since the last round; a full listing at start, when
+                # polling, and when inotify lost events
+                if events is not None and next_listing:
+                    paths = events.read(min(settle, poll_interval) / 4)
+                    if paths is None:
+                        next_listing = 0.0
+                    else:
+                        for path in paths:
+                            if path.parent in folders:
+                                _notice(folders[path.parent], [path], index, now)
+                if events is None or not next_listing:
+                    if now >= next_listing:
+                        for watch in watches:
+                            _notice(watch, list_pdf_files(watch.folder), index, now)
+                        next_listing = now + poll_interval
+                    else:
+                        time.sleep(min(settle, poll_interval) / 4)
+
+                now = time.monotonic()
+                for watch in watches:
+                    _settle(watch, index, settle, now)
+
+                # finished jobs free their place for the files in line
+                while True:
+                    try:
+                        collect(done.get_nowait())
+                    except Empty:
+                        break
+                for watch in watches:
+                    while len(running) < max_queued:
+                        job = watch.next_job(now)
+                        if job is None:
+                            break
+                        submit(executor, watch, *job)
+
+                stats.settling = sum(len(watch.settling) for watch in watches)
+                stats.waiting = sum(len(watch.ready) for watch in watches)
+                stats.running = len(running)
+                if stats_path and now >= next_stats:
+                    stats.write(stats_path)
+                    next_stats = now + _STATS_INTERVAL
+
+            # the merges gathered so far are run before stopping; lone files of a
+            # merge and other files in line are picked up at the next start
+            for watch in watches:
+                if watch.merges:
+                    job = watch.next_job(time.monotonic(), stopping=True)
+                    if job is not None:
+                        submit(executor, watch, *job)
+            while running:
+                collect(done.get())
+    finally:
+        if events is not None:
+            events.close()
+
+    stats.settling = stats.running = 0
+    stats.waiting = sum(len(watch.ready) for watch in watches)
+    if stats_path:
+        stats.write(stats_path)
+    return stats
+
+
+## Command line
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m scripts.watch',
+                                     description='Run page operations on the PDF files dropped into folders.')
+    parser.add_argument('watches', help='JSON file listing the watched folders and their jobs')
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'number of worker processes (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--queue', type=int,
+                        help='number of jobs handed to the workers at a time (default: twice the workers)')
+    parser.add_argument('--index', default='watch_index.sqlite',
+                        help="database of the processed files (default: './watch_index.sqlite')")
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE,
+                        help=f'seconds a file must stay unchanged to be processed (default: {DEFAULT_SETTLE})')
+    parser.add_argument('--poll', action='store_true', help='list the folders instead of using inotify')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f'seconds between two listings of the folders (default: {DEFAULT_POLL_INTERVAL})')
+    parser.add_argument('--profile', choices=list(OUTPUT_PROFILES), default=OUTPUT_PROFILE,
+                        help=f'output profile of the jobs that do not set one (default: {OUTPUT_PROFILE})')
+    parser.add_argument('--stats', help='write the counters of the daemon to this JSON file')
+    arguments = parser.parse_args(argv)
+
+    watches = load_watches(arguments.watches)
+    index = ProcessedIndex(arguments.index)
+
+    stopping = []
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stopping.append(True))
+
+    def print_report(report, files):
+        names = ', '.join(path.name for path, _, _ in files)
+        if report['status'] == 'ok':
+            print(f"{report['action']} {names}: {report['output']} "
+                  f"({report['output_bytes']} bytes, {report['seconds']}s)", flush=True)
+        else:
+            print(f"{report['action']} {names}: FAILED {report['error']}", file=sys.stderr, flush=True)
+
+    print(f"watching {', '.join(str(watch.folder) for watch in watches)}", flush=True)
+    try:
+        stats = run_watch(watches, index, arguments.workers, arguments.queue, arguments.settle,
+                          arguments.poll, arguments.poll_interval, arguments.profile,
+                          on_report=print_report, stats_path=arguments.stats,
+                          should_stop=lambda: bool(stopping))
+    finally:
+        index.close()
+
+    print(json.dumps(stats.snapshot(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
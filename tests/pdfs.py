@@ -0,0 +1,32 @@
+import io
+
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+
+def make_text_pdf(texts: list) -> bytes:
+    """Return a PDF with one page per text, each page showing its text in Helvetica."""
+    writer = PdfWriter()
+    font = DictionaryObject({NameObject('/Type'): NameObject('/Font'),
+                             NameObject('/Subtype'): NameObject('/Type1'),
+                             NameObject('/BaseFont'): NameObject('/Helvetica')})
+    font_reference = writer._add_object(font)
+
+    for text in texts:
+        writer.add_blank_page(width=200, height=200)
+        page = writer.pages[-1]
+        content = DecodedStreamObject()
+        content.set_data(f'BT /F1 12 Tf 20 100 Td ({text}) Tj ET'.encode())
+        page[NameObject('/Contents')] = writer._add_object(content)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font_reference})})
+
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def page_texts(data) -> list:
+    """Return the text of each page of a PDF given as bytes or as a file."""
+    stream = io.BytesIO(data) if isinstance(data, bytes) else data
+    return [page.extract_text().strip() for page in PdfReader(stream).pages]
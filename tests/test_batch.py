@@ -0,0 +1,59 @@
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from scripts.batch import load_manifest, run_batch
+from tests.pdfs import make_text_pdf, page_texts
+
+
+def write_csv(tmp_path, rows: list):
+    path = tmp_path / 'manifest.csv'
+    path.write_text('\n'.join(rows) + '\n', encoding='utf-8')
+    return path
+
+
+def test_load_csv_manifest(tmp_path):
+    path = write_csv(tmp_path, [
+        'action,input,start,end,every,ranges,bookmarks,deduplicate,incremental',
+        'split,a.pdf,,,3,,,,',
+        'split,a.pdf,,,,"1-3; 4",,,',
+        'split,a.pdf,,,,,TRUE,,',
+        'merge,a.pdf; b.pdf,,,,,,false,',
+        'remove,a.pdf,2,2,,,,,1',
+    ])
+    assert load_manifest(path) == [
+        {'action': 'split', 'input': 'a.pdf', 'every': 3},
+        {'action': 'split', 'input': 'a.pdf', 'ranges': [(1, 3), (4, 4)]},
+        {'action': 'split', 'input': 'a.pdf', 'bookmarks': True},
+        {'action': 'merge', 'inputs': ['a.pdf', 'b.pdf'], 'deduplicate': False},
+        {'action': 'remove', 'input': 'a.pdf', 'start': 2, 'end': 2, 'incremental': True},
+    ]
+
+
+def test_csv_manifest_rejects_other_booleans(tmp_path):
+    path = write_csv(tmp_path, ['action,input,incremental', 'remove,a.pdf,no'])
+    with pytest.raises(ValueError, match='incremental'):
+        load_manifest(path)
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_run_batch(tmp_path, max_workers):
+    (tmp_path / 'a.pdf').write_bytes(make_text_pdf([f'A{number}' for number in range(1, 6)]))
+    (tmp_path / 'b.pdf').write_bytes(make_text_pdf(['B1', 'B2']))
+    jobs = [
+        {'action': 'extract', 'input': str(tmp_path / 'a.pdf'), 'spec': '2-3, 5'},
+        {'action': 'merge', 'inputs': [str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')],
+         'output': 'merged.pdf'},
+        {'action': 'split', 'input': str(tmp_path / 'a.pdf'), 'every': 2},
+        {'action': 'remove', 'input': str(tmp_path / 'missing.pdf'), 'start': 1, 'end': 1},
+    ]
+    reports = run_batch(jobs, tmp_path / 'out', max_workers)
+
+    assert [report['status'] for report in reports] == ['ok', 'ok', 'ok', 'failed']
+    assert [report['index'] for report in reports] == [0, 1, 2, 3]
+    assert page_texts(Path(reports[0]['output']).read_bytes()) == ['A2', 'A3', 'A5']
+    assert page_texts((tmp_path / 'out' / 'merged.pdf').read_bytes()) == ['A1', 'A2', 'A3', 'A4', 'A5', 'B1', 'B2']
+    with zipfile.ZipFile(reports[2]['output']) as archive:
+        assert [page_texts(archive.read(name)) for name in archive.namelist()] == [['A1', 'A2'], ['A3', 'A4'], ['A5']]
+    assert reports[3]['error'].startswith('FileNotFoundError')
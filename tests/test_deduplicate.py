@@ -0,0 +1,63 @@
+import io
+
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, NameObject, NullObject, NumberObject
+
+from scripts.deduplicate import deduplicate_objects
+from scripts.output_writer import add_pages
+from scripts.page_plan import PagePlan
+from tests.pdfs import make_text_pdf, page_texts
+
+
+def named(data: bytes, name: str) -> io.BytesIO:
+    file = io.BytesIO(data)
+    file.name = name
+    return file
+
+
+def object_count(writer: PdfWriter) -> int:
+    return sum(not isinstance(obj, NullObject) for obj in writer._objects)
+
+
+def copy_pages(files: list) -> PdfWriter:
+    writer = PdfWriter()
+    for data in files:
+        reader = PdfReader(io.BytesIO(data))
+        add_pages(writer, reader, range(len(reader.pages)))
+    return writer
+
+
+def test_shared_resources_are_written_once():
+    writer = copy_pages([make_text_pdf(['A1', 'A2']), make_text_pdf(['B1'])])
+    before = object_count(writer)
+
+    # the two Helvetica fonts are identical
+    assert deduplicate_objects(writer) == 1
+    assert object_count(writer) == before - 1
+    fonts = {page['/Resources']['/Font'].raw_get('/F1').idnum for page in writer.pages}
+    assert len(fonts) == 1
+
+
+def test_merged_pages_are_unchanged():
+    files = [named(make_text_pdf(['A1', 'A2']), 'a.pdf'), named(make_text_pdf(['B1']), 'b.pdf')]
+    plain = PagePlan.from_files(files).write()
+    deduplicated = PagePlan.from_files(files).write(deduplicate=True)
+
+    assert page_texts(deduplicated) == page_texts(plain) == ['A1', 'A2', 'B1']
+    assert deduplicated.seek(0, 2) < plain.seek(0, 2)
+
+
+def test_identical_annotations_stay_on_their_pages():
+    writer = copy_pages([make_text_pdf(['A1']), make_text_pdf(['B1'])])
+    for page in writer.pages:
+        # identical links without a /Type on both pages
+        link = DictionaryObject({NameObject('/Subtype'): NameObject('/Link'),
+                                 NameObject('/Rect'): ArrayObject([NumberObject(0)] * 4)})
+        page[NameObject('/Annots')] = writer._add_object(ArrayObject([writer._add_object(link)]))
+
+    deduplicate_objects(writer)
+
+    annotations = [page.raw_get('/Annots') for page in writer.pages]
+    links = [array.get_object()[0].idnum for array in annotations]
+    assert annotations[0].idnum != annotations[1].idnum
+    assert links[0] != links[1]
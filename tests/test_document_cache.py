@@ -0,0 +1,84 @@
+import io
+import threading
+
+from PyPDF2 import PdfWriter
+
+from scripts.document_cache import DocumentCache, UploadView, upload_view
+from scripts.preflight import check_pdf
+
+
+def make_upload(page_count: int, file_id: str, truncated: bool = False) -> io.BytesIO:
+    """
+    A file shaped like a Streamlit upload: a BytesIO with a name, a size and a
+    file_id. A truncated file loses its cross-reference table and trailer.
+    """
+    writer = PdfWriter()
+    for _ in range(page_count):
+        writer.add_blank_page(width=72, height=72)
+    output = io.BytesIO()
+    writer.write(output)
+    data = output.getvalue()
+    if truncated:
+        data = data[:data.rindex(b'xref')]
+
+    upload = io.BytesIO(data)
+    upload.name = 'upload.pdf'
+    upload.size = len(data)
+    upload.file_id = file_id
+    return upload
+
+
+def test_concurrent_gets_parse_a_document_once():
+    cache = DocumentCache()
+    upload = make_upload(200, 'test-concurrent-gets')
+    documents = []
+    barrier = threading.Barrier(4)
+
+    def get():
+        # each thread reads its own view of the upload, as the jobs of the app do
+        view = upload_view(upload)
+        barrier.wait()
+        documents.append(cache.get(view))
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.misses == 1
+    assert all(document is documents[0] for document in documents)
+    assert len(documents[0].reader.pages) == 200
+
+
+def test_upload_view_has_its_own_position():
+    upload = make_upload(2, 'test-upload-view')
+    upload.seek(10)
+    view = upload_view(upload)
+    assert isinstance(view, UploadView)
+    assert (view.name, view.size, view.file_id) == (upload.name, upload.size, upload.file_id)
+    view.read()
+    assert upload.tell() == 10
+    assert upload_view('file.pdf') == 'file.pdf'
+
+
+def test_truncated_files_stay_repaired_after_eviction():
+    cache = DocumentCache()
+    upload = make_upload(4, 'test-truncated', truncated=True)
+
+    document = cache.get(upload_view(upload))
+    assert document.repair is not None
+    assert len(document.reader.pages) == 4
+
+    cache.clear()
+    assert len(cache.get(upload_view(upload)).reader.pages) == 4
+
+    # too large to be kept: parsed, and repaired, on every use
+    cache.max_bytes = 1
+    cache.clear()
+    assert cache.get(upload_view(upload)).repair is not None
+
+
+def test_check_reports_truncated_files_as_repaired():
+    check = check_pdf(upload_view(make_upload(3, 'test-check-truncated', truncated=True)))
+    assert (check.status, check.page_count) == ('repaired', 3)
@@ -0,0 +1,53 @@
+import io
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from scripts.incremental_update import write_incremental
+from scripts.output_profiles import write_with_profile
+from scripts.page_plan import PagePlan
+from tests.pdfs import make_text_pdf, page_texts
+
+
+def named(data: bytes, name: str) -> io.BytesIO:
+    file = io.BytesIO(data)
+    file.name = name
+    return file
+
+
+def test_remove_appends_to_the_original_bytes():
+    source = make_text_pdf(['Page 1', 'Page 2', 'Page 3', 'Page 4'])
+    output = write_incremental(PagePlan.from_file(named(source, 'a.pdf')).remove(2, 3))
+    data = output.read()
+
+    assert data.startswith(source)
+    assert len(data) > len(source)
+    assert page_texts(data) == ['Page 1', 'Page 4']
+
+
+def test_rearrange_appends_to_the_original_bytes():
+    source = make_text_pdf(['Page 1', 'Page 2', 'Page 3', 'Page 4'])
+    plan = PagePlan.from_file(named(source, 'a.pdf')).rearrange(3, 4, 'before', 1)
+    data = plan.write(incremental=True).read()
+
+    assert data.startswith(source)
+    assert page_texts(data) == ['Page 3', 'Page 4', 'Page 1', 'Page 2']
+
+
+def test_plans_that_cannot_be_written_incrementally():
+    first = named(make_text_pdf(['A1', 'A2']), 'a.pdf')
+    second = named(make_text_pdf(['B1']), 'b.pdf')
+    assert write_incremental(PagePlan.from_files([first, second])) is None
+
+    # a file with a cross-reference stream
+    writer = PdfWriter()
+    writer.append_pages_from_reader(PdfReader(io.BytesIO(make_text_pdf(['C1', 'C2']))))
+    compact = io.BytesIO()
+    write_with_profile(writer, compact, 'compact')
+    assert write_incremental(PagePlan.from_file(named(compact.getvalue(), 'c.pdf')).remove(1, 1)) is None
+
+
+def test_merge_falls_back_to_a_full_write():
+    first = named(make_text_pdf(['A1', 'A2']), 'a.pdf')
+    second = named(make_text_pdf(['B1']), 'b.pdf')
+    output = PagePlan.from_files([first, second]).write(incremental=True)
+    assert page_texts(output) == ['A1', 'A2', 'B1']
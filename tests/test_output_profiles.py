@@ -0,0 +1,100 @@
+import io
+import re
+
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import DictionaryObject, NameObject, NullObject
+
+from scripts.output_profiles import write_linearized, write_packed, write_with_profile
+from tests.pdfs import make_text_pdf, page_texts
+
+
+def make_writer(texts: list) -> PdfWriter:
+    writer = PdfWriter()
+    writer.append_pages_from_reader(PdfReader(io.BytesIO(make_text_pdf(texts))))
+    return writer
+
+
+@pytest.mark.parametrize('object_streams', [False, True])
+def test_packed_output_round_trips(object_streams):
+    writer = make_writer(['Page 1', 'Page 2', 'Page 3'])
+    output = io.BytesIO()
+    write_packed(writer, output, object_streams)
+
+    assert page_texts(output.getvalue()) == ['Page 1', 'Page 2', 'Page 3']
+
+
+def test_packed_output_uses_object_and_cross_reference_streams():
+    writer = make_writer(['Page 1', 'Page 2'])
+    output = io.BytesIO()
+    write_packed(writer, output)
+    data = output.getvalue()
+
+    assert data.startswith(b'%PDF-1.5')
+    assert b'/Type /ObjStm' in data
+    assert b'/Type /XRef' in data
+    assert b'\ntrailer' not in data
+    # only the content streams and the object and cross-reference streams stay at the top level
+    assert len(re.findall(rb'\d+ 0 obj', data)) == 2 + 1 + 1
+
+
+def test_packed_output_drops_unreferenced_objects():
+    writer = make_writer(['Page 1'])
+    orphan = writer._add_object(DictionaryObject({NameObject('/Orphan'): NameObject('/Yes')}))
+    output = io.BytesIO()
+    write_packed(writer, output, object_streams=False)
+
+    assert b'/Orphan' not in output.getvalue()
+    assert isinstance(PdfReader(output).get_object(orphan.idnum), NullObject)
+
+
+@pytest.mark.parametrize('profile', ['default', 'compressed', 'compact', 'linearized'])
+def test_profiles_keep_the_pages(profile):
+    output = io.BytesIO()
+    write_with_profile(make_writer(['Page 1', 'Page 2']), output, profile)
+    assert page_texts(output.getvalue()) == ['Page 1', 'Page 2']
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError, match='Unknown output profile'):
+        write_with_profile(make_writer(['Page 1']), io.BytesIO(), 'tiny')
+
+
+def linearized(texts: list) -> bytes:
+    output = io.BytesIO()
+    write_linearized(make_writer(texts), output)
+    return output.getvalue()
+
+
+def test_linearization_dictionary_matches_the_file():
+    data = linearized(['Page 1', 'Page 2', 'Page 3'])
+    match = re.search(rb'<< /Linearized 1 /L +(\d+) /H \[ +(\d+) +(\d+) \] /O (\d+) /E +(\d+) /N (\d+) /T +(\d+) >>',
+                      data[:1024])
+    length, hint_offset, hint_length, first_page, first_page_end, page_count, main_xref = map(int, match.groups())
+
+    assert length == len(data)
+    assert page_count == 3
+    # /T is the offset of the white space before the first entry of the main cross-reference table
+    assert re.fullmatch(rb'xref\n0 \d+', data[data.rindex(b'xref\n0 '):main_xref])
+    assert data[main_xref:main_xref + 21] == b'\n0000000000 65535 f \n'
+    assert re.match(rb'\d+ 0 obj\n<< /S \d+ /Filter /FlateDecode /Length \d+ >>\nstream\n', data[hint_offset:])
+    assert data[hint_offset + hint_length - len(b'endobj\n'):hint_offset + hint_length] == b'endobj\n'
+    assert data[:first_page_end].endswith(b'endobj\n')
+
+    reader = PdfReader(io.BytesIO(data))
+    assert reader.trailer['/Root']['/Pages']['/Kids'][0].idnum == first_page
+
+
+def test_linearized_cross_reference_offsets():
+    data = linearized(['Page 1', 'Page 2', 'Page 3'])
+    for table in re.finditer(rb'xref\n(\d+) (\d+)\n((?:\d{10} \d{5} [fn] \n)+)', data):
+        first = int(table.group(1))
+        for number, entry in enumerate(table.group(3).splitlines(), first):
+            offset, _, kind = entry.split()
+            if kind == b'n':
+                assert data[int(offset):].startswith(b'%d 0 obj' % number)
+
+
+def test_linearized_output_round_trips():
+    assert page_texts(linearized(['Page 1', 'Page 2', 'Page 3'])) == ['Page 1', 'Page 2', 'Page 3']
+    assert page_texts(linearized(['Page 1'])) == ['Page 1']
@@ -0,0 +1,127 @@
+import pytest
+
+from scripts.page_plan import PagePlan
+
+
+def make_plan(page_count: int) -> PagePlan:
+    """A plan over a fake source, whose page references are easy to read back."""
+    return PagePlan({'a': None}, [('a', index) for index in range(page_count)])
+
+
+def numbers(pages: list) -> list:
+    """The 1-indexed page numbers of the source, in the order of `pages`."""
+    return [index + 1 for _, index in pages]
+
+
+def resolve_unfused(plan: PagePlan) -> list:
+    """Resolve the operations one at a time, with no optimization across them."""
+    pages = plan.pages
+    for operation in plan.operations:
+        pages = PagePlan(plan.sources, pages, [operation]).resolve()
+    return pages
+
+
+## optimize
+
+def test_optimize_fuses_consecutive_extracts():
+    plan = make_plan(20).extract(3, 12).extract(2, 4)
+    assert plan.optimize() == [('extract', 4, 6)]
+
+
+def test_optimize_clamps_fused_extract_to_the_outer_range():
+    plan = make_plan(20).extract(3, 5).extract(1, 10)
+    assert plan.optimize() == [('extract', 3, 5)]
+    assert numbers(plan.resolve()) == [3, 4, 5]
+
+
+def test_optimize_drops_rearranges_that_do_not_move_pages():
+    plan = make_plan(10).rearrange(3, 5, 'before', 4).rearrange(3, 5, 'after', 2).rearrange(3, 5, 'before', 6)
+    assert plan.optimize() == []
+
+
+def test_optimize_drops_empty_insertions_and_merges():
+    plan = make_plan(5)
+    empty = PagePlan({}, [])
+    assert plan.merge(empty).insert(empty, 'before', 1).optimize() == []
+
+
+@pytest.mark.parametrize('ranges', [
+    [(3, 5), (1, 10)],
+    [(3, 5), (2, 2)],
+    [(3, 5), (4, 8)],
+    [(3, 5), (6, 8)],
+    [(1, 20), (5, 15), (2, 3)],
+    [(8, 12), (1, 5), (5, 5)],
+])
+def test_fused_extracts_match_unfused(ranges):
+    plan = make_plan(20)
+    for start, end in ranges:
+        plan = plan.extract(start, end)
+    assert plan.resolve() == resolve_unfused(plan)
+
+
+## resolve
+
+def test_resolve_extract_and_remove():
+    assert numbers(make_plan(10).extract(2, 4).resolve()) == [2, 3, 4]
+    assert numbers(make_plan(10).remove(2, 9).resolve()) == [1, 10]
+
+
+def test_resolve_select_and_drop():
+    assert numbers(make_plan(10).select('1-3, 9-').resolve()) == [1, 2, 3, 9, 10]
+    assert numbers(make_plan(10).drop('2-9').resolve()) == [1, 10]
+    assert numbers(make_plan(5).select('reverse').resolve()) == [5, 4, 3, 2, 1]
+
+
+@pytest.mark.parametrize('start, end, relative_pos, new_pos, expected', [
+    (8, 10, 'before', 2, [1, 8, 9, 10, 2, 3, 4, 5, 6, 7]),
+    (1, 2, 'after', 10, [3, 4, 5, 6, 7, 8, 9, 10, 1, 2]),
+    (4, 5, 'after', 7, [1, 2, 3, 6, 7, 4, 5, 8, 9, 10]),
+])
+def test_resolve_rearrange(start, end, relative_pos, new_pos, expected):
+    plan = make_plan(10).rearrange(start, end, relative_pos, new_pos)
+    assert numbers(plan.resolve()) == expected
+
+
+def test_resolve_reorder_rejects_pages_out_of_range():
+    assert numbers(make_plan(3).reorder([3, 1, 2]).resolve()) == [3, 1, 2]
+    with pytest.raises(ValueError):
+        make_plan(3).reorder([1, 4]).resolve()
+
+
+def test_resolve_insert_many_refers_to_the_original_pages():
+    main = make_plan(5)
+    first = PagePlan({'b': None}, [('b', 0)])
+    second = PagePlan({'c': None}, [('c', 0)])
+    pages = main.insert_many([(first, 'after', 3), (second, 'before', 5)]).resolve()
+    assert pages == [('a', 0), ('a', 1), ('a', 2), ('b', 0), ('a', 3), ('c', 0), ('a', 4)]
+
+
+def test_resolve_merge_appends_the_pages():
+    pages = make_plan(2).merge(PagePlan({'b': None}, [('b', 0)])).resolve()
+    assert pages == [('a', 0), ('a', 1), ('b', 0)]
+
+
+def test_operations_run_on_the_output_of_the_previous_one():
+    plan = make_plan(10).remove(1, 2).extract(1, 3).rearrange(1, 1, 'after', 3)
+    assert numbers(plan.resolve()) == [4, 5, 3]
+    assert plan.resolve() == resolve_unfused(plan)
+
+
+## removals
+
+def test_drop_rejects_reverse():
+    with pytest.raises(ValueError):
+        make_plan(10).drop('reverse')
+    with pytest.raises(ValueError):
+        make_plan(10).drop('1-3, reverse')
+
+
+@pytest.mark.parametrize('remove', [
+    lambda plan: plan.drop('1-10'),
+    lambda plan: plan.drop('odd, even'),
+    lambda plan: plan.remove(1, 10),
+])
+def test_removing_every_page_is_an_error(remove):
+    with pytest.raises(ValueError):
+        remove(make_plan(10)).resolve()
@@ -0,0 +1,56 @@
+import pytest
+
+from scripts.page_spec import PageRanges, parse_page_spec, parse_ranges
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1-3, 7, 10-20, -5', [1, 2, 3, 7, *range(10, 21), *range(26, 31)]),
+    ('28-', [28, 29, 30]),
+    ('-2', [29, 30]),
+    ('odd', list(range(1, 31, 2))),
+    ('even, 1-3', [1, 2, 3] + list(range(4, 31, 2))),
+    ('odd, even', list(range(1, 31))),
+])
+def test_ranges(text, expected):
+    selected = parse_page_spec(text).ranges(30)
+    assert list(selected) == expected
+    assert len(selected) == len(expected)
+    assert [page for page in range(1, 31) if page in selected] == expected
+
+
+def test_odd_and_even_are_strides_not_one_interval_per_page():
+    selected = parse_page_spec('odd, 4-6').ranges(100_000)
+    assert selected.strides == [(1, 2, 100_000)]
+    assert list(zip(selected.starts, selected.ends)) == [(4, 6)]
+    assert 99_999 in selected and 100_000 not in selected and 4 in selected
+    assert len(selected) == 50_002
+    assert str(selected) == '4-6,odd'
+
+
+def test_intervals_are_merged():
+    ranges = PageRanges([(5, 7), (1, 3), (4, 4), (10, 12), (11, 11)])
+    assert str(ranges) == '1-7,10-12'
+
+
+def test_reverse_alone_selects_every_page():
+    spec = parse_page_spec('reverse')
+    assert spec.reverse and list(spec.ranges(4)) == [1, 2, 3, 4]
+
+
+@pytest.mark.parametrize('text', ['', '0', '5-3', 'abc', '1-2-3'])
+def test_invalid_specs(text):
+    with pytest.raises(ValueError):
+        parse_page_spec(text)
+
+
+def test_pages_out_of_range():
+    with pytest.raises(ValueError):
+        parse_page_spec('1-40').ranges(30)
+
+
+def test_parse_ranges():
+    assert parse_ranges('1-3, 4; 7-10') == [(1, 3), (4, 4), (7, 10)]
+    assert parse_ranges(' 1 - 3 ,, 5 ') == [(1, 3), (5, 5)]
+    for text in ('1-', '4 7-10', '1 - - 3'):
+        with pytest.raises(ValueError):
+            parse_ranges(text)
@@ -0,0 +1,44 @@
+import io
+import re
+import threading
+
+from PyPDF2 import PdfWriter
+
+from scripts.pdf_probe import probe_pdf
+
+
+def make_pdf(page_count: int) -> bytes:
+    writer = PdfWriter()
+    for _ in range(page_count):
+        writer.add_blank_page(width=72, height=72)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def named(data: bytes, name: str) -> io.BytesIO:
+    file = io.BytesIO(data)
+    file.name = name
+    return file
+
+
+def test_probe_reads_the_page_count():
+    info = probe_pdf(named(make_pdf(3), 'three.pdf'))
+    assert (info.page_count, info.encrypted) == (3, False)
+
+
+def test_probe_gives_up_on_a_subsection_count_past_the_end_of_the_file():
+    damaged = re.sub(rb'xref\n0 \d+', b'xref\n0 99999', make_pdf(3))
+    outcome = []
+
+    def probe():
+        try:
+            outcome.append(probe_pdf(named(damaged, 'damaged.pdf')))
+        except Exception as e:
+            # the full parse the probe falls back to may fail too, as long as it ends
+            outcome.append(e)
+
+    thread = threading.Thread(target=probe, daemon=True)
+    thread.start()
+    thread.join(10)
+    assert outcome, 'probe_pdf did not return'
@@ -0,0 +1,46 @@
+import io
+
+import pytest
+
+from scripts import result_cache
+from scripts.result_cache import ResultCache, cached_work
+
+
+class FullDiskBuffer(io.BytesIO):
+    """An output buffer whose copy to the cache fails, as on a full disk."""
+
+    def read(self, *args):
+        raise OSError(28, 'No space left on device')
+
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=1024 * 1024)
+    key = cache.key('extract', [b'%PDF input'], start=1, end=2)
+    cache.put(key, io.BytesIO(b'%PDF output'), 'input_extracted.pdf', stem='input')
+
+    output_buffer, filename = cache.get(key, stem='other')
+    assert output_buffer.read() == b'%PDF output'
+    assert filename == 'other_extracted.pdf'
+
+
+def test_key_depends_on_the_cache_version(monkeypatch):
+    cache = ResultCache(max_bytes=0)
+    key = cache.key('extract', [b'%PDF input'], start=1, end=2)
+    monkeypatch.setattr(result_cache, 'RESULT_CACHE_VERSION', result_cache.RESULT_CACHE_VERSION + 1)
+    assert cache.key('extract', [b'%PDF input'], start=1, end=2) != key
+
+
+def test_failed_put_leaves_no_temporary_file(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=1024 * 1024)
+    with pytest.raises(OSError):
+        cache.put('key', FullDiskBuffer(b'%PDF output'), 'output.pdf')
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_put_does_not_fail_the_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, '_cache', ResultCache(tmp_path, max_bytes=1024 * 1024))
+    output = FullDiskBuffer(b'%PDF output')
+    work = cached_work(lambda progress: (output, 'output.pdf'), 'extract', [b'%PDF input'], start=1, end=2)
+
+    assert work(None) == (output, 'output.pdf')
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,77 @@
+import io
+from zipfile import ZipFile
+
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+
+from scripts.split_pages import every_n_pages, split_pages, write_parts
+from tests.pdfs import make_text_pdf, page_texts
+
+
+def named(data: bytes, name: str) -> io.BytesIO:
+    file = io.BytesIO(data)
+    file.name = name
+    return file
+
+
+def make_source(page_count: int, bookmarks: dict = None) -> io.BytesIO:
+    data = make_text_pdf([f'Page {number}' for number in range(1, page_count + 1)])
+    if bookmarks:
+        writer = PdfWriter()
+        writer.append_pages_from_reader(PdfReader(io.BytesIO(data)))
+        for title, page in bookmarks.items():
+            writer.add_outline_item(title, page - 1)
+        output = io.BytesIO()
+        writer.write(output)
+        data = output.getvalue()
+    return named(data, 'scan.pdf')
+
+
+def archive_texts(archive_buffer) -> dict:
+    with ZipFile(archive_buffer) as archive:
+        return {name: page_texts(archive.read(name)) for name in archive.namelist()}
+
+
+def test_every_n_pages():
+    assert every_n_pages(10, 4) == [(1, 4), (5, 8), (9, 10)]
+    assert every_n_pages(3, 5) == [(1, 3)]
+    with pytest.raises(ValueError):
+        every_n_pages(3, 0)
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_split_every(max_workers):
+    archive_buffer, output_filename = split_pages(make_source(5), every=2, max_workers=max_workers)
+
+    assert output_filename == 'scan_split.zip'
+    assert archive_texts(archive_buffer) == {
+        'scan_001_pages_1-2.pdf': ['Page 1', 'Page 2'],
+        'scan_002_pages_3-4.pdf': ['Page 3', 'Page 4'],
+        'scan_003_pages_5-5.pdf': ['Page 5'],
+    }
+
+
+def test_split_ranges_may_overlap():
+    parts, _ = split_pages(make_source(6), ranges=[(2, 4), (4, 4), (1, 6)], as_plan=True)
+    assert [(len(plan), filename) for plan, filename in parts] == [
+        (3, 'scan_001_pages_2-4.pdf'), (1, 'scan_002_pages_4-4.pdf'), (6, 'scan_003_pages_1-6.pdf')]
+
+    texts = archive_texts(write_parts(parts))
+    assert list(texts.values()) == [['Page 2', 'Page 3', 'Page 4'], ['Page 4'],
+                                    [f'Page {number}' for number in range(1, 7)]]
+
+
+def test_split_bookmarks():
+    archive_buffer, _ = split_pages(make_source(5, {'Intro': 2, 'Annex: A/B': 4}), bookmarks=True)
+    assert archive_texts(archive_buffer) == {
+        'scan_001_front.pdf': ['Page 1'],
+        'scan_002_Intro.pdf': ['Page 2', 'Page 3'],
+        'scan_003_Annex AB.pdf': ['Page 4', 'Page 5'],
+    }
+
+
+@pytest.mark.parametrize('options', [{}, {'every': 2, 'bookmarks': True}, {'ranges': [(3, 7)]},
+                                     {'ranges': [(3, 2)]}, {'bookmarks': True}])
+def test_invalid_splits(options):
+    with pytest.raises(ValueError):
+        split_pages(make_source(5), **options, as_plan=True)
@@ -0,0 +1,61 @@
+from pathlib import Path
+
+import pytest
+
+from scripts.watch import Watch
+
+
+def merge_watch(tmp_path, **options) -> Watch:
+    return Watch({'folder': str(tmp_path / 'in'), 'output_dir': str(tmp_path / 'out'),
+                  'job': {'action': 'merge'}, **options})
+
+
+def ready(watch: Watch, *names: str) -> None:
+    for name in names:
+        watch.ready.append((watch.folder / name, 100, 1))
+
+
+def input_names(job) -> list:
+    return [Path(path).name for path in job[1]['inputs']]
+
+
+def test_merge_batches_are_taken_in_name_order(tmp_path):
+    watch = merge_watch(tmp_path, batch_size=2, batch_wait=30)
+    ready(watch, 'z.pdf', 'y.pdf', 'x.pdf')
+
+    assert input_names(watch.next_job(now=0)) == ['x.pdf', 'y.pdf']
+    # the last file waits for another one, even once the wait is over or when stopping
+    assert watch.next_job(now=100) is None
+    assert watch.next_job(now=100, stopping=True) is None
+    assert [path.name for path, _, _ in watch.ready] == ['z.pdf']
+
+
+def test_merge_waits_for_the_batch_or_the_wait(tmp_path):
+    watch = merge_watch(tmp_path, batch_size=5, batch_wait=30)
+    ready(watch, 'b.pdf', 'a.pdf', 'c.pdf')
+    watch.last_ready = 10
+
+    assert watch.next_job(now=20) is None
+    assert input_names(watch.next_job(now=40)) == ['a.pdf', 'b.pdf', 'c.pdf']
+    assert not watch.ready
+
+
+def test_other_actions_take_one_file_at_a_time(tmp_path):
+    watch = Watch({'folder': str(tmp_path / 'in'), 'output_dir': str(tmp_path / 'out'),
+                   'job': {'action': 'remove', 'start': 1, 'end': 1}})
+    ready(watch, 'b.pdf', 'a.pdf')
+    files, job = watch.next_job(now=0)
+    assert Path(job['input']).name == 'b.pdf' and job['start'] == 1
+
+
+@pytest.mark.parametrize('options', [
+    {'job': {'action': 'merge'}, 'batch_size': 1},
+    {'job': {'action': 'remove', 'input': 'x.pdf'}},
+    {'job': {'action': 'remove'}, 'output_dir': 'in'},
+])
+def test_invalid_watches(tmp_path, options):
+    config = {'folder': 'in', 'output_dir': 'out', **options}
+    config['folder'] = str(tmp_path / config['folder'])
+    config['output_dir'] = str(tmp_path / config['output_dir'])
+    with pytest.raises(ValueError):
+        Watch(config)